@@ -0,0 +1,304 @@
+"""
+Approximate nearest-neighbour search (IVF) over the vector snapshot
+
+Exact search reads every vector for every query, so latency grows linearly
+with the corpus. An inverted-file (IVF) index clusters the vectors with
+k-means into nlist lists; a query is compared with the nlist centroids and
+only the vectors of the nprobe closest lists are scanned. nprobe trades
+recall for speed at query time (nprobe = nlist is exact search).
+
+The index is built from the memory-mapped snapshot (see snapshot.py) and
+stored next to it. Vectors are rewritten grouped by list, so each probe
+scans one contiguous, memory-mapped block that workers share like the
+snapshot itself. Chunk texts and metadata are read from the snapshot.
+
+Layout of one index directory:
+
+    header.json         format, snapshot version, count, dim, nlist, seed
+    centroids.f32       nlist x dim float32 matrix
+    list_offsets.i64    start of every list in the arrays below (nlist + 1)
+    list_rows.i64       snapshot row of every vector, grouped by list
+    list_vectors.f32    count x dim float32 matrix, grouped by list
+    list_norms.f32      squared L2 norm of every row of list_vectors.f32
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrievers import VectorSearchRetriever
+from snapshot import VectorSnapshot
+
+logger = logging.getLogger(__name__)
+
+IVF_FORMAT = 1
+ASSIGN_BATCH_SIZE = 16384  # Rows assigned to lists per matrix product
+TRAIN_POINTS_PER_LIST = 40  # k-means training sample per centroid
+
+
+def default_nlist(count: int) -> int:
+    """Rule-of-thumb number of lists: about 4 * sqrt(count)"""
+    return max(1, min(count, int(4 * math.sqrt(count))))
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, centroid_norms: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for every row"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+        distances = centroid_norms[None, :] - 2.0 * (block @ centroids.T)
+        assignments[start:start + len(block)] = distances.argmin(axis=1)
+    return assignments
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Lloyd's k-means on a random sample of the vectors.
+
+    Empty clusters are re-seeded with a random sample point.
+
+    Returns:
+        nlist x dim float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    sample_size = min(count, nlist * TRAIN_POINTS_PER_LIST)
+    sample_rows = np.sort(rng.choice(count, size=sample_size, replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(sample, centroids, np.einsum("ij,ij->i", centroids, centroids))
+
+        # Per-cluster sums: sort rows by cluster, then one reduceat
+        order = np.argsort(assignments, kind="stable")
+        sizes = np.bincount(assignments, minlength=nlist)
+        filled = sizes > 0
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[filled]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[filled] = sums / sizes[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+
+    return centroids
+
+
+def build_ivf_index(
+    vectors: np.ndarray,
+    path: str,
+    nlist: int = 0,
+    iterations: int = 10,
+    seed: int = 0,
+    version: str = ""
+) -> str:
+    """
+    Build an IVF index for a vector matrix and write it to path.
+
+    Args:
+        vectors: count x dim matrix (may be a memmap)
+        path: Index directory (replaced atomically)
+        nlist: Number of lists (0 = default_nlist(count))
+        iterations: k-means iterations
+        seed: Random seed for sampling and initialization
+        version: Snapshot version the vectors come from
+
+    Returns:
+        path
+    """
+    count, dim = vectors.shape
+    nlist = min(nlist or default_nlist(count), max(count, 1))
+
+    tmp_dir = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    if count:
+        centroids = train_kmeans(vectors, nlist, iterations=iterations, seed=seed)
+        assignments = _nearest(vectors, centroids, np.einsum("ij,ij->i", centroids, centroids))
+    else:
+        centroids = np.zeros((0, dim), dtype=np.float32)
+        assignments = np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=offsets[1:])
+
+    centroids.astype(np.float32).tofile(os.path.join(tmp_dir, "centroids.f32"))
+    offsets.tofile(os.path.join(tmp_dir, "list_offsets.i64"))
+    order.astype(np.int64).tofile(os.path.join(tmp_dir, "list_rows.i64"))
+
+    # Grouped copy of the vectors, written in blocks to keep memory flat
+    with open(os.path.join(tmp_dir, "list_vectors.f32"), "wb") as vectors_file, \
+            open(os.path.join(tmp_dir, "list_norms.f32"), "wb") as norms_file:
+        for start in range(0, count, ASSIGN_BATCH_SIZE):
+            block = np.asarray(vectors[order[start:start + ASSIGN_BATCH_SIZE]], dtype=np.float32)
+            vectors_file.write(block.tobytes())
+            norms_file.write(np.einsum("ij,ij->i", block, block).astype(np.float32).tobytes())
+
+    with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": IVF_FORMAT,
+            "version": version,
+            "count": count,
+            "dim": dim,
+            "nlist": len(centroids),
+            "requested_nlist": nlist,
+            "iterations": iterations,
+            "seed": seed,
+        }, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_dir, path)
+    return path
+
+
+def ensure_ivf_index(
+    snapshot: VectorSnapshot,
+    path: str,
+    nlist: int = 0,
+    iterations: int = 10
+) -> str:
+    """Return the index directory, rebuilding it if the snapshot or nlist changed"""
+    try:
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except FileNotFoundError:
+        header = {}
+
+    wanted_nlist = min(nlist or default_nlist(snapshot.count), max(snapshot.count, 1))
+    if (
+        header.get("format") == IVF_FORMAT
+        and header.get("version") == snapshot.version
+        and header.get("requested_nlist") == wanted_nlist
+        and header.get("iterations") == iterations
+    ):
+        return path
+
+    logger.info(f"Building IVF index ({snapshot.count} vectors, {wanted_nlist} lists)...")
+    build_ivf_index(
+        snapshot.vectors, path, nlist=wanted_nlist, iterations=iterations, version=snapshot.version
+    )
+    logger.info("✅ IVF index built")
+    return path
+
+
+class IVFIndex:
+    """An IVF index opened with mmap; safe to share between threads"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        if header.get("format") != IVF_FORMAT:
+            raise ValueError(f"Unsupported IVF index format in {path}")
+
+        self.path = path
+        self.version: str = header["version"]
+        self.count: int = header["count"]
+        self.dim: int = header["dim"]
+        self.nlist: int = header["nlist"]
+
+        self.centroids = np.fromfile(os.path.join(path, "centroids.f32"), dtype=np.float32)
+        self.centroids = self.centroids.reshape(self.nlist, self.dim)
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.offsets = np.fromfile(os.path.join(path, "list_offsets.i64"), dtype=np.int64)
+
+        if self.count == 0:
+            self.rows = np.zeros(0, dtype=np.int64)
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.norms = np.zeros(0, dtype=np.float32)
+        else:
+            self.rows = np.memmap(os.path.join(path, "list_rows.i64"), dtype=np.int64, mode="r")
+            self.vectors = np.memmap(
+                os.path.join(path, "list_vectors.f32"), dtype=np.float32, mode="r",
+                shape=(self.count, self.dim)
+            )
+            self.norms = np.memmap(
+                os.path.join(path, "list_norms.f32"), dtype=np.float32, mode="r",
+                shape=(self.count,)
+            )
+
+    def search_many(self, embeddings: List[List[float]], k: int, nprobe: int) -> List[List[int]]:
+        """
+        Approximate nearest neighbours by squared L2 distance.
+
+        Args:
+            embeddings: Query embeddings
+            k: Results per query
+            nprobe: Lists scanned per query
+
+        Returns:
+            Snapshot row numbers per query, nearest first
+        """
+        if self.count == 0:
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), self.dim)
+        nprobe = max(1, min(nprobe, self.nlist))
+
+        coarse = self.centroid_norms[None, :] - 2.0 * (queries @ self.centroids.T)
+        probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        return [self._scan(query, lists, k) for query, lists in zip(queries, probes)]
+
+    def _scan(self, query: np.ndarray, lists: np.ndarray, k: int) -> List[int]:
+        distances: List[np.ndarray] = []
+        positions: List[np.ndarray] = []
+        for list_id in lists:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            distances.append(self.norms[start:end] - 2.0 * (self.vectors[start:end] @ query))
+            positions.append(np.arange(start, end))
+
+        if not distances:
+            return []
+
+        distance = np.concatenate(distances)
+        position = np.concatenate(positions)
+        k = min(k, len(distance))
+        top = np.argpartition(distance, k - 1)[:k]
+        top = top[np.argsort(distance[top])]
+        return self.rows[position[top]].tolist()
+
+
+class AnnRetriever(VectorSearchRetriever):
+    """IVF search over the snapshot; documents come from the snapshot"""
+
+    snapshot: VectorSnapshot
+    index: IVFIndex
+    nprobe: int = 8
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k=k)[0]
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        if not embeddings:
+            return []
+        return [
+            [self.snapshot.document(row) for row in rows]
+            for rows in self.index.search_many(embeddings, k or self.k, self.nprobe)
+        ]
+
@@ -0,0 +1,9 @@
+"""
+Offline benchmarks for the gutSync backend
+
+Everything here runs without network access: embeddings and the LLM are
+replaced by deterministic local stand-ins, and the corpus is generated.
+Run modules from the backend directory, e.g.:
+
+    python -m benchmarks.load_test --help
+"""
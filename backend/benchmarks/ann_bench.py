@@ -0,0 +1,139 @@
+"""
+IVF index: recall@k and latency versus exact search
+
+Builds an IVF index (ann_index.py) over synthetic clustered embeddings and
+measures, for each nprobe, recall@k against exact search (the snapshot's
+NumPy scan) and per-query latency. Real embeddings of a literature corpus
+are clustered by topic, so the vectors are drawn around --topics random
+centres on the unit sphere; queries are drawn the same way.
+
+Usage (from backend/):
+
+    python -m benchmarks.ann_bench --count 200000 --dim 768 --nprobe 1,4,8,16,32
+    python -m benchmarks.ann_bench --count 50000 --nlist 256 --k 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from ann_index import IVFIndex, build_ivf_index
+
+
+def clustered_vectors(count: int, dim: int, topics: int, spread: float, rng) -> np.ndarray:
+    """Unit vectors scattered around random topic centres"""
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 65536):
+        size = min(65536, count - start)
+        block = centres[rng.integers(topics, size=size)]
+        block += spread * rng.standard_normal((size, dim)).astype(np.float32) / np.sqrt(dim)
+        vectors[start:start + size] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def exact_search(vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    """Same scan as VectorSnapshot.search_many"""
+    distances = norms[None, :] - 2.0 * (queries @ vectors.T)
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1).tolist()
+
+
+def recall_at_k(expected: List[List[int]], found: List[List[int]]) -> float:
+    """Share of the exact top-k that the approximate search also returned"""
+    hits = sum(len(set(want) & set(got)) for want, got in zip(expected, found))
+    total = sum(len(want) for want in expected)
+    return hits / total if total else 1.0
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def time_queries(search, queries: np.ndarray) -> Dict[str, Any]:
+    """Run queries one at a time, like the API does"""
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.extend(search(query[None, :]))
+        latencies.append(time.perf_counter() - started)
+    return {"results": results, **percentiles(latencies)}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="IVF recall vs latency benchmark")
+    parser.add_argument("--count", type=int, default=100000, help="Vectors in the index")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500, help="Clusters in the synthetic data")
+    parser.add_argument("--spread", type=float, default=2.0,
+                        help="Noise around each topic centre (higher = less clustered, harder)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = about 4 * sqrt(count))")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32", help="Comma-separated nprobe values")
+    parser.add_argument("--iterations", type=int, default=10, help="k-means iterations")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"Generating {args.count} x {args.dim} vectors...", file=sys.stderr)
+    vectors = clustered_vectors(args.count + args.queries, args.dim, args.topics, args.spread, rng)
+    vectors, queries = vectors[:args.count], vectors[args.count:]
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    exact = time_queries(lambda query: exact_search(vectors, norms, query, args.k), queries)
+
+    with tempfile.TemporaryDirectory(prefix="gutsync-ann-") as workdir:
+        path = os.path.join(workdir, "ivf")
+        started = time.perf_counter()
+        build_ivf_index(vectors, path, nlist=args.nlist, iterations=args.iterations, seed=args.seed)
+        build_seconds = time.perf_counter() - started
+        index_bytes = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        index = IVFIndex(path)
+        print(f"Built {index.nlist} lists in {build_seconds:.1f}s", file=sys.stderr)
+
+        levels = []
+        for nprobe in [int(value) for value in args.nprobe.split(",")]:
+            measured = time_queries(
+                lambda query: index.search_many(query, args.k, nprobe), queries
+            )
+            level = {
+                "nprobe": nprobe,
+                f"recall@{args.k}": round(recall_at_k(exact["results"], measured["results"]), 4),
+                "p50_ms": measured["p50_ms"],
+                "p99_ms": measured["p99_ms"],
+                "scanned_fraction": round(min(nprobe, index.nlist) / index.nlist, 4),
+            }
+            levels.append(level)
+            print(json.dumps(level), file=sys.stderr)
+
+    report = {
+        "count": args.count,
+        "dim": args.dim,
+        "k": args.k,
+        "nlist": index.nlist,
+        "build_seconds": round(build_seconds, 2),
+        "index_mb": round(index_bytes / 2**20, 1),
+        "exact": {"p50_ms": exact["p50_ms"], "p99_ms": exact["p99_ms"]},
+        "ivf": levels,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
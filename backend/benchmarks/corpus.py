@@ -0,0 +1,110 @@
+"""
+Synthetic gut-brain research corpus and question set
+
+Generates plain-text "papers" built from a fixed vocabulary of foods,
+nutrients and outcomes, so retrieval has realistic overlap between
+questions and chunks. Output is deterministic for a given seed.
+"""
+
+import os
+import random
+from typing import List
+
+FOODS = [
+    "dark chocolate", "refined sugar", "oily fish", "kefir", "yogurt", "kimchi",
+    "whole grains", "leafy greens", "berries", "coffee", "green tea", "walnuts",
+    "processed meat", "legumes", "olive oil", "bananas", "eggs", "oats",
+]
+NUTRIENTS = [
+    "omega-3 fatty acids", "tryptophan", "dietary fibre", "polyphenols",
+    "magnesium", "vitamin D", "folate", "probiotics", "prebiotics", "caffeine",
+    "zinc", "vitamin B12", "saturated fat", "fructose",
+]
+OUTCOMES = [
+    "depressive symptoms", "anxiety", "sleep quality", "energy levels",
+    "mental clarity", "stress response", "digestive comfort", "overall mood",
+    "inflammation", "serotonin synthesis", "cortisol levels", "fatigue",
+]
+MECHANISMS = [
+    "the vagus nerve", "short-chain fatty acid production", "gut microbiome diversity",
+    "intestinal permeability", "the hypothalamic-pituitary-adrenal axis",
+    "systemic inflammation", "neurotransmitter precursors", "blood glucose variability",
+]
+DIRECTIONS = ["improved", "reduced", "was associated with better", "was associated with worse", "did not change"]
+
+QUESTION_TEMPLATES = [
+    "How does {food} affect my {outcome}?",
+    "Is {nutrient} good for {outcome}?",
+    "What does research say about {food} and {outcome}?",
+    "Can {nutrient} help with {outcome}?",
+    "Why would {food} change my mood?",
+    "How are {nutrient} and {mechanism} related?",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    food = rng.choice(FOODS)
+    nutrient = rng.choice(NUTRIENTS)
+    outcome = rng.choice(OUTCOMES)
+    mechanism = rng.choice(MECHANISMS)
+    direction = rng.choice(DIRECTIONS)
+    participants = rng.randint(20, 5000)
+    return rng.choice([
+        f"In a cohort of {participants} adults, higher intake of {food} {direction} {outcome}.",
+        f"{nutrient.capitalize()} may act on {outcome} through {mechanism}.",
+        f"Trials of {nutrient} supplementation reported that {outcome} {direction} participants' baseline.",
+        f"Consumption of {food}, a source of {nutrient}, modulates {mechanism}.",
+        f"Changes in {mechanism} were linked to {outcome} in {participants} participants.",
+    ])
+
+
+def generate_corpus(
+    directory: str,
+    documents: int = 50,
+    paragraphs: int = 12,
+    sentences: int = 8,
+    seed: int = 0
+) -> List[str]:
+    """
+    Write synthetic papers as .txt files.
+
+    Args:
+        directory: Output directory (created if needed)
+        documents: Number of papers
+        paragraphs: Paragraphs per paper
+        sentences: Sentences per paragraph
+        seed: Random seed
+
+    Returns:
+        Paths of the generated files
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+
+    for doc in range(documents):
+        title = f"Paper {doc}: {rng.choice(NUTRIENTS)} and {rng.choice(OUTCOMES)}"
+        body = "\n\n".join(
+            " ".join(_sentence(rng) for _ in range(sentences))
+            for _ in range(paragraphs)
+        )
+        path = os.path.join(directory, f"paper_{doc:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{title}\n\n{body}\n")
+        paths.append(path)
+
+    return paths
+
+
+def generate_questions(count: int, seed: int = 1) -> List[str]:
+    """Deterministic list of user questions about the corpus topics"""
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUESTION_TEMPLATES).format(
+            food=rng.choice(FOODS),
+            nutrient=rng.choice(NUTRIENTS),
+            outcome=rng.choice(OUTCOMES),
+            mechanism=rng.choice(MECHANISMS),
+        )
+        for _ in range(count)
+    ]
@@ -0,0 +1,190 @@
+"""
+Embedding backends: retrieval agreement with the fp32 baseline
+
+Before switching EMBEDDING_BACKEND / EMBEDDING_QUANTIZE /
+EMBEDDING_MAX_SEQ_LENGTH, check that retrieval barely changes. The corpus
+is chunked like ingestion does, every chunk and question is embedded with
+the baseline (huggingface, fp32, full length) and with each candidate, and
+exact cosine search is run for every question. Per candidate it reports:
+
+- recall@k: share of the baseline's top-k chunks the candidate also returns
+- top1_agreement: share of questions with the same best chunk
+- mean_cosine: mean cosine similarity between the baseline and candidate
+  vectors of the same chunk
+- docs_per_second: chunk embedding throughput
+- rss_mb: resident memory added by loading the model (approximate; models
+  are loaded one after another in this process)
+
+Candidates are written as backend[-int8][:max_seq_length], e.g. onnx,
+onnx-int8, onnx-int8:256, huggingface:128.
+
+Usage (from backend/):
+
+    python -m benchmarks.embedding_agreement --candidate onnx --candidate onnx-int8
+    python -m benchmarks.embedding_agreement --paths ../revapp-gba --candidate onnx-int8:256
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus, generate_questions
+
+
+def parse_candidate(spec: str) -> Dict[str, Any]:
+    """backend[-int8][:max_seq_length] -> embedding settings"""
+    name, _, max_length = spec.partition(":")
+    backend, _, variant = name.partition("-")
+    if backend not in ("huggingface", "onnx") or variant not in ("", "int8"):
+        raise argparse.ArgumentTypeError(f"Invalid candidate: {spec}")
+    if variant and backend != "onnx":
+        raise argparse.ArgumentTypeError("int8 quantization needs the onnx backend")
+    return {
+        "EMBEDDING_BACKEND": backend,
+        "EMBEDDING_QUANTIZE": variant == "int8",
+        "EMBEDDING_MAX_SEQ_LENGTH": int(max_length or 0),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_chunks(paths: List[str], chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Chunk documents the same way ingestion does"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from ingestion import iter_pages, resolve_sources
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for path in resolve_sources(paths):
+        for page in iter_pages(path):
+            chunks.extend(chunk.page_content for chunk in splitter.split_documents([page]))
+    return chunks
+
+
+def embed_all(settings, chunks: List[str], questions: List[str]) -> Dict[str, Any]:
+    """Load one embedding configuration and embed the chunks and questions"""
+    from embedding_backends import create_embeddings, embedding_identity
+
+    gc.collect()
+    before = rss_mb()
+    embeddings = create_embeddings(settings)
+    embeddings.embed_query("warm-up")
+    loaded = rss_mb()
+
+    started = time.perf_counter()
+    chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    elapsed = time.perf_counter() - started
+    question_vectors = np.asarray(
+        [embeddings.embed_query(question) for question in questions],
+        dtype=np.float32
+    )
+
+    del embeddings
+    return {
+        "name": embedding_identity(settings),
+        "chunks": normalize(chunk_vectors),
+        "questions": normalize(question_vectors),
+        "docs_per_second": round(len(chunks) / elapsed, 1) if elapsed else 0.0,
+        "rss_mb": round(max(loaded - before, 0.0), 1),
+    }
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(chunks: np.ndarray, questions: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most similar chunks per question, best first"""
+    scores = questions @ chunks.T
+    k = min(k, chunks.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], k: int) -> Dict[str, Any]:
+    expected = top_k(baseline["chunks"], baseline["questions"], k)
+    found = top_k(candidate["chunks"], candidate["questions"], k)
+
+    recall = np.mean([
+        len(set(want) & set(got)) / len(want)
+        for want, got in zip(expected.tolist(), found.tolist())
+    ])
+    return {
+        f"recall@{k}": round(float(recall), 4),
+        "top1_agreement": round(float(np.mean(expected[:, 0] == found[:, 0])), 4),
+        "mean_cosine": round(float(np.mean(np.sum(baseline["chunks"] * candidate["chunks"], axis=1))), 4),
+        "docs_per_second": candidate["docs_per_second"],
+        "rss_mb": candidate["rss_mb"],
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Embedding backend retrieval agreement")
+    parser.add_argument("--candidate", action="append", type=parse_candidate, default=[],
+                        help="backend[-int8][:max_seq_length]; repeatable (default: onnx, onnx-int8)")
+    parser.add_argument("--paths", nargs="*", help="Documents to chunk (default: synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic papers")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="EMBEDDING_THREADS for every run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from config import settings
+
+    candidates = args.candidate or [parse_candidate("onnx"), parse_candidate("onnx-int8")]
+    questions = generate_questions(args.questions, seed=args.seed + 1)
+
+    with tempfile.TemporaryDirectory(prefix="gutsync-embed-") as workdir:
+        paths = args.paths or generate_corpus(workdir, documents=args.documents, seed=args.seed)
+        chunks = load_chunks(paths, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+
+    if not chunks:
+        parser.error("No chunks to embed")
+
+    def configured(**overrides):
+        return settings.model_copy(update={"EMBEDDING_THREADS": args.threads, **overrides})
+
+    baseline = embed_all(configured(**parse_candidate("huggingface")), chunks, questions)
+    print(f"{baseline['name']:>48}: baseline, {baseline['docs_per_second']} docs/s, "
+          f"{baseline['rss_mb']} MB", file=sys.stderr)
+
+    results = {}
+    for overrides in candidates:
+        candidate = embed_all(configured(**overrides), chunks, questions)
+        results[candidate["name"]] = compare(baseline, candidate, args.k)
+        print(f"{candidate['name']:>48}: {json.dumps(results[candidate['name']])}", file=sys.stderr)
+
+    report = {
+        "chunks": len(chunks),
+        "questions": len(questions),
+        "k": args.k,
+        "baseline": {
+            "name": baseline["name"],
+            "docs_per_second": baseline["docs_per_second"],
+            "rss_mb": baseline["rss_mb"],
+        },
+        "candidates": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Stand-in Ollama server
+
+Serves /api/generate (streamed NDJSON) and /api/version with the latency
+model of benchmarks.fakes.FakeLLM, and runs at most `parallel` generations
+at a time like OLLAMA_NUM_PARALLEL; extra requests queue. Servers can be
+marked as failing to exercise ejection and re-probing, and a fraction of
+requests can stall before their first token (stall_fraction, stall_ms).
+
+Run one from the command line:
+
+    python -m benchmarks.fake_ollama --port 11500 --parallel 2
+
+or start several in-process with run_servers().
+"""
+
+import argparse
+import asyncio
+from contextlib import contextmanager
+import json
+import random
+import socket
+import threading
+import time
+from typing import Iterator, List
+
+from benchmarks.fakes import FakeLLM
+
+
+class FakeOllamaServer:
+    """One fake Ollama server running uvicorn on a background thread"""
+
+    def __init__(
+        self,
+        port: int,
+        parallel: int = 1,
+        first_token_ms: float = 200.0,
+        tokens_per_second: float = 50.0,
+        max_tokens: int = 64,
+        stall_fraction: float = 0.0,
+        stall_ms: float = 0.0
+    ):
+        self.port = port
+        self.parallel = parallel
+        self.failing = False  # When set, every request gets a 500
+        self.stall_fraction = stall_fraction  # Share of requests delayed by stall_ms
+        self.stall_ms = stall_ms
+        self.requests = 0
+        self.active = 0  # Generations streaming right now
+        self.max_active = 0  # Most generations streaming at once
+        self.llm = FakeLLM(
+            first_token_ms=first_token_ms,
+            tokens_per_second=tokens_per_second,
+            max_tokens=max_tokens
+        )
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def create_app(self):
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse, StreamingResponse
+
+        app = FastAPI()
+        slots = asyncio.Semaphore(self.parallel)
+
+        @app.get("/api/version")
+        async def version():
+            if self.failing:
+                return JSONResponse({"error": "unavailable"}, status_code=500)
+            return {"version": "fake"}
+
+        @app.post("/api/generate")
+        async def generate(request: Request):
+            if self.failing:
+                return JSONResponse({"error": "unavailable"}, status_code=500)
+
+            body = await request.json()
+            self.requests += 1
+            options = body.get("options") or {}
+
+            stall = self.stall_ms / 1000.0 if random.random() < self.stall_fraction else 0.0
+
+            async def stream():
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    if stall:
+                        await asyncio.sleep(stall)
+                    async with slots:
+                        async for chunk in self.llm.astream(body["prompt"], **options):
+                            yield json.dumps({"model": body.get("model"), "response": chunk, "done": False}) + "\n"
+                        yield json.dumps({"model": body.get("model"), "response": "", "done": True}) + "\n"
+                finally:
+                    self.active -= 1
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        return app
+
+    def start(self):
+        import uvicorn
+
+        config = uvicorn.Config(self.create_app(), host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Fake Ollama server on port {self.port} did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def run_servers(count: int, **kwargs) -> Iterator[List[FakeOllamaServer]]:
+    """Start `count` fake servers on free ports; stop them on exit"""
+    servers = [FakeOllamaServer(free_port(), **kwargs) for _ in range(count)]
+    try:
+        for server in servers:
+            server.start()
+        yield servers
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Ollama server")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent generations (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--stall-fraction", type=float, default=0.0, help="Share of requests that stall")
+    parser.add_argument("--stall-ms", type=float, default=0.0, help="Extra delay before a stalled first token")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    server = FakeOllamaServer(
+        args.port,
+        parallel=args.parallel,
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        max_tokens=args.max_tokens,
+        stall_fraction=args.stall_fraction,
+        stall_ms=args.stall_ms
+    )
+    uvicorn.run(server.create_app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Deterministic local stand-ins for the embedding model and the LLM
+
+They reproduce the cost profile of the real components (a fixed overhead
+per embedding batch plus a per-item cost, time to first token and a token
+rate for generation) without loading any model or calling any server.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import List, Optional, Any, Iterator, AsyncIterator
+
+from langchain_core.callbacks import (
+    CallbackManagerForLLMRun,
+    AsyncCallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+VOCABULARY = (
+    "research suggests that diet quality is linked to mood and the gut "
+    "microbiome may influence serotonin production through fermentation of "
+    "fibre while refined sugar intake correlates with fatigue and anxiety"
+).split()
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashing-trick bag-of-words embeddings.
+
+    Texts that share words get similar vectors, so retrieval results are
+    meaningful. Each call sleeps for batch_overhead_ms + per_item_ms * n to
+    model a batched transformer forward pass (the sleep releases the GIL,
+    like the real model does).
+    """
+
+    def __init__(self, dim: int = 384, batch_overhead_ms: float = 5.0, per_item_ms: float = 1.0):
+        self.dim = dim
+        self.batch_overhead_ms = batch_overhead_ms
+        self.per_item_ms = per_item_ms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cost_ms = self.batch_overhead_ms + self.per_item_ms * len(texts)
+        if cost_ms > 0:
+            time.sleep(cost_ms / 1000.0)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in WORD_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+class FakeLLM(LLM):
+    """
+    LLM that streams deterministic words at a configurable rate.
+
+    Latency model: prefill_ms_per_1k_chars * prompt length + first_token_ms
+    before the first token, then one token every 1 / tokens_per_second.
+    The token limit can be lowered per call with num_predict (Ollama) or
+    max_tokens (OpenAI-style), like the real providers.
+    """
+
+    first_token_ms: float = 200.0
+    tokens_per_second: float = 50.0
+    max_tokens: int = 64
+    prefill_ms_per_1k_chars: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _plan(self, prompt: str, **kwargs: Any):
+        limit = kwargs.get("num_predict") or kwargs.get("max_tokens") or self.max_tokens
+        seed = int.from_bytes(hashlib.md5(prompt.encode("utf-8")).digest()[:4], "little")
+        tokens = [
+            ("" if i == 0 else " ") + VOCABULARY[(seed + i * 7) % len(VOCABULARY)]
+            for i in range(limit)
+        ]
+        first_delay = (
+            self.first_token_ms + self.prefill_ms_per_1k_chars * len(prompt) / 1000.0
+        ) / 1000.0
+        token_delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return tokens, first_delay, token_delay
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        tokens, first_delay, token_delay = self._plan(prompt, **kwargs)
+        time.sleep(first_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(token_delay)
+            yield GenerationChunk(text=token)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        parts = []
+        async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+            parts.append(chunk.text)
+        return "".join(parts)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[GenerationChunk]:
+        tokens, first_delay, token_delay = self._plan(prompt, **kwargs)
+        await asyncio.sleep(first_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(token_delay)
+            yield GenerationChunk(text=token)
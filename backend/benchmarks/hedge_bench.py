@@ -0,0 +1,168 @@
+"""
+Hedged and failover generation across two LLM providers
+
+Starts two fake Ollama servers (see benchmarks.fake_ollama): a fast
+primary where a fraction of requests stall before their first token, and
+a slower but steady secondary. Measures time to first token (TTFT) for
+the primary alone and for a RoutedLLM that hedges to the secondary, then
+fails the primary to check failover and the circuit breaker.
+
+Usage (from backend/):
+
+    python -m benchmarks.hedge_bench --requests 200 --stall-fraction 0.05 --stall-ms 3000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_ollama import FakeOllamaServer, free_port
+from llm_pool import PooledOllama
+from llm_router import RoutedLLM
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def first_token(llm: Any, prompt: str) -> float:
+    """Seconds to the first chunk of one streamed generation"""
+    started = time.perf_counter()
+    stream = llm.astream(prompt)
+    try:
+        await anext(stream, None)
+        return time.perf_counter() - started
+    finally:
+        await stream.aclose()
+
+
+async def measure(llm: Any, requests: int, concurrency: int) -> Dict[str, Any]:
+    """TTFT distribution over `requests` generations, `concurrency` at a time"""
+    slots = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with slots:
+            try:
+                return await first_token(llm, f"question {i}")
+            except Exception:
+                errors += 1
+                return None
+
+    samples = [s for s in await asyncio.gather(*(one(i) for i in range(requests))) if s is not None]
+    return {
+        "requests": requests,
+        "errors": errors,
+        "ttft_p50_ms": round(percentile(samples, 50) * 1000.0, 1) if samples else None,
+        "ttft_p99_ms": round(percentile(samples, 99) * 1000.0, 1) if samples else None,
+        "ttft_max_ms": round(max(samples) * 1000.0, 1) if samples else None,
+    }
+
+
+def make_router(primary: PooledOllama, secondary: PooledOllama, args: argparse.Namespace) -> RoutedLLM:
+    return RoutedLLM(
+        providers=[primary, secondary],
+        names=["primary", "secondary"],
+        hedge_percentile=args.hedge_percentile,
+        hedge_initial_delay=args.hedge_initial_delay,
+        min_latency_samples=10,
+        failure_threshold=3,
+        cooldown=args.cooldown
+    )
+
+
+async def run(args: argparse.Namespace, primary_server, secondary_server) -> Dict[str, Any]:
+    def pooled(server) -> PooledOllama:
+        return PooledOllama(
+            model="fake",
+            base_urls=[server.url],
+            max_in_flight_per_node=args.parallel,
+            max_attempts=1,
+            probe_interval=0.2
+        )
+
+    primary, secondary = pooled(primary_server), pooled(secondary_server)
+    try:
+        alone = await measure(primary, args.requests, args.concurrency)
+        print(f"primary only: {json.dumps(alone)}", file=sys.stderr)
+
+        router = make_router(primary, secondary, args)
+        hedged = await measure(router, args.requests, args.concurrency)
+        hedged["router"] = router.router_stats()
+        print(f"hedged:       {json.dumps({k: v for k, v in hedged.items() if k != 'router'})}",
+              file=sys.stderr)
+
+        # Failover: the primary errors, requests move to the secondary
+        router = make_router(primary, secondary, args)
+        primary_server.failing = True
+        during = await measure(router, args.concurrency * 4, args.concurrency)
+        circuit_opened = router.router_stats()["providers"][0]["circuit"] == "open"
+
+        primary_server.failing = False
+        await asyncio.sleep(args.cooldown + 0.5)
+        await measure(router, args.concurrency, args.concurrency)
+        recovered = router.router_stats()["providers"][0]["circuit"] == "closed"
+        failover = {
+            "during_failure": during,
+            "circuit_opened": circuit_opened,
+            "recovered": recovered,
+            "router": router.router_stats(),
+        }
+        print(f"failover:     errors={during['errors']} circuit_opened={circuit_opened} "
+              f"recovered={recovered}", file=sys.stderr)
+    finally:
+        primary.close()
+        secondary.close()
+
+    return {"primary_only": alone, "hedged": hedged, "failover": failover}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM hedging and failover benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--parallel", type=int, default=4, help="Concurrent generations per server")
+    parser.add_argument("--primary-first-token-ms", type=float, default=100.0)
+    parser.add_argument("--secondary-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--stall-fraction", type=float, default=0.05, help="Primary requests that stall")
+    parser.add_argument("--stall-ms", type=float, default=3000.0)
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    parser.add_argument("--hedge-initial-delay", type=float, default=1.0)
+    parser.add_argument("--cooldown", type=float, default=1.0, help="Circuit cooldown (seconds)")
+    args = parser.parse_args()
+
+    servers = [
+        FakeOllamaServer(
+            free_port(),
+            parallel=args.parallel,
+            first_token_ms=args.primary_first_token_ms,
+            max_tokens=8,
+            stall_fraction=args.stall_fraction,
+            stall_ms=args.stall_ms
+        ),
+        FakeOllamaServer(
+            free_port(),
+            parallel=args.parallel,
+            first_token_ms=args.secondary_first_token_ms,
+            max_tokens=8
+        ),
+    ]
+    try:
+        for server in servers:
+            server.start()
+        report = asyncio.run(run(args, *servers))
+    finally:
+        for server in servers:
+            server.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Throughput of PooledOllama as Ollama servers are added
+
+Starts fake Ollama servers (see benchmarks.fake_ollama), sends a fixed
+number of concurrent generations through a PooledOllama over 1..N of them,
+and reports generations per second. Then ejects a failing server and
+checks the pool keeps serving and re-admits it once it recovers.
+
+Usage (from backend/):
+
+    python -m benchmarks.llm_pool_bench --servers 4 --requests 64
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+from benchmarks.fake_ollama import run_servers
+from llm_pool import PooledOllama
+
+
+async def measure(llm: PooledOllama, requests: int) -> Dict[str, Any]:
+    """Run `requests` generations at once and time them"""
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(llm.ainvoke(f"question {i}") for i in range(requests)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "generations_per_second": round((requests - errors) / elapsed, 2),
+    }
+
+
+async def failover(urls: List[str], servers, args: argparse.Namespace) -> Dict[str, Any]:
+    """Fail one server, check it gets ejected, then recover it"""
+    llm = PooledOllama(
+        model="fake",
+        base_urls=urls,
+        max_in_flight_per_node=args.parallel,
+        eject_after_failures=2,
+        probe_interval=0.2
+    )
+    try:
+        servers[0].failing = True
+        during = await measure(llm, args.requests)
+        ejected = not llm.stats()[0]["healthy"]
+
+        servers[0].failing = False
+        await asyncio.sleep(1.0)
+        readmitted = llm.stats()[0]["healthy"]
+        return {"during_failure": during, "ejected": ejected, "readmitted": readmitted}
+    finally:
+        llm.close()
+
+
+async def run(args: argparse.Namespace, servers) -> Dict[str, Any]:
+    urls = [server.url for server in servers]
+    levels = []
+
+    for count in range(1, len(urls) + 1):
+        llm = PooledOllama(
+            model="fake",
+            base_urls=urls[:count],
+            max_in_flight_per_node=args.parallel
+        )
+        try:
+            result = await measure(llm, args.requests)
+        finally:
+            llm.close()
+        result["servers"] = count
+        levels.append(result)
+        print(
+            f"{count} server(s): {result['generations_per_second']:.2f} gen/s "
+            f"({result['errors']} errors)",
+            file=sys.stderr
+        )
+
+    report = {"parallel_per_server": args.parallel, "levels": levels}
+    if len(urls) > 1:
+        report["failover"] = await failover(urls, servers, args)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PooledOllama scaling benchmark")
+    parser.add_argument("--servers", type=int, default=4, help="Fake Ollama servers to start")
+    parser.add_argument("--parallel", type=int, default=2, help="Concurrent generations per server")
+    parser.add_argument("--requests", type=int, default=32, help="Generations per measurement")
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    with run_servers(
+        args.servers,
+        parallel=args.parallel,
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        max_tokens=args.max_tokens
+    ) as servers:
+        report = asyncio.run(run(args, servers))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
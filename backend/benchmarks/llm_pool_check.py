@@ -0,0 +1,115 @@
+"""
+Behaviour checks for PooledOllama against local stand-in servers
+
+Starts fake Ollama servers (see benchmarks.fake_ollama) and checks that
+the pool:
+
+- routes to the least loaded server (an even split of a burst)
+- never sends a server more than max_in_flight_per_node generations
+- ejects a failing server, retries its requests elsewhere, and re-admits
+  it once its health probe answers again
+
+Prints the result of each check as JSON and exits with status 1 if any
+failed.
+
+Usage (from backend/):
+
+    python -m benchmarks.llm_pool_check
+"""
+
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List
+
+from benchmarks.fake_ollama import run_servers
+from llm_pool import PooledOllama
+
+PER_NODE_CAP = 2
+REQUESTS = 16
+
+
+async def burst(llm: PooledOllama, requests: int) -> List[Any]:
+    return await asyncio.gather(
+        *(llm.ainvoke(f"question {i}") for i in range(requests)),
+        return_exceptions=True
+    )
+
+
+async def check_routing(servers) -> Dict[str, Any]:
+    """A burst splits evenly and respects the per-server cap"""
+    llm = PooledOllama(
+        model="fake",
+        base_urls=[server.url for server in servers],
+        max_in_flight_per_node=PER_NODE_CAP
+    )
+    try:
+        results = await burst(llm, REQUESTS)
+    finally:
+        llm.close()
+
+    per_server = [server.requests for server in servers]
+    max_active = [server.max_active for server in servers]
+    return {
+        "check": "least_outstanding_and_cap",
+        "passed": (
+            not any(isinstance(result, Exception) for result in results)
+            and max(per_server) - min(per_server) <= 1
+            and max(max_active) <= PER_NODE_CAP
+        ),
+        "requests_per_server": per_server,
+        "max_in_flight_per_server": max_active,
+    }
+
+
+async def check_ejection(servers) -> Dict[str, Any]:
+    """A failing server is ejected, its requests retried, then re-admitted"""
+    llm = PooledOllama(
+        model="fake",
+        base_urls=[server.url for server in servers],
+        max_in_flight_per_node=PER_NODE_CAP,
+        eject_after_failures=2,
+        probe_interval=0.2
+    )
+    try:
+        servers[0].failing = True
+        results = await burst(llm, REQUESTS)
+        errors = sum(1 for result in results if isinstance(result, Exception))
+        ejected = not llm.stats()[0]["healthy"]
+
+        servers[0].failing = False
+        await asyncio.sleep(1.0)
+        readmitted = llm.stats()[0]["healthy"]
+
+        before = servers[0].requests
+        await burst(llm, REQUESTS)
+        served_again = servers[0].requests > before
+    finally:
+        servers[0].failing = False
+        llm.close()
+
+    return {
+        "check": "ejection_and_reprobe",
+        "passed": errors == 0 and ejected and readmitted and served_again,
+        "errors_while_failing": errors,
+        "ejected": ejected,
+        "readmitted": readmitted,
+        "served_after_readmission": served_again,
+    }
+
+
+def main():
+    fake = {"parallel": PER_NODE_CAP, "first_token_ms": 20.0, "tokens_per_second": 500.0, "max_tokens": 8}
+
+    results = []
+    with run_servers(2, **fake) as servers:
+        results.append(asyncio.run(check_routing(servers)))
+    with run_servers(2, **fake) as servers:
+        results.append(asyncio.run(check_ejection(servers)))
+
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result["passed"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
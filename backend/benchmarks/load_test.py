@@ -0,0 +1,331 @@
+"""
+Offline load test for the query endpoints
+
+Runs the real FastAPI app in-process (ASGI transport, no sockets) with the
+real ingestion, Chroma, retrieval, cache and concurrency code, but with
+the embedding model and LLM replaced by the latency-faithful fakes in
+benchmarks.fakes. Requests arrive open-loop (Poisson) at each target QPS,
+so a slow server builds a queue instead of slowing the client down.
+
+The ASGI transport delivers a streamed response only once it is complete,
+so time to first token comes from the server's "first_token" stage mark.
+
+Usage (from backend/):
+
+    python -m benchmarks.load_test --qps 1,5,10 --duration 20
+    python -m benchmarks.load_test --endpoint stream --set RETRIEVER_MODE=hybrid
+    python -m benchmarks.load_test --output baseline.json
+
+Prints a human-readable summary to stderr and writes the JSON report to
+--output (or stdout). Compare two reports to check a change for latency
+regressions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+
+from benchmarks.corpus import generate_corpus, generate_questions
+from benchmarks.fakes import FakeEmbeddings, FakeLLM
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Latency distribution in milliseconds"""
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p90": round(percentile(values, 90), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def parse_overrides(pairs: List[str]) -> Dict[str, Any]:
+    """Parse --set KEY=VALUE pairs; values are decoded as JSON when possible"""
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects KEY=VALUE, got {pair!r}")
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def configure(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    """Point the shared settings at a scratch corpus and vectorstore"""
+    from config import settings
+
+    corpus_dir = os.path.join(workdir, "corpus")
+    generate_corpus(corpus_dir, documents=args.documents, seed=args.seed)
+
+    chroma_dir = os.path.join(workdir, "chroma_db")
+    values = {
+        "DOCUMENT_PATHS": [corpus_dir],
+        "CHROMA_DIR": chroma_dir,
+        "SNAPSHOT_DIR": os.path.join(chroma_dir, "snapshot"),
+        "ANN_INDEX_DIR": os.path.join(chroma_dir, "ann_index"),
+        "QUANTIZED_STORE_DIR": os.path.join(chroma_dir, "quantized"),
+        "BM25_INDEX_PATH": os.path.join(chroma_dir, "bm25_index.json"),
+        "EMBEDDING_MODEL": f"fake-{args.embedding_dim}",
+        "LLM_PROVIDER": "fake",
+        "BACKGROUND_STARTUP": False,
+        "INGEST_WORKERS": 1,
+        "CACHE_ENABLED": args.cache,
+    }
+    values.update(parse_overrides(args.set))
+
+    for key, value in values.items():
+        if not hasattr(settings, key):
+            raise SystemExit(f"Unknown setting: {key}")
+        setattr(settings, key, value)
+
+    return {key: value for key, value in values.items() if key not in ("DOCUMENT_PATHS",)}
+
+
+def fake_rag_system_class(args: argparse.Namespace):
+    """RAGSystem subclass that builds the fake models instead of the real ones"""
+    from rag_system import RAGSystem
+
+    class BenchmarkRAGSystem(RAGSystem):
+        def _create_embedding_model(self):
+            return FakeEmbeddings(
+                dim=args.embedding_dim,
+                batch_overhead_ms=args.embed_overhead_ms,
+                per_item_ms=args.embed_item_ms
+            )
+
+        def _init_llm(self):
+            self.llm = FakeLLM(
+                first_token_ms=args.first_token_ms,
+                tokens_per_second=args.tokens_per_second,
+                max_tokens=args.max_tokens,
+                prefill_ms_per_1k_chars=args.prefill_ms_per_1k_chars
+            )
+
+    return BenchmarkRAGSystem
+
+
+def install_fakes(args: argparse.Namespace):
+    """Make main.py build a RAGSystem that uses the fake models"""
+    import main
+
+    main.RAGSystem = fake_rag_system_class(args)
+    return main
+
+
+async def send_query(client, endpoint: str, question: str) -> Dict[str, Any]:
+    """Send one request and measure it from the client side"""
+    started = time.perf_counter()
+    sample: Dict[str, Any] = {"ok": False}
+
+    try:
+        if endpoint == "query":
+            response = await client.post("/query", json={"query": question})
+            sample["ok"] = response.status_code == 200 and response.json().get("status") == "success"
+            if response.status_code == 200:
+                body = response.json()
+                sample["cached"] = bool(body.get("cached"))
+                sample["timings"] = body.get("timings_ms") or {}
+        else:
+            async with client.stream("POST", "/query/stream", json={"query": question}) as response:
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "done":
+                        data = json.loads(line[len("data: "):])
+                        sample["ok"] = True
+                        sample["cached"] = bool(data.get("cached"))
+                        sample["timings"] = data.get("timings_ms") or {}
+    except Exception as e:
+        sample["error"] = str(e)
+
+    sample["latency_ms"] = (time.perf_counter() - started) * 1000.0
+    return sample
+
+
+async def run_level(
+    client,
+    endpoint: str,
+    qps: float,
+    duration: float,
+    questions: List[str],
+    rng: random.Random
+) -> Dict[str, Any]:
+    """Fire requests open-loop at one QPS level and collect the results"""
+    tasks = []
+    started = time.perf_counter()
+    next_arrival = 0.0
+
+    while next_arrival < duration:
+        delay = started + next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_query(client, endpoint, rng.choice(questions))))
+        next_arrival += rng.expovariate(qps)
+
+    samples = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if s["ok"]]
+    stages: Dict[str, List[float]] = {}
+    for sample in ok:
+        for stage, value in sample.get("timings", {}).items():
+            stages.setdefault(stage, []).append(value)
+
+    return {
+        "target_qps": qps,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput_qps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "cache_hits": sum(1 for s in ok if s.get("cached")),
+        "latency_ms": summarize([s["latency_ms"] for s in ok]),
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(stages.items())},
+    }
+
+
+async def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    """Start the app once and run every QPS level against it"""
+    import httpx
+
+    settings_used = configure(args, workdir)
+    main = install_fakes(args)
+
+    questions = generate_questions(args.questions, seed=args.seed + 1)
+    rng = random.Random(args.seed)
+
+    startup = time.perf_counter()
+    async with main.lifespan(main.app):
+        startup_s = time.perf_counter() - startup
+        print(f"App ready in {startup_s:.1f}s", file=sys.stderr)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            levels = []
+            for qps in args.qps:
+                print(f"Running {qps} QPS for {args.duration}s...", file=sys.stderr)
+                levels.append(
+                    await run_level(client, args.endpoint, qps, args.duration, questions, rng)
+                )
+
+    return {
+        "endpoint": args.endpoint,
+        "duration_s": args.duration,
+        "startup_s": round(startup_s, 2),
+        "documents": args.documents,
+        "questions": args.questions,
+        "fakes": {
+            "embed_overhead_ms": args.embed_overhead_ms,
+            "embed_item_ms": args.embed_item_ms,
+            "first_token_ms": args.first_token_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "max_tokens": args.max_tokens,
+            "prefill_ms_per_1k_chars": args.prefill_ms_per_1k_chars,
+        },
+        "settings": settings_used,
+        "levels": levels,
+    }
+
+
+def print_summary(report: Dict[str, Any]):
+    """Human-readable table on stderr"""
+    print(file=sys.stderr)
+    print(f"{'qps':>6} {'reqs':>6} {'err':>5} {'tput':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}",
+          file=sys.stderr)
+    for level in report["levels"]:
+        latency = level["latency_ms"]
+        print(
+            f"{level['target_qps']:>6g} {level['requests']:>6} {level['errors']:>5} "
+            f"{level['throughput_qps']:>7.2f} {latency['p50']:>9.1f} {latency['p90']:>9.1f} "
+            f"{latency['p99']:>9.1f} {latency['max']:>9.1f}",
+            file=sys.stderr
+        )
+    print(file=sys.stderr)
+
+    for level in report["levels"]:
+        parts = [f"{stage}={stats['p50']:.1f}" for stage, stats in level["stages_ms"].items()]
+        print(f"{level['target_qps']:>6g} QPS stage p50 (ms): {' '.join(parts)}", file=sys.stderr)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test for the gutSync RAG API")
+    parser.add_argument("--qps", default="1,5,10",
+                        help="Comma-separated arrival rates to test (default: 1,5,10)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds of arrivals per QPS level (default: 10)")
+    parser.add_argument("--endpoint", choices=["query", "stream"], default="query",
+                        help="Endpoint to load (default: query)")
+    parser.add_argument("--documents", type=int, default=50,
+                        help="Synthetic documents to ingest (default: 50)")
+    parser.add_argument("--questions", type=int, default=200,
+                        help="Distinct questions to draw from (default: 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true",
+                        help="Enable the semantic answer cache (off by default)")
+
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--embed-overhead-ms", type=float, default=5.0,
+                        help="Fake embedding cost per batch (default: 5)")
+    parser.add_argument("--embed-item-ms", type=float, default=1.0,
+                        help="Fake embedding cost per text (default: 1)")
+    parser.add_argument("--first-token-ms", type=float, default=200.0,
+                        help="Fake LLM time to first token (default: 200)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Fake LLM generation rate (default: 50)")
+    parser.add_argument("--max-tokens", type=int, default=64,
+                        help="Fake LLM answer length (default: 64)")
+    parser.add_argument("--prefill-ms-per-1k-chars", type=float, default=0.0,
+                        help="Fake LLM prompt processing cost (default: 0)")
+
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a backend setting, e.g. --set RETRIEVER_MODE=hybrid")
+    parser.add_argument("--workdir", help="Keep the corpus and vectorstore here (default: temp dir)")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+
+    args = parser.parse_args(argv)
+    args.qps = [float(value) for value in args.qps.split(",") if value.strip()]
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = asyncio.run(run(args, args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="gutsync-bench-") as workdir:
+            report = asyncio.run(run(args, workdir))
+
+    print_summary(report)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Prompt-prefix reuse: classic vs prefix_cache prompt layout
+
+LLM servers such as Ollama keep the KV cache of the last prompt in each
+parallel slot and only prefill the tokens after the longest shared prefix.
+This benchmark builds the real prompts for a stream of (question, user)
+requests with both PROMPT_LAYOUT values (and prefix_cache with retrieval on the
+bare question, RETRIEVE_WITH_USER_CONTEXT=false) and reports how many
+prompt tokens would need prefill:
+
+- Offline (default): a simulated server with --slots KV-cache slots; each
+  request goes to the slot sharing the longest prefix. Tokens are estimated
+  at ~4 characters each.
+- With --ollama-url: the prompts are sent to a real Ollama server
+  (one-token generations) and its reported prompt_eval_count and
+  prompt_eval_duration are summed instead.
+
+Usage (from backend/):
+
+    python -m benchmarks.prefix_bench --requests 200 --users 5 --slots 2
+    python -m benchmarks.prefix_bench --ollama-url http://localhost:11434 --model llama3.2
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from typing import List, Dict, Any, Tuple, Optional
+
+from benchmarks.corpus import generate_questions, FOODS
+from benchmarks.load_test import configure, fake_rag_system_class, parse_args as load_test_args
+from metrics import CHARS_PER_TOKEN, estimate_tokens
+
+SLOT_SIMILARITY = 0.5  # llama.cpp's default --slot-prompt-similarity
+
+# (name, PROMPT_LAYOUT, RETRIEVE_WITH_USER_CONTEXT)
+VARIANTS = (
+    ("classic", "classic", True),
+    ("prefix_cache", "prefix_cache", True),
+    ("prefix_cache+question_retrieval", "prefix_cache", False),
+)
+
+
+def make_users(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Synthetic user_data payloads (recent moods and foods)"""
+    rng = random.Random(seed)
+    return [
+        {
+            "moods": [{"mood": rng.randint(1, 10)} for _ in range(5)],
+            "foods": [{"name": rng.choice(FOODS).title()} for _ in range(5)],
+        }
+        for _ in range(count)
+    ]
+
+
+def shared_prefix(a: str, b: str) -> int:
+    """Length of the common prefix of two strings"""
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class SlotCache:
+    """KV-cache slots of a simulated LLM server"""
+
+    def __init__(self, slots: int):
+        self.slots: List[str] = [""] * max(slots, 1)
+        self.last_used: List[int] = [0] * len(self.slots)
+        self.clock = 0
+
+    def prefill_chars(self, prompt: str) -> int:
+        """
+        Characters of the prompt that need prefill.
+
+        Like llama.cpp's slot selection, the prompt goes to the slot sharing
+        the longest prefix if that covers at least SLOT_SIMILARITY of the
+        prompt, otherwise to the least recently used slot. It then occupies
+        that slot.
+        """
+        self.clock += 1
+        shared = [shared_prefix(cached, prompt) for cached in self.slots]
+        best = max(range(len(self.slots)), key=lambda index: shared[index])
+        if shared[best] < SLOT_SIMILARITY * len(prompt):
+            best = min(range(len(self.slots)), key=lambda index: self.last_used[index])
+
+        self.slots[best] = prompt
+        self.last_used[best] = self.clock
+        return len(prompt) - shared[best]
+
+
+def build_prompts(
+    system,
+    settings,
+    requests: List[Tuple[str, Dict[str, Any]]],
+    layout: str,
+    retrieve_with_user_context: bool
+) -> List[str]:
+    """Run retrieval and prompt assembly for every request with one layout"""
+    settings.PROMPT_LAYOUT = layout
+    settings.RETRIEVE_WITH_USER_CONTEXT = retrieve_with_user_context
+    system._init_qa_chain()
+
+    prompts = []
+    for query, user_data in requests:
+        enhanced_query = system._search_query(query, user_data)
+        _, search_vector = system._embed_query_pair(query, enhanced_query)
+        docs = system._search(search_vector, query)
+        prompts.append(system._build_prompt(docs, query, user_data))
+    return prompts
+
+
+def simulate(prompts: List[str], slots: int) -> Dict[str, Any]:
+    cache = SlotCache(slots)
+    total = sum(len(prompt) for prompt in prompts)
+    prefill = sum(cache.prefill_chars(prompt) for prompt in prompts)
+    return {
+        "prompt_tokens": sum(estimate_tokens(prompt) for prompt in prompts),
+        "prefill_tokens": prefill // CHARS_PER_TOKEN,
+        "reused_fraction": round(1 - prefill / total, 4) if total else 0.0,
+    }
+
+
+def measure_ollama(prompts: List[str], url: str, model: str) -> Dict[str, Any]:
+    """Send prompts to a real Ollama server and sum its prompt-eval counters"""
+    import httpx
+
+    evaluated = 0
+    eval_ns = 0
+    with httpx.Client(base_url=url, timeout=300) as client:
+        for prompt in prompts:
+            response = client.post("/api/generate", json={
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {"num_predict": 1},
+            })
+            response.raise_for_status()
+            data = response.json()
+            evaluated += data.get("prompt_eval_count", 0)
+            eval_ns += data.get("prompt_eval_duration", 0)
+
+    return {
+        "prompt_eval_tokens": evaluated,
+        "prompt_eval_seconds": round(eval_ns / 1e9, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Prompt-prefix reuse benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=5, help="Distinct user_data payloads")
+    parser.add_argument("--questions", type=int, default=20, help="Distinct questions")
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=1, help="KV-cache slots (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=60.0,
+                        help="Prefill speed for the time estimate (default: 60, small CPU model)")
+    parser.add_argument("--ollama-url", help="Measure with a real Ollama server instead of simulating")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    questions = generate_questions(args.questions, seed=args.seed + 1)
+    users = make_users(args.users, seed=args.seed + 2)
+    requests = [(rng.choice(questions), rng.choice(users)) for _ in range(args.requests)]
+
+    system_args = load_test_args(["--documents", str(args.documents), "--seed", str(args.seed),
+                                  "--embed-overhead-ms", "0", "--embed-item-ms", "0"])
+
+    with tempfile.TemporaryDirectory(prefix="gutsync-prefix-") as workdir:
+        configure(system_args, workdir)
+        from config import settings
+
+        system = fake_rag_system_class(system_args)()
+        try:
+            results = {}
+            for name, layout, retrieve_with_user_context in VARIANTS:
+                prompts = build_prompts(system, settings, requests, layout, retrieve_with_user_context)
+                if args.ollama_url:
+                    result = measure_ollama(prompts, args.ollama_url, args.model)
+                else:
+                    result = simulate(prompts, args.slots)
+                    result["estimated_prefill_seconds"] = round(
+                        result["prefill_tokens"] / args.prefill_tokens_per_second, 1
+                    )
+                results[name] = result
+                print(f"{name:>32}: {json.dumps(result)}", file=sys.stderr)
+        finally:
+            system.shutdown()
+
+    report = {
+        "requests": args.requests,
+        "users": args.users,
+        "questions": args.questions,
+        "slots": args.slots,
+        "mode": "ollama" if args.ollama_url else "simulated",
+        "layouts": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Quantized vectors: memory, QPS and recall@k versus the float32 snapshot
+
+Exports synthetic clustered embeddings (see ann_bench) as a real snapshot,
+builds int8 and float16 stores on top of it (quantized_store.py) and
+measures, for each rescore factor (candidates rescored exactly = k x
+factor), recall@k against the snapshot's exact search, queries per second
+(one query at a time, like the API) and the memory each search scans.
+
+Usage (from backend/):
+
+    python -m benchmarks.quantized_bench --count 100000 --dim 384 --k 3
+    python -m benchmarks.quantized_bench --dtypes int8 --rescore 1,2,4,8,16
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from benchmarks.ann_bench import clustered_vectors, recall_at_k
+from quantized_store import QuantizedStore, build_quantized_store
+from snapshot import VectorSnapshot, export_snapshot
+
+
+class ArrayCollection:
+    """Just enough of a Chroma collection for export_snapshot"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(offset + limit, len(self.vectors)))
+        return {
+            "ids": [f"chunk-{row}" for row in rows],
+            "embeddings": self.vectors[offset:offset + len(rows)],
+            "documents": ["" for _ in rows],
+            "metadatas": [{} for _ in rows],
+        }
+
+
+def measure(search, queries: np.ndarray) -> Dict[str, Any]:
+    """Run queries one at a time; results, QPS and p50 latency"""
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.extend(search([query]))
+        latencies.append(time.perf_counter() - started)
+    return {
+        "results": results,
+        "qps": round(len(queries) / sum(latencies), 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000.0, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Quantized vector store benchmark")
+    parser.add_argument("--count", type=int, default=100000, help="Vectors in the store")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500, help="Clusters in the synthetic data")
+    parser.add_argument("--spread", type=float, default=2.0,
+                        help="Noise around each topic centre (higher = less clustered, harder)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="SIMILARITY_TOP_K")
+    parser.add_argument("--dtypes", default="int8,float16", help="Comma-separated store dtypes")
+    parser.add_argument("--rescore", default="1,2,4,8,16", help="Comma-separated rescore factors")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"Generating {args.count} x {args.dim} vectors...", file=sys.stderr)
+    vectors = clustered_vectors(args.count + args.queries, args.dim, args.topics, args.spread, rng)
+    vectors, queries = vectors[:args.count], vectors[args.count:]
+
+    with tempfile.TemporaryDirectory(prefix="gutsync-quantized-") as workdir:
+        snapshot = VectorSnapshot(export_snapshot(
+            ArrayCollection(vectors), os.path.join(workdir, "snapshot"), "bench"
+        ))
+        exact = measure(lambda query: snapshot.search_many(query, args.k), queries)
+        float32_bytes = snapshot.vectors.nbytes + snapshot.norms.nbytes
+
+        stores = []
+        for dtype in args.dtypes.split(","):
+            started = time.perf_counter()
+            path = build_quantized_store(
+                snapshot.vectors, os.path.join(workdir, dtype), dtype=dtype, version=snapshot.version
+            )
+            build_seconds = time.perf_counter() - started
+            store = QuantizedStore(path, snapshot)
+
+            levels = []
+            for factor in [int(value) for value in args.rescore.split(",")]:
+                measured = measure(
+                    lambda query: store.search_many(query, args.k, args.k * factor), queries
+                )
+                level = {
+                    "dtype": dtype,
+                    "rescore_factor": factor,
+                    f"recall@{args.k}": round(recall_at_k(exact["results"], measured["results"]), 4),
+                    "qps": measured["qps"],
+                    "p50_ms": measured["p50_ms"],
+                }
+                levels.append(level)
+                print(json.dumps(level), file=sys.stderr)
+
+            stores.append({
+                "dtype": dtype,
+                "build_seconds": round(build_seconds, 2),
+                "memory_mb": round(store.nbytes / 2**20, 1),
+                "levels": levels,
+            })
+
+    report = {
+        "count": args.count,
+        "dim": args.dim,
+        "k": args.k,
+        "float32": {
+            "memory_mb": round(float32_bytes / 2**20, 1),
+            "qps": exact["qps"],
+            "p50_ms": exact["p50_ms"],
+        },
+        "quantized": stores,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+BM25 keyword index and hybrid (BM25 + vector) retrieval
+
+Dense similarity misses keyword-heavy queries about specific foods or
+nutrients ("omega-3", "tryptophan"). This module keeps a compact in-process
+inverted index over the same chunks as the vectorstore and fuses its
+results with the dense results by reciprocal rank fusion (RRF).
+"""
+
+from collections import Counter
+import json
+import logging
+import math
+import os
+import re
+from typing import List, Dict, Tuple, Optional, Iterable, Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrievers import VectorSearchRetriever
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+EXPORT_PAGE_SIZE = 1000
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can could do does for from had has
+have how i if in into is it its may me my of on or our should so than that
+the their them there these they this to was we were what when which who why
+will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens without stopwords.
+
+    Hyphenated terms are kept whole and also split, so "omega-3" matches
+    both "omega-3" and "omega 3".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(part for part in token.split("-") if part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        doc_lengths: np.ndarray,
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        version: str,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        self.ids = ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.version = version
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, str]], version: str) -> "BM25Index":
+        """
+        Build an index from (chunk ID, text) pairs.
+
+        Args:
+            chunks: Chunk IDs and texts
+            version: Corpus version the chunks belong to
+        """
+        ids: List[str] = []
+        lengths: List[int] = []
+        docs_by_term: Dict[str, List[int]] = {}
+        tfs_by_term: Dict[str, List[int]] = {}
+
+        for chunk_id, text in chunks:
+            row = len(ids)
+            ids.append(chunk_id)
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                docs_by_term.setdefault(term, []).append(row)
+                tfs_by_term.setdefault(term, []).append(tf)
+
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs_by_term[term], dtype=np.int32))
+            for term, docs in docs_by_term.items()
+        }
+        return cls(ids, np.asarray(lengths, dtype=np.float32), postings, version)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Score chunks against a query.
+
+        Returns:
+            Up to k (chunk ID, score) pairs, best first; only chunks that
+            contain at least one query term
+        """
+        count = len(self.ids)
+        if count == 0:
+            return []
+
+        scores = np.zeros(count, dtype=np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1.0 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+    def save(self, path: str):
+        """Persist the index as JSON (written atomically)"""
+        data = {
+            "format": INDEX_FORMAT,
+            "version": self.version,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: [docs.tolist(), tfs.tolist()]
+                for term, (docs, tfs) in self.postings.items()
+            },
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Load a persisted index, or None if it is missing or unreadable"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if data.get("format") != INDEX_FORMAT:
+            return None
+
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.int32))
+            for term, (docs, tfs) in data["postings"].items()
+        }
+        return cls(
+            data["ids"],
+            np.asarray(data["doc_lengths"], dtype=np.float32),
+            postings,
+            data["version"]
+        )
+
+
+def ensure_bm25_index(collection, path: str, version: str) -> BM25Index:
+    """Load the persisted index, rebuilding it from Chroma if it is stale"""
+    index = BM25Index.load(path)
+    if index is not None and index.version == version:
+        return index
+
+    logger.info("BM25 index missing or stale, building from vectorstore...")
+
+    def iter_chunks():
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=EXPORT_PAGE_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            yield from zip(page["ids"], (text or "" for text in page["documents"]))
+            offset += len(page["ids"])
+
+    index = BM25Index.build(iter_chunks(), version)
+    index.save(path)
+    logger.info(f"✅ BM25 index built: {len(index.ids)} chunks, {len(index.postings)} terms")
+    return index
+
+
+class HybridRetriever(VectorSearchRetriever):
+    """
+    Dense + BM25 retrieval fused by reciprocal rank fusion.
+
+    Both retrievers fetch fetch_k candidates; each candidate scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in.
+    """
+
+    dense: VectorSearchRetriever
+    index: BM25Index
+    vectorstore: Any  # Chroma, to load chunks that only BM25 found
+    fetch_k: int = 10
+    rrf_k: int = 60
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k=k, queries=[query])[0]
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        k = k or self.k
+        fetch_k = max(self.fetch_k, k)
+        queries = queries or [None] * len(embeddings)
+
+        dense_results = self.dense.search_by_vectors(embeddings, k=fetch_k)
+
+        ranked: List[List[str]] = []
+        docs: Dict[str, Document] = {}
+        for dense_docs, query in zip(dense_results, queries):
+            docs.update((doc.id, doc) for doc in dense_docs)
+            if not query:
+                ranked.append([doc.id for doc in dense_docs[:k]])
+                continue
+
+            keyword_ids = [chunk_id for chunk_id, _ in self.index.search(query, fetch_k)]
+
+            scores: Dict[str, float] = {}
+            for ids in ([doc.id for doc in dense_docs], keyword_ids):
+                for rank, chunk_id in enumerate(ids):
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+            ranked.append(sorted(scores, key=scores.get, reverse=True)[:k])
+
+        # Chunks only BM25 found, fetched in one call for the whole batch
+        missing = list(dict.fromkeys(
+            chunk_id for ids in ranked for chunk_id in ids if chunk_id not in docs
+        ))
+        if missing:
+            found = self.vectorstore._collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                docs[chunk_id] = Document(page_content=text or "", metadata=metadata or {}, id=chunk_id)
+
+        return [[docs[chunk_id] for chunk_id in ids if chunk_id in docs] for ids in ranked]
@@ -0,0 +1,251 @@
+"""
+Semantic answer cache for the RAG system
+
+Answers are keyed on the embedding of the user's question plus a
+fingerprint of their personal context. A lookup hits when a cached
+question with the same context is close enough (cosine similarity above
+a threshold), so paraphrases of the same question skip retrieval and
+generation entirely.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import itertools
+import logging
+import sys
+import threading
+import time
+from typing import Optional, Dict, List, Any, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (dict slots, dataclass, timestamps)
+_ENTRY_OVERHEAD_BYTES = 256
+_BUCKET_INITIAL_ROWS = 16
+
+
+@dataclass
+class CacheEntry:
+    """A cached answer"""
+    vector: np.ndarray  # Unit-normalized query embedding (float32)
+    context_key: str
+    response: str
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+    size: int = 0
+
+
+class _Bucket:
+    """Entries of one user context, with their vectors kept in one matrix"""
+
+    def __init__(self, dim: int):
+        self.ids: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.matrix = np.empty((_BUCKET_INITIAL_ROWS, dim), dtype=np.float32)
+
+    def add(self, entry_id: int, vector: np.ndarray):
+        count = len(self.ids)
+        if count == len(self.matrix):
+            grown = np.empty((2 * count, self.matrix.shape[1]), dtype=np.float32)
+            grown[:count] = self.matrix
+            self.matrix = grown
+        self.matrix[count] = vector
+        self.rows[entry_id] = count
+        self.ids.append(entry_id)
+
+    def remove(self, entry_id: int):
+        """Move the last row into the freed one"""
+        row = self.rows.pop(entry_id)
+        last_id = self.ids.pop()
+        if last_id != entry_id:
+            self.matrix[row] = self.matrix[len(self.ids)]
+            self.ids[row] = last_id
+            self.rows[last_id] = row
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every entry to a unit query vector"""
+        return self.matrix[:len(self.ids)] @ query
+
+
+class SemanticCache:
+    """
+    Thread-safe LRU + TTL cache of answers keyed on query embeddings.
+
+    Entries are evicted when they expire, when the entry or memory cap is
+    exceeded (least recently used first), and all at once when the corpus
+    version changes.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: float
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # Global LRU order; buckets group entries by user context
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._bytes = 0
+        self._corpus_version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def fingerprint(user_context: str) -> str:
+        """Stable short hash of the formatted user context"""
+        return hashlib.sha256(user_context.encode("utf-8")).hexdigest()[:16]
+
+    def sync_corpus_version(self, version: str):
+        """Drop every entry if the vectorstore contents changed"""
+        with self._lock:
+            if version == self._corpus_version:
+                return
+            if self._corpus_version is not None and self._entries:
+                logger.info("Corpus changed, invalidating answer cache")
+                self.invalidations += 1
+            self._clear_locked()
+            self._corpus_version = version
+
+    def lookup(self, embedding: Sequence[float], context_key: str) -> Optional[CacheEntry]:
+        """
+        Find the closest cached answer for the same user context.
+
+        Args:
+            embedding: Query embedding
+            context_key: Fingerprint of the user context
+
+        Returns:
+            The cached entry, or None on a miss
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(context_key)
+            if bucket is not None:
+                # Expired entries are dropped lazily here
+                for entry_id in [i for i in bucket.ids if self._expired(self._entries[i], now)]:
+                    self._remove_locked(entry_id)
+                    self.evictions += 1
+                bucket = self._buckets.get(context_key)
+
+            if bucket is None:
+                self.misses += 1
+                return None
+
+            scores = bucket.scores(query)
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            entry_id = bucket.ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        context_key: str,
+        response: str,
+        sources: Optional[List[Dict[str, Any]]] = None,
+        corpus_version: Optional[str] = None
+    ):
+        """
+        Cache an answer, evicting least recently used entries if needed.
+
+        Args:
+            corpus_version: Corpus version the answer was generated from; the
+                answer is dropped if the corpus has changed since
+        """
+        vector = self._normalize(embedding)
+        entry = CacheEntry(
+            vector=vector,
+            context_key=context_key,
+            response=response,
+            sources=sources or []
+        )
+        entry.size = (
+            vector.nbytes
+            + sys.getsizeof(response)
+            + _ENTRY_OVERHEAD_BYTES
+        )
+
+        if entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            if corpus_version is not None and corpus_version != self._corpus_version:
+                return
+
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            bucket = self._buckets.get(context_key)
+            if bucket is None:
+                bucket = self._buckets[context_key] = _Bucket(len(vector))
+            bucket.add(entry_id, vector)
+            self._bytes += entry.size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest_id = next(iter(self._entries))
+                self._remove_locked(oldest_id)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry.size
+        bucket = self._buckets[entry.context_key]
+        bucket.remove(entry_id)
+        if not bucket.ids:
+            del self._buckets[entry.context_key]
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
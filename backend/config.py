@@ -17,6 +17,10 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     
+    # Startup
+    BACKGROUND_STARTUP: bool = True  # Serve /health/live while models load
+    WARMUP_ON_STARTUP: bool = True  # Dummy embedding + one-token LLM call before ready
+    
     # CORS settings
     CORS_ORIGINS: List[str] = [
         "http://localhost:3000",
@@ -27,6 +31,24 @@ class Settings(BaseSettings):
     LLM_PROVIDER: str = "ollama"  # Options: "ollama", "groq", "huggingface"
     OLLAMA_MODEL: str = "llama3.2"  # or "mistral", "phi3"
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    # Load-balance over several Ollama servers; empty = OLLAMA_BASE_URL only
+    OLLAMA_BASE_URLS: List[str] = []
+    OLLAMA_MAX_IN_FLIGHT_PER_NODE: int = 4  # Match OLLAMA_NUM_PARALLEL on the servers
+    OLLAMA_EJECT_AFTER_FAILURES: int = 3  # Consecutive failures before a server is ejected
+    OLLAMA_PROBE_INTERVAL_SECONDS: float = 5.0  # Health probes of ejected servers
+    OLLAMA_REQUEST_TIMEOUT: float = 120.0
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps the model loaded after a request
+    OLLAMA_KEEP_WARM_INTERVAL_SECONDS: float = 600.0  # Re-load ping interval (0 = off)
+    OLLAMA_NUM_KEEP: int = 0  # Prompt tokens kept when the context shifts (0 = Ollama default)
+    
+    # Several providers: first is preferred, the rest take hedged and failed-over
+    # requests, e.g. ["ollama", "groq"]; empty = LLM_PROVIDER only
+    LLM_PROVIDERS: List[str] = []
+    LLM_HEDGE_PERCENTILE: float = 95.0  # Hedge after this TTFT percentile of the provider (0 = off)
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.2
+    LLM_HEDGE_INITIAL_DELAY_SECONDS: float = 2.0  # Until 20 TTFT samples are known
+    LLM_CIRCUIT_FAILURES: int = 3  # Consecutive failures that open a provider's circuit
+    LLM_CIRCUIT_COOLDOWN_SECONDS: float = 30.0  # Before a trial request is let through
     
     # Optional API keys (for cloud providers)
     GROQ_API_KEY: str = ""
@@ -36,15 +58,97 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     SIMILARITY_TOP_K: int = 3
+    # "classic" or "prefix_cache" (instructions -> context -> user data -> question)
+    PROMPT_LAYOUT: str = "classic"
+    # Embed the user's mood/food context with the question for retrieval; turning
+    # this off makes the retrieved context depend on the question only
+    RETRIEVE_WITH_USER_CONTEXT: bool = True
+    LLM_NUM_CTX: int = 4096  # LLM context window (tokens)
+    CONTEXT_PACKING_ENABLED: bool = True  # Merge overlapping chunks, fit context to the window
+    LLM_ANSWER_RESERVE_TOKENS: int = 512  # Context window kept free for the answer
+    CONTEXT_MAX_TOKENS: int = 0  # Hard cap on retrieved context (0 = whatever fits)
+    VECTOR_BACKEND: str = "chroma"  # Options: "chroma", "snapshot" (mmap, shared by workers), "ann" (IVF over the snapshot), "quantized" (compact vectors + exact rescoring)
+    ANN_NLIST: int = 0  # IVF lists; 0 = about 4 * sqrt(chunks)
+    ANN_NPROBE: int = 8  # Lists scanned per query (higher = better recall, slower)
+    ANN_KMEANS_ITERATIONS: int = 10
+    QUANTIZED_DTYPE: str = "int8"  # Options: "int8" (4x smaller), "float16" (2x smaller)
+    QUANTIZED_RESCORE_FACTOR: int = 4  # Candidates rescored in float32 = SIMILARITY_TOP_K * factor
+    RETRIEVER_MODE: str = "vector"  # Options: "vector", "hybrid" (BM25 + vector)
+    HYBRID_FETCH_K: int = 10  # Candidates from each retriever before fusion
+    HYBRID_RRF_K: int = 60  # Reciprocal rank fusion constant
+    
+    # Ingestion
+    INGEST_WORKERS: int = 0  # PDF parsing processes (0 = one per CPU, 1 = no pool)
+    INGEST_BATCH_SIZE: int = 64  # Chunks embedded and written per batch
+    INGEST_PAGES_PER_TASK: int = 4  # PDF pages parsed per worker task
+    
+    # Concurrency (per uvicorn worker)
+    MAX_CONCURRENT_QUERIES: int = 32  # Queries in flight; extra requests wait
+    SCHEDULER_MAX_QUEUE: int = 64  # Waiting requests; more get 503 + Retry-After
+    SCHEDULER_RETRY_AFTER_SECONDS: int = 5
+    REQUEST_TIMEOUT_SECONDS: float = 120.0  # Default deadline per query; 0 = none
+    BATCH_TIMEOUT_SECONDS: float = 600.0  # Default deadline per batch; 0 = none
+    RAG_THREAD_POOL_SIZE: int = 4  # Threads for blocking embedding/Chroma work
+    BATCH_MAX_QUERIES: int = 100  # Largest /query/batch request
+    BATCH_LLM_CONCURRENCY: int = 4  # Generations run in parallel per batch
+    COALESCE_ENABLED: bool = True  # Identical concurrent queries share one answer
+    
+    # Degraded answers when the LLM is slow
+    LLM_LATENCY_BUDGET_SECONDS: float = 0.0  # No answer / first token by then -> extractive answer; 0 = off
+    FALLBACK_SENTENCES: int = 3  # Sentences quoted in an extractive answer
+    FALLBACK_COMPLETE_IN_BACKGROUND: bool = True  # Finish the generation to fill the answer cache
+    FALLBACK_MAX_BACKGROUND: int = 8  # Background generations at once; beyond this they are cancelled
+    
+    # Metrics
+    METRICS_ENABLED: bool = True  # Prometheus metrics on /metrics
+    
+    # On-demand query profiles (POST /admin/profile)
+    ADMIN_TOKEN: str = ""  # Bearer token for /admin endpoints; empty = endpoints off
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0  # Between stack samples of a profiled query
+    PROFILE_MAX_ARMED: int = 100  # Most queries armed at once per worker
+    
+    # Semantic answer cache
+    CACHE_ENABLED: bool = True
+    CACHE_SIMILARITY_THRESHOLD: float = 0.92  # Cosine similarity needed for a hit
+    CACHE_TTL_SECONDS: int = 3600  # 0 = never expire
+    CACHE_MAX_ENTRIES: int = 1000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
     
     # Embeddings
     EMBEDDING_MODEL: str = "sentence-transformers/all-distilroberta-v1"
     EMBEDDING_DEVICE: str = "cpu"
+    EMBEDDING_BACKEND: str = "huggingface"  # huggingface | onnx
+    EMBEDDING_QUANTIZE: bool = False  # onnx only: int8 dynamic quantization
+    EMBEDDING_THREADS: int = 0  # Intra-op threads; 0 = library default
+    EMBEDDING_MAX_SEQ_LENGTH: int = 0  # Truncate inputs (tokens); 0 = model limit
+    EMBEDDING_BATCH_ENABLED: bool = True  # Micro-batch concurrent query embeddings
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # Wait this long for more queries
+    EMBEDDING_BATCH_MAX_SIZE: int = 32  # ...or until this many are waiting
     
     # Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     PDF_PATH: str = os.path.join(BASE_DIR, "revapp-gba", "foodAndMoodPaper.pdf")
+    # Files or directories to index (.pdf, .txt, .md); empty = PDF_PATH only
+    DOCUMENT_PATHS: List[str] = []
     CHROMA_DIR: str = os.path.join(BASE_DIR, "revapp-gba", "chroma_db")
+    # Files derived from the Chroma store; empty = inside CHROMA_DIR (see chroma_path)
+    SNAPSHOT_DIR: str = ""
+    ANN_INDEX_DIR: str = ""
+    QUANTIZED_STORE_DIR: str = ""
+    EMBEDDING_ONNX_DIR: str = os.path.join(BASE_DIR, "revapp-gba", "onnx_models")
+    BM25_INDEX_PATH: str = ""  # Empty = CHROMA_DIR/bm25_index.json
+    PROFILE_DIR: str = ""  # Empty = CHROMA_DIR/profiles; profiles hold raw query text
+    
+    # Food-mood analytics from the app database (empty URL = off)
+    ANALYTICS_DATABASE_URL: str = ""  # sqlite:///path.db or postgresql://...
+    # user_data.user_id is not authenticated by this API; only enable behind
+    # a gateway that sets it from the caller's session
+    ANALYTICS_TRUST_USER_ID: bool = False
+    ANALYTICS_REFRESH_INTERVAL_SECONDS: float = 300.0
+    ANALYTICS_WINDOW_DAYS: int = 90  # Only recent logs are used
+    ANALYTICS_LAG_DAYS: List[int] = [0, 1, 2]  # Days between eating and mood
+    ANALYTICS_MIN_DAYS: int = 3  # Days with and without a food to report it
+    ANALYTICS_MIN_CORRELATION: float = 0.3
     
     # Supabase (for future user data integration)
     SUPABASE_URL: str = ""
@@ -53,6 +157,40 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         case_sensitive = True
+    
+    def chroma_path(self, value: str, name: str) -> str:
+        """An explicitly set path, or `name` inside the current CHROMA_DIR"""
+        return value or os.path.join(self.CHROMA_DIR, name)
+    
+    @property
+    def snapshot_dir(self) -> str:
+        """SNAPSHOT_DIR, or CHROMA_DIR/snapshot"""
+        return self.chroma_path(self.SNAPSHOT_DIR, "snapshot")
+    
+    @property
+    def ann_index_dir(self) -> str:
+        """ANN_INDEX_DIR, or CHROMA_DIR/ann_index"""
+        return self.chroma_path(self.ANN_INDEX_DIR, "ann_index")
+    
+    @property
+    def quantized_store_dir(self) -> str:
+        """QUANTIZED_STORE_DIR, or CHROMA_DIR/quantized"""
+        return self.chroma_path(self.QUANTIZED_STORE_DIR, "quantized")
+    
+    @property
+    def bm25_index_path(self) -> str:
+        """BM25_INDEX_PATH, or CHROMA_DIR/bm25_index.json"""
+        return self.chroma_path(self.BM25_INDEX_PATH, "bm25_index.json")
+    
+    @property
+    def profile_dir(self) -> str:
+        """PROFILE_DIR, or CHROMA_DIR/profiles"""
+        return self.chroma_path(self.PROFILE_DIR, "profiles")
+    
+    @property
+    def llm_providers(self) -> List[str]:
+        """LLM_PROVIDERS, or just LLM_PROVIDER"""
+        return self.LLM_PROVIDERS or [self.LLM_PROVIDER]
 
 
 # Create global settings instance
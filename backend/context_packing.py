@@ -0,0 +1,197 @@
+"""
+Token-budget-aware context assembly
+
+Retrieved chunks are cut with CHUNK_OVERLAP characters of overlap, so
+neighbouring chunks of the same page repeat text, and the "stuff" prompt
+has no limit on its size. pack_context() merges overlapping chunks into
+continuous passages, drops chunks already contained in another one, and
+packs passages in rank order into a token budget, trimming the last one at
+a sentence boundary. Fewer prompt tokens means less prefill time.
+"""
+
+from dataclasses import dataclass, field
+import re
+from typing import List, Any, Callable, Optional, Tuple
+
+from metrics import estimate_tokens
+
+MIN_OVERLAP_CHARS = 20  # Shorter suffix/prefix matches are coincidences
+MIN_TRIMMED_TOKENS = 32  # Don't add a trimmed passage shorter than this
+PASSAGE_SEPARATOR = "\n\n"
+
+SENTENCE_END = re.compile(r"[.!?](?:\s|$)")
+
+
+@dataclass
+class Passage:
+    """Continuous text from one page, built from one or more chunks"""
+    key: Tuple[Any, Any]  # (source, page)
+    text: str
+    rank: int  # Best (lowest) retrieval rank among its chunks
+    chunks: List[int] = field(default_factory=list)
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """
+    Length of the longest suffix of left that is a prefix of right.
+
+    Returns 0 if the overlap is shorter than MIN_OVERLAP_CHARS.
+    """
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(docs: List[Any], max_overlap: int) -> List[Passage]:
+    """
+    Merge retrieved chunks that overlap into passages.
+
+    Args:
+        docs: Retrieved documents, most relevant first
+        max_overlap: Largest overlap to look for (characters)
+
+    Returns:
+        Passages ordered by their best rank
+    """
+    passages: List[Passage] = []
+
+    for rank, doc in enumerate(docs):
+        text = doc.page_content.strip()
+        if not text:
+            continue
+
+        metadata = doc.metadata or {}
+        key = (metadata.get("source"), metadata.get("page"))
+        merged = False
+
+        for passage in passages:
+            if passage.key != key:
+                continue
+
+            if text in passage.text:
+                merged = True
+            elif passage.text in text:
+                passage.text = text
+                merged = True
+            else:
+                size = overlap_length(passage.text, text, max_overlap)
+                if size:
+                    passage.text += text[size:]
+                    merged = True
+                else:
+                    size = overlap_length(text, passage.text, max_overlap)
+                    if size:
+                        passage.text = text + passage.text[size:]
+                        merged = True
+
+            if merged:
+                passage.chunks.append(rank)
+                break
+
+        if not merged:
+            passages.append(Passage(key=key, text=text, rank=rank, chunks=[rank]))
+
+    # A merge can make two passages of the same page touch; merge again
+    # until nothing changes (a handful of passages, so this is cheap)
+    changed = True
+    while changed:
+        changed = False
+        for i, first in enumerate(passages):
+            for second in passages[i + 1:]:
+                if first.key != second.key:
+                    continue
+                size = overlap_length(first.text, second.text, max_overlap)
+                if size:
+                    first.text += second.text[size:]
+                else:
+                    size = overlap_length(second.text, first.text, max_overlap)
+                    if not size:
+                        continue
+                    first.text = second.text + first.text[size:]
+                first.rank = min(first.rank, second.rank)
+                first.chunks.extend(second.chunks)
+                passages.remove(second)
+                changed = True
+                break
+            if changed:
+                break
+
+    return sorted(passages, key=lambda passage: passage.rank)
+
+
+def trim_to_tokens(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Cut text to at most max_tokens, at the last sentence end if there is one"""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    # Binary search the longest prefix that fits
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+
+    prefix = text[:low]
+    ends = [match.end() for match in SENTENCE_END.finditer(prefix)]
+    if ends and ends[-1] > len(prefix) // 2:
+        prefix = prefix[:ends[-1]]
+    return prefix.rstrip()
+
+
+def document_order_key(key: Tuple[Any, Any], text: str) -> Tuple[str, int, str]:
+    """Sort key that puts passages in a fixed (source, page, text) order"""
+    source, page = key
+    return (str(source or ""), page if isinstance(page, int) else -1, text)
+
+
+def pack_context(
+    docs: List[Any],
+    max_tokens: int,
+    max_overlap: int,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    stable_order: bool = False
+) -> str:
+    """
+    Build the prompt context from retrieved documents within a token budget.
+
+    Args:
+        docs: Retrieved documents, most relevant first
+        max_tokens: Token budget for the whole context
+        max_overlap: Largest chunk overlap to merge (CHUNK_OVERLAP)
+        count_tokens: Token counter (defaults to an estimate)
+        stable_order: Output the selected passages in document order
+            instead of rank order, so queries that retrieve the same chunks
+            produce the same context text (and share a KV-cache prefix)
+
+    Returns:
+        Passages joined by blank lines
+    """
+    count_tokens = count_tokens or estimate_tokens
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+
+    selected: List[Tuple[Tuple[Any, Any], str]] = []
+    remaining = max_tokens
+
+    for passage in merge_chunks(docs, max_overlap):
+        cost = count_tokens(passage.text) + (separator_tokens if selected else 0)
+        if cost <= remaining:
+            selected.append((passage.key, passage.text))
+            remaining -= cost
+            continue
+
+        # Fill what is left with the start of this passage, then stop
+        available = remaining - (separator_tokens if selected else 0)
+        if available >= MIN_TRIMMED_TOKENS:
+            trimmed = trim_to_tokens(passage.text, available, count_tokens)
+            if trimmed:
+                selected.append((passage.key, trimmed))
+        break
+
+    if stable_order:
+        selected.sort(key=lambda item: document_order_key(*item))
+
+    return PASSAGE_SEPARATOR.join(text for _, text in selected)
@@ -0,0 +1,296 @@
+"""
+Embedding model backends
+
+The embedding model dominates memory and ingestion time. Two backends are
+available, selected with EMBEDDING_BACKEND:
+
+- huggingface: sentence-transformers on PyTorch (fp32), as before
+- onnx: the same model exported to ONNX and run with ONNX Runtime,
+  optionally with int8 dynamic quantization (EMBEDDING_QUANTIZE)
+
+Both honour EMBEDDING_THREADS (intra-op threads) and
+EMBEDDING_MAX_SEQ_LENGTH (longer inputs are truncated).
+
+The ONNX export needs PyTorch and sentence-transformers once; it is cached
+in EMBEDDING_ONNX_DIR, after which only onnxruntime and the tokenizer are
+loaded.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+from typing import List, Dict, Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = 1
+ONNX_BATCH_SIZE = 32
+
+
+def embedding_identity(settings) -> str:
+    """
+    Name of the configured embedding function, for the ingestion manifest.
+
+    Vectors from different backends, quantization or truncation are not
+    interchangeable, so changing any of them re-embeds the corpus. The
+    default backend keeps the bare model name.
+    """
+    identity = settings.EMBEDDING_MODEL
+    if settings.EMBEDDING_BACKEND != "huggingface":
+        identity += f"@{settings.EMBEDDING_BACKEND}"
+        if settings.EMBEDDING_QUANTIZE:
+            identity += "-int8"
+    if settings.EMBEDDING_MAX_SEQ_LENGTH > 0:
+        identity += f"/max{settings.EMBEDDING_MAX_SEQ_LENGTH}"
+    return identity
+
+
+def create_embeddings(settings) -> Embeddings:
+    """
+    Build the embedding model selected by EMBEDDING_BACKEND.
+
+    Args:
+        settings: Application settings
+
+    Returns:
+        A LangChain Embeddings implementation
+    """
+    if settings.EMBEDDING_BACKEND == "huggingface":
+        return _create_huggingface(settings)
+
+    if settings.EMBEDDING_BACKEND == "onnx":
+        model_dir = ensure_onnx_export(
+            settings.EMBEDDING_MODEL,
+            settings.EMBEDDING_ONNX_DIR,
+            quantize=settings.EMBEDDING_QUANTIZE
+        )
+        return OnnxEmbeddings(
+            model_dir,
+            quantized=settings.EMBEDDING_QUANTIZE,
+            threads=settings.EMBEDDING_THREADS,
+            max_seq_length=settings.EMBEDDING_MAX_SEQ_LENGTH
+        )
+
+    raise ValueError(f"Unsupported embedding backend: {settings.EMBEDDING_BACKEND}")
+
+
+def _create_huggingface(settings) -> Embeddings:
+    """sentence-transformers model on PyTorch"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if settings.EMBEDDING_THREADS > 0:
+        import torch
+        torch.set_num_threads(settings.EMBEDDING_THREADS)
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL,
+        model_kwargs={'device': settings.EMBEDDING_DEVICE}
+    )
+
+    if settings.EMBEDDING_MAX_SEQ_LENGTH > 0:
+        # The SentenceTransformer is a private attribute in recent releases
+        client = getattr(embeddings, "_client", None) or embeddings.client
+        client.max_seq_length = settings.EMBEDDING_MAX_SEQ_LENGTH
+
+    return embeddings
+
+
+def _export_dir(root: str, model_name: str) -> str:
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name))
+
+
+def ensure_onnx_export(model_name: str, root: str, quantize: bool = False) -> str:
+    """
+    Export a sentence-transformers model to ONNX unless it is already cached.
+
+    The export directory holds the transformer as model.onnx (and
+    model.int8.onnx when quantized), the tokenizer files, and
+    pipeline.json with the pooling mode, normalization and the model's
+    maximum sequence length.
+
+    Args:
+        model_name: sentence-transformers model name or path
+        root: Cache directory for exports
+        quantize: Also produce an int8 dynamically quantized model
+
+    Returns:
+        Export directory
+    """
+    export_dir = _export_dir(root, model_name)
+    pipeline_path = os.path.join(export_dir, "pipeline.json")
+
+    if not os.path.isfile(pipeline_path):
+        _export(model_name, export_dir)
+
+    quantized_path = os.path.join(export_dir, "model.int8.onnx")
+    if quantize and not os.path.isfile(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info("Quantizing ONNX embedding model to int8...")
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(
+            os.path.join(export_dir, "model.onnx"),
+            tmp_path,
+            weight_type=QuantType.QInt8
+        )
+        os.replace(tmp_path, quantized_path)
+        logger.info("✅ Quantized embedding model saved")
+
+    return export_dir
+
+
+def _export(model_name: str, export_dir: str):
+    """Export the transformer of a sentence-transformers model (needs PyTorch)"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    logger.info(f"Exporting {model_name} to ONNX (one-time)...")
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    if pooling is None:
+        raise ValueError(f"{model_name} has no pooling layer; cannot export it")
+
+    config = pooling.get_config_dict()
+    if config.get("pooling_mode_cls_token"):
+        pooling_mode = "cls"
+    elif config.get("pooling_mode_max_tokens"):
+        pooling_mode = "max"
+    else:
+        pooling_mode = "mean"
+
+    tmp_dir = f"{export_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(tmp_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Returns last_hidden_state only, for a single named output"""
+
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    wrapper = TokenEmbeddings(transformer.auto_model).eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            tuple(sample[name] for name in input_names),
+            os.path.join(tmp_dir, "model.onnx"),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    with open(os.path.join(tmp_dir, "pipeline.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": EXPORT_FORMAT,
+            "model": model_name,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(module, Normalize) for module in model),
+            "max_seq_length": model.max_seq_length,
+            "inputs": input_names,
+        }, f, indent=2)
+
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.replace(tmp_dir, export_dir)
+    logger.info(f"✅ ONNX embedding model exported to {export_dir}")
+
+
+class OnnxEmbeddings(Embeddings):
+    """sentence-transformers model exported to ONNX, run with ONNX Runtime"""
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        threads: int = 0,
+        max_seq_length: int = 0
+    ):
+        """
+        Args:
+            model_dir: Directory written by ensure_onnx_export
+            quantized: Use the int8 model
+            threads: Intra-op threads (0 = ONNX Runtime default)
+            max_seq_length: Truncate inputs to this many tokens
+                (0 = the model's own limit)
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, "pipeline.json"), "r", encoding="utf-8") as f:
+            self.pipeline: Dict[str, Any] = json.load(f)
+
+        if self.pipeline.get("format") != EXPORT_FORMAT:
+            raise ValueError(f"Unsupported ONNX export in {model_dir}; delete it to re-export")
+
+        model_limit = self.pipeline["max_seq_length"]
+        self.max_seq_length = min(max_seq_length, model_limit) if max_seq_length > 0 else model_limit
+
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        model_file = "model.int8.onnx" if quantized else "model.onnx"
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), ONNX_BATCH_SIZE):
+            vectors.extend(self._embed_batch(texts[start:start + ONNX_BATCH_SIZE]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.pipeline["inputs"]}
+        token_embeddings = self.session.run(["token_embeddings"], feeds)[0]
+
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooling = self.pipeline["pooling"]
+        if pooling == "cls":
+            vectors = token_embeddings[:, 0]
+        elif pooling == "max":
+            vectors = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            vectors = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.pipeline["normalize"]:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+        return vectors.astype(np.float32)
@@ -0,0 +1,153 @@
+"""
+Micro-batched query embeddings
+
+Transformer forward passes are much cheaper per item in batches. This
+module collects query-embedding requests that arrive within a short window
+(or until the batch is full), embeds them in one forward pass on a
+background thread, and hands each vector back to its waiting caller.
+"""
+
+from concurrent.futures import Future
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import List, Tuple, Dict, Any
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that batches concurrent embed_query calls.
+
+    Small embed_documents calls (up to one batch) go through the same queue,
+    so they are batched with concurrent queries too. Larger calls, such as
+    document ingestion, go straight to the wrapped model.
+    """
+
+    def __init__(self, base: Embeddings, window_ms: float, max_batch_size: int):
+        """
+        Args:
+            base: Embedding model that does the actual work
+            window_ms: How long to wait for more requests after the first one
+            max_batch_size: Flush as soon as this many requests are waiting
+        """
+        self.base = base
+        self.window = max(window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name="embedding-batcher",
+            daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, text: str) -> "Future[List[float]]":
+        """Queue a text for the next batch and return a future for its vector"""
+        future: "Future[List[float]]" = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, batched with any concurrent requests"""
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query without holding a thread while waiting for the batch"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents; small lists share a batch with concurrent queries"""
+        if len(texts) > self.max_batch_size:
+            return self.base.embed_documents(texts)
+
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_documents"""
+        if len(texts) > self.max_batch_size:
+            return await asyncio.to_thread(self.base.embed_documents, texts)
+
+        futures = [asyncio.wrap_future(self.submit(text)) for text in texts]
+        return list(await asyncio.gather(*futures))
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of batches run and their average size"""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            }
+
+    def close(self):
+        """Stop the background worker after pending requests are served"""
+        self._queue.put(_STOP)
+
+    def _run(self):
+        """Worker loop: collect a batch, embed it, resolve the futures"""
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch: List[Tuple[str, Future]]):
+        """Run one forward pass for a batch and resolve each waiting future"""
+        # Skip requests whose caller has already given up
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        # Identical texts in the same batch are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+
+        try:
+            vectors = self.base.embed_documents(unique_texts)
+        except Exception as e:
+            logger.error(f"Batched embedding failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        by_text: Dict[str, List[float]] = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            future.set_result(by_text[text])
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
@@ -0,0 +1,102 @@
+"""
+Extractive answers from retrieved chunks
+
+When the LLM cannot answer within the request's latency budget, the
+backend falls back to what retrieval already found: the sentences of the
+retrieved chunks that best match the question, ranked by the overlap of
+their terms with the question (weighted by how rare each term is among
+the candidate sentences) and by the rank of the chunk they came from.
+Costs microseconds, so the fallback itself never adds latency.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from bm25 import tokenize
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+MIN_SENTENCE_CHARS = 40  # Shorter fragments are headings, captions, page numbers
+CHUNK_RANK_DECAY = 0.15  # Score lost per retrieval rank of the source chunk
+
+EXTRACTIVE_PREFIX = (
+    "The full answer is taking longer than expected. "
+    "Here is what the research says about your question:"
+)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a chunk, whitespace-normalized"""
+    sentences = []
+    for sentence in SENTENCE_SPLIT.split(" ".join(text.split())):
+        if len(sentence) >= MIN_SENTENCE_CHARS:
+            sentences.append(sentence)
+    return sentences
+
+
+def rank_sentences(query: str, docs: List[Any]) -> List[Tuple[float, str, Dict[str, Any]]]:
+    """
+    Score every sentence of the retrieved chunks against the question.
+
+    Args:
+        query: User's question
+        docs: Retrieved documents, best first
+
+    Returns:
+        (score, sentence, metadata) tuples, best first; duplicates removed
+    """
+    candidates = []
+    seen = set()
+    for rank, doc in enumerate(docs):
+        for sentence in split_sentences(doc.page_content):
+            if sentence in seen:
+                continue  # Overlapping chunks repeat sentences
+            seen.add(sentence)
+            candidates.append((rank, sentence, doc.metadata or {}, set(tokenize(sentence))))
+
+    if not candidates:
+        return []
+
+    document_frequency = Counter(term for *_, terms in candidates for term in terms)
+    query_terms = set(tokenize(query))
+
+    scored = []
+    for rank, sentence, metadata, terms in candidates:
+        overlap = sum(
+            math.log(1 + len(candidates) / document_frequency[term])
+            for term in query_terms & terms
+        )
+        scored.append((overlap - CHUNK_RANK_DECAY * rank, sentence, metadata))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored
+
+
+def extractive_answer(query: str, docs: List[Any], max_sentences: int = 3) -> str:
+    """
+    A short answer quoted from the retrieved chunks.
+
+    Args:
+        query: User's question
+        docs: Retrieved documents, best first
+        max_sentences: Sentences to quote
+
+    Returns:
+        The answer text (a notice only, if nothing was retrieved)
+    """
+    ranked = rank_sentences(query, docs)[:max_sentences]
+    if not ranked:
+        return (
+            "The full answer is taking longer than expected, and no matching "
+            "research was found. Please try again in a moment."
+        )
+
+    lines = [EXTRACTIVE_PREFIX]
+    for _, sentence, metadata in ranked:
+        source = os.path.basename(str(metadata.get("source", "unknown")))
+        page = metadata.get("page")
+        citation = f"{source}, p. {page + 1}" if isinstance(page, int) else source
+        lines.append(f"- {sentence} ({citation})")
+    return "\n".join(lines)
@@ -0,0 +1,446 @@
+"""
+Incremental, content-addressed document ingestion
+
+Keeps the vectorstore in sync with a set of source documents (PDF, text or
+markdown files, or directories of them). Every chunk gets an ID derived
+from its source and content, and a manifest next to the vectorstore records
+which chunks each document produced. On each sync only new or changed
+chunks are embedded, chunks of removed documents are deleted, and unchanged
+documents are skipped without being parsed, so restarts do no extra work.
+
+Ingestion streams: PDF pages are parsed in a process pool a few pages at a
+time, chunks come out of a generator, and new chunks are embedded and
+written to Chroma in fixed-size batches. Peak memory depends on the batch
+size, not on the size of the corpus.
+"""
+
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process ingestion only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+# Chroma rejects very large upserts; write in slices of this size
+WRITE_BATCH_SIZE = 256
+
+
+@dataclass
+class IngestReport:
+    """Summary of one sync run"""
+    documents_unchanged: int = 0
+    documents_updated: int = 0
+    documents_removed: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.documents_updated or self.documents_removed)
+
+
+def resolve_sources(paths: List[str]) -> List[str]:
+    """
+    Expand files and directories into a sorted list of supported documents.
+
+    Args:
+        paths: Files or directories (searched recursively)
+
+    Returns:
+        Real paths of all supported documents found
+    """
+    sources = set()
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        sources.add(os.path.realpath(os.path.join(root, name)))
+        elif os.path.isfile(path):
+            sources.add(os.path.realpath(path))
+        else:
+            logger.warning(f"Document path not found: {path}")
+
+    return sorted(sources)
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, content: str) -> str:
+    """Content-addressed chunk ID, scoped to its source document"""
+    digest = hashlib.sha256()
+    digest.update(source.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def pdf_page_count(path: str) -> int:
+    """Number of pages in a PDF"""
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def parse_pdf_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract the text of pages [start, end) of a PDF.
+
+    Runs in worker processes, so it only takes and returns plain values.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    end = min(end, len(reader.pages))
+    return [(page, reader.pages[page].extract_text() or "") for page in range(start, end)]
+
+
+def iter_pages(
+    path: str,
+    pool: Optional[Executor] = None,
+    pages_per_task: int = 4,
+    max_pending: int = 8
+) -> Iterator[Document]:
+    """
+    Yield the pages of a document in order, like PyPDFLoader but lazily.
+
+    Args:
+        path: PDF, text or markdown file
+        pool: Process pool for PDF parsing (None = parse in this process)
+        pages_per_task: Pages parsed per pool task
+        max_pending: Tasks submitted ahead; bounds pages held in memory
+
+    Yields:
+        One Document per page (a single Document for text files)
+    """
+    if not path.lower().endswith(".pdf"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield Document(page_content=f.read(), metadata={"source": path})
+        return
+
+    page_count = pdf_page_count(path)
+    ranges = iter(range(0, page_count, pages_per_task))
+
+    if pool is None:
+        for start in ranges:
+            for page, text in parse_pdf_pages(path, start, start + pages_per_task):
+                yield Document(page_content=text, metadata={"source": path, "page": page})
+        return
+
+    pending: "deque[Future]" = deque()
+
+    def submit_next() -> bool:
+        start = next(ranges, None)
+        if start is None:
+            return False
+        pending.append(pool.submit(parse_pdf_pages, path, start, start + pages_per_task))
+        return True
+
+    while len(pending) < max_pending and submit_next():
+        pass
+
+    while pending:
+        pages = pending.popleft().result()
+        submit_next()
+        for page, text in pages:
+            yield Document(page_content=text, metadata={"source": path, "page": page})
+
+
+class DocumentIngestor:
+    """Syncs a vectorstore with source documents using a chunk manifest"""
+
+    MANIFEST_NAME = "ingest_manifest.json"
+    LOCK_NAME = "ingest.lock"
+
+    def __init__(
+        self,
+        vectorstore,
+        embeddings,
+        text_splitter,
+        persist_dir: str,
+        config: Dict[str, Any],
+        workers: int = 0,
+        batch_size: int = 64,
+        pages_per_task: int = 4
+    ):
+        """
+        Args:
+            vectorstore: LangChain Chroma vectorstore to write to
+            embeddings: Model used to embed new chunks
+            text_splitter: Splitter used to chunk pages
+            persist_dir: Directory for the manifest (the Chroma directory)
+            config: Settings that affect chunk content or vectors (embedding
+                model, chunk size...). If they change, everything is rebuilt.
+            workers: PDF parsing processes (0 = one per CPU, 1 = no pool)
+            batch_size: Chunks embedded and written per batch
+            pages_per_task: PDF pages parsed per pool task
+        """
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.text_splitter = text_splitter
+        self.persist_dir = persist_dir
+        self.config = config
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = max(batch_size, 1)
+        self.pages_per_task = max(pages_per_task, 1)
+        self.manifest_path = os.path.join(persist_dir, self.MANIFEST_NAME)
+
+    def sync(self, sources: List[str]) -> IngestReport:
+        """
+        Bring the vectorstore in line with the given documents.
+
+        Args:
+            sources: Real paths of the documents that should be indexed
+
+        Returns:
+            What changed
+        """
+        os.makedirs(self.persist_dir, exist_ok=True)
+
+        with self.lock():
+            manifest = self._load_manifest()
+            report = IngestReport()
+
+            if manifest is None or manifest.get("config") != self.config:
+                self._reset_collection()
+                manifest = {"version": MANIFEST_VERSION, "config": self.config, "documents": {}}
+
+            documents: Dict[str, Any] = manifest["documents"]
+
+            # Drop documents that are no longer configured
+            for source in sorted(set(documents) - set(sources)):
+                logger.info(f"Removing document: {source}")
+                removed = documents.pop(source)["chunks"]
+                self._delete(removed)
+                report.documents_removed += 1
+                report.chunks_removed += len(removed)
+                self._save_manifest(manifest)
+
+            changed = []
+            for source in sources:
+                digest = file_hash(source)
+                entry = documents.get(source)
+
+                if entry is not None and entry["sha256"] == digest:
+                    report.documents_unchanged += 1
+                else:
+                    changed.append((source, digest, entry))
+
+            if changed:
+                with self._parse_pool(changed) as pool:
+                    for source, digest, entry in changed:
+                        logger.info(f"Ingesting document: {source}")
+                        added, removed, chunk_ids = self._sync_document(
+                            source, self._iter_chunks(source, pool), entry
+                        )
+
+                        documents[source] = {"sha256": digest, "chunks": chunk_ids}
+                        report.documents_updated += 1
+                        report.chunks_added += added
+                        report.chunks_removed += removed
+
+                        # Save after every document so an interrupted run resumes
+                        self._save_manifest(manifest)
+
+            self._save_manifest(manifest)
+
+        logger.info(
+            f"Ingestion: {report.documents_updated} updated, "
+            f"{report.documents_unchanged} unchanged, {report.documents_removed} removed "
+            f"(+{report.chunks_added}/-{report.chunks_removed} chunks)"
+        )
+        return report
+
+    def version(self) -> str:
+        """Digest of the manifest; changes whenever the indexed chunks change"""
+        try:
+            with open(self.manifest_path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()[:16]
+        except FileNotFoundError:
+            return "empty"
+
+    def _iter_chunks(self, source: str, pool: Optional[Executor]) -> Iterator[Document]:
+        """Split pages into chunks as they are parsed"""
+        pages = iter_pages(
+            source,
+            pool=pool,
+            pages_per_task=self.pages_per_task,
+            max_pending=self.workers * 2
+        )
+        for page in pages:
+            yield from self.text_splitter.split_documents([page])
+
+    def _sync_document(
+        self,
+        source: str,
+        chunks: Iterable[Document],
+        entry: Optional[Dict[str, Any]]
+    ):
+        """
+        Write the new chunks of one document and delete its stale ones.
+
+        New chunks are embedded in batches; each batch is written to Chroma
+        on a writer thread while the next one is being embedded.
+
+        Returns:
+            (chunks added, chunks removed, all chunk IDs of the document)
+        """
+        old_ids = set(entry["chunks"]) if entry else set()
+        chunk_ids: List[str] = []
+        seen = set()
+        new_batch: List[Tuple[str, Document]] = []
+        kept_batch: List[Tuple[str, Document]] = []
+        added = 0
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer") as writer:
+            last_write: Optional[Future] = None
+
+            def flush_new():
+                nonlocal last_write, added
+                if not new_batch:
+                    return
+                vectors = self.embeddings.embed_documents([c.page_content for _, c in new_batch])
+                if last_write is not None:
+                    last_write.result()  # At most one batch in flight
+                last_write = writer.submit(self._write_batch, source, list(new_batch), vectors)
+                added += len(new_batch)
+                new_batch.clear()
+
+            for chunk in chunks:
+                cid = chunk_id(source, chunk.page_content)
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                chunk_ids.append(cid)
+
+                if cid in old_ids:
+                    # Unchanged content may have moved (e.g. page number); no re-embedding
+                    kept_batch.append((cid, chunk))
+                    if len(kept_batch) >= WRITE_BATCH_SIZE:
+                        self._update_metadata(source, kept_batch)
+                        kept_batch.clear()
+                else:
+                    new_batch.append((cid, chunk))
+                    if len(new_batch) >= self.batch_size:
+                        flush_new()
+
+            flush_new()
+            if last_write is not None:
+                last_write.result()
+
+        self._update_metadata(source, kept_batch)
+
+        stale_ids = sorted(old_ids - seen)
+        self._delete(stale_ids)
+
+        return added, len(stale_ids), chunk_ids
+
+    def _write_batch(self, source: str, batch: List[Tuple[str, Document]], vectors: List[List[float]]):
+        self.vectorstore._collection.upsert(
+            ids=[cid for cid, _ in batch],
+            embeddings=vectors,
+            metadatas=[self._metadata(chunk, source) for _, chunk in batch],
+            documents=[chunk.page_content for _, chunk in batch]
+        )
+
+    def _update_metadata(self, source: str, batch: List[Tuple[str, Document]]):
+        if batch:
+            self.vectorstore._collection.update(
+                ids=[cid for cid, _ in batch],
+                metadatas=[self._metadata(chunk, source) for _, chunk in batch]
+            )
+
+    @contextmanager
+    def _parse_pool(self, changed: List[Tuple[str, str, Any]]) -> Iterator[Optional[Executor]]:
+        """Process pool for PDF parsing, only if there is a PDF to parse"""
+        has_pdf = any(source.lower().endswith(".pdf") for source, _, _ in changed)
+        if self.workers <= 1 or not has_pdf:
+            yield None
+            return
+
+        # Spawn, not fork: this process already runs the RAG, embedding and
+        # torch threads, and a forked child can inherit a lock one of them held
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            yield pool
+
+    @staticmethod
+    def _metadata(chunk: Document, source: str) -> Dict[str, Any]:
+        metadata = {
+            key: value for key, value in (chunk.metadata or {}).items()
+            if isinstance(value, (str, int, float, bool))
+        }
+        metadata["source"] = source
+        return metadata
+
+    def _delete(self, ids: List[str]):
+        for start in range(0, len(ids), WRITE_BATCH_SIZE):
+            self.vectorstore.delete(ids=ids[start:start + WRITE_BATCH_SIZE])
+
+    def _reset_collection(self):
+        """Remove all vectors (no manifest yet, or chunking/embedding settings changed)"""
+        existing = self.vectorstore._collection.get(include=[])["ids"]
+        if existing:
+            logger.warning(
+                f"Vectorstore has {len(existing)} chunks without a matching manifest, rebuilding"
+            )
+            self._delete(existing)
+
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ingestion manifest is corrupt, rebuilding")
+            return None
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        """Write the manifest atomically"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Serialize syncs across processes (several uvicorn workers)"""
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(self.persist_dir, self.LOCK_NAME), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,455 @@
+"""
+Pooled, load-balanced LLM client for several Ollama servers
+
+One Ollama instance runs a fixed number of generations at a time, so it
+caps the throughput of the whole deployment. OllamaPool spreads
+generations over a list of Ollama servers:
+
+- Persistent keep-alive HTTP connections per server (httpx clients)
+- Least-outstanding-requests routing, with a cap on in-flight
+  generations per server; callers wait when every server is full
+- Servers that fail repeatedly are ejected and re-probed in the
+  background until they answer again
+- A generation that fails before its first token is retried on another
+  server
+
+PooledOllama wraps the pool as a LangChain LLM, speaking the same
+/api/generate protocol as langchain_community's Ollama class.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from typing import List, Optional, Dict, Any, Iterator, AsyncIterator, Tuple
+
+import httpx
+from langchain_core.callbacks import (
+    CallbackManagerForLLMRun,
+    AsyncCallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Ollama options that can be passed per call (e.g. invoke(prompt, num_predict=1))
+OLLAMA_OPTIONS = {
+    "num_ctx", "num_keep", "num_predict", "temperature", "top_k", "top_p", "repeat_penalty",
+    "repeat_last_n", "seed", "stop", "mirostat", "mirostat_eta", "mirostat_tau",
+    "num_gpu", "num_thread", "tfs_z",
+}
+
+
+class NoHealthyNodeError(RuntimeError):
+    """Every Ollama server in the pool is ejected"""
+
+
+class OllamaNode:
+    """One Ollama server: its connections, load and health"""
+
+    def __init__(self, base_url: str, max_in_flight: int, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+
+        limits = httpx.Limits(
+            max_connections=max_in_flight,
+            max_keepalive_connections=max_in_flight
+        )
+        timeout_config = httpx.Timeout(timeout, connect=5.0)
+        self.client = httpx.Client(base_url=self.base_url, limits=limits, timeout=timeout_config)
+        self.async_client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout_config)
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.outstanding < self.max_in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_in_flight": self.max_in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class OllamaPool:
+    """Routes generations to the least loaded healthy Ollama server"""
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        max_in_flight_per_node: int = 4,
+        eject_after_failures: int = 3,
+        probe_interval: float = 5.0,
+        timeout: float = 120.0
+    ):
+        """
+        Args:
+            base_urls: Ollama server URLs
+            max_in_flight_per_node: Generations sent to one server at a time
+                (match OLLAMA_NUM_PARALLEL on the server)
+            eject_after_failures: Consecutive failures before a server is ejected
+            probe_interval: Seconds between health probes of ejected servers
+            timeout: Read timeout for one generation (seconds)
+        """
+        if not base_urls:
+            raise ValueError("OllamaPool needs at least one base URL")
+
+        self.nodes = [OllamaNode(url, max(max_in_flight_per_node, 1), timeout) for url in base_urls]
+        self.eject_after_failures = max(eject_after_failures, 1)
+        self.probe_interval = probe_interval
+
+        self._lock = threading.Lock()
+        self._capacity = threading.Condition(self._lock)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._next = 0  # Round-robin tie breaker
+
+        self._closed = threading.Event()
+        self._prober = threading.Thread(target=self._probe_loop, name="ollama-prober", daemon=True)
+        self._prober.start()
+
+    # Routing
+
+    def _try_acquire(self, exclude: Optional[OllamaNode] = None) -> Optional[OllamaNode]:
+        """Reserve a slot on the least loaded available node (lock held by caller)"""
+        if not any(node.healthy for node in self.nodes):
+            raise NoHealthyNodeError("No healthy Ollama servers")
+
+        candidates = [node for node in self.nodes if node.available and node is not exclude]
+        if not candidates and exclude is not None and exclude.available:
+            # Retry on the same node only if it is the last healthy one
+            if not any(node.healthy for node in self.nodes if node is not exclude):
+                candidates = [exclude]
+        if not candidates:
+            return None
+
+        count = len(self.nodes)
+        node = min(
+            candidates,
+            key=lambda n: (n.outstanding, (self.nodes.index(n) - self._next) % count)
+        )
+        self._next = (self.nodes.index(node) + 1) % count
+        node.outstanding += 1
+        node.requests += 1
+        return node
+
+    def acquire(self, exclude: Optional[OllamaNode] = None) -> OllamaNode:
+        """Block until a node has a free slot and reserve it"""
+        with self._capacity:
+            while True:
+                node = self._try_acquire(exclude)
+                if node is not None:
+                    return node
+                # Wake up periodically in case a node was reinstated
+                self._capacity.wait(timeout=self.probe_interval)
+
+    async def aacquire(self, exclude: Optional[OllamaNode] = None) -> OllamaNode:
+        """Wait (without blocking the event loop) for a free slot and reserve it"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                node = self._try_acquire(exclude)
+                if node is not None:
+                    return node
+                # Registered under the lock that release() takes, so a slot
+                # freed right after the check still wakes this waiter
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+
+            try:
+                await asyncio.wait_for(waiter, timeout=self.probe_interval)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, node: OllamaNode, success: bool):
+        """Free a slot and record the outcome of the request"""
+        with self._capacity:
+            node.outstanding -= 1
+            if success:
+                node.consecutive_failures = 0
+            else:
+                node.failures += 1
+                node.consecutive_failures += 1
+                if node.healthy and node.consecutive_failures >= self.eject_after_failures:
+                    node.healthy = False
+                    logger.warning(f"Ejecting Ollama server {node.base_url} after {node.consecutive_failures} failures")
+
+            self._wake_all()
+
+    def _wake_all(self):
+        """
+        Make every waiting caller re-check for a free slot (lock held by caller).
+
+        Waking only one could hand the slot to a caller that is being
+        cancelled or that excludes the freed node, leaving the others
+        asleep until the next probe interval.
+        """
+        self._capacity.notify_all()
+        for loop, waiter in self._async_waiters:
+            if not waiter.done():
+                loop.call_soon_threadsafe(_resolve, waiter)
+        self._async_waiters.clear()
+
+    # Health
+
+    def _probe_loop(self):
+        """Re-probe ejected nodes until they answer again"""
+        while not self._closed.wait(self.probe_interval):
+            for node in self.nodes:
+                if node.healthy:
+                    continue
+                try:
+                    node.client.get("/api/version", timeout=2.0).raise_for_status()
+                except httpx.HTTPError:
+                    continue
+
+                with self._capacity:
+                    node.healthy = True
+                    node.consecutive_failures = 0
+                    self._wake_all()
+                logger.info(f"✅ Ollama server {node.base_url} is back in the pool")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [node.stats() for node in self.nodes]
+
+    def close(self):
+        """Stop probing and close all connections"""
+        self._closed.set()
+        for node in self.nodes:
+            node.client.close()
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                loop.create_task(node.async_client.aclose())
+
+
+def _is_client_error(error: Exception) -> bool:
+    """4xx responses (e.g. unknown model) are the request's fault, not the server's"""
+    return (
+        isinstance(error, httpx.HTTPStatusError)
+        and 400 <= error.response.status_code < 500
+    )
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class PooledOllama(LLM):
+    """
+    Ollama LLM that load-balances over an OllamaPool.
+
+    Generation options (num_ctx, temperature, ...) can be set as fields or
+    passed per call, e.g. llm.invoke(prompt, num_predict=1).
+    """
+
+    model: str
+    base_urls: List[str]
+    temperature: Optional[float] = None
+    num_ctx: Optional[int] = None
+    num_keep: Optional[int] = None  # Prompt tokens kept when the context window shifts
+    keep_alive: Optional[str] = None  # How long Ollama keeps the model loaded, e.g. "30m"
+    max_in_flight_per_node: int = 4
+    eject_after_failures: int = 3
+    probe_interval: float = 5.0
+    request_timeout: float = 120.0
+    max_attempts: int = 2  # Servers tried before giving up (only before the first token)
+
+    _pool: OllamaPool = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._pool = OllamaPool(
+            self.base_urls,
+            max_in_flight_per_node=self.max_in_flight_per_node,
+            eject_after_failures=self.eject_after_failures,
+            probe_interval=self.probe_interval,
+            timeout=self.request_timeout
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-pool"
+
+    @property
+    def pool(self) -> OllamaPool:
+        return self._pool
+
+    def _payload(self, prompt: str, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        if self.num_ctx is not None:
+            options["num_ctx"] = self.num_ctx
+        if self.num_keep is not None:
+            options["num_keep"] = self.num_keep
+        options.update(kwargs.get("options") or {})
+        options.update({key: value for key, value in kwargs.items() if key in OLLAMA_OPTIONS})
+        if stop:
+            options["stop"] = stop
+
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "options": options}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[Dict[str, Any]]:
+        if not line:
+            return None
+        data = json.loads(line)
+        if "error" in data:
+            raise RuntimeError(f"Ollama error: {data['error']}")
+        return data
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        payload = self._payload(prompt, stop, kwargs)
+        node = None
+
+        for attempt in range(self.max_attempts):
+            node = self._pool.acquire(exclude=node)
+            started = False
+            # A stream closed early by the caller is not the server's fault
+            success = True
+            try:
+                with node.client.stream("POST", "/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        data = self._parse_line(line)
+                        if data is None:
+                            continue
+                        if data.get("response"):
+                            started = True
+                            chunk = GenerationChunk(text=data["response"])
+                            if run_manager:
+                                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                            yield chunk
+                        if data.get("done"):
+                            break
+                return
+            except Exception as e:
+                # Any error (HTTP, Ollama error line, malformed JSON) counts
+                # against the server; only 4xx responses are the request's fault
+                success = _is_client_error(e)
+                if success or started or attempt == self.max_attempts - 1:
+                    raise
+                logger.warning(f"Ollama server {node.base_url} failed ({e}), retrying on another server")
+            finally:
+                self._pool.release(node, success)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[GenerationChunk]:
+        payload = self._payload(prompt, stop, kwargs)
+        node = None
+
+        for attempt in range(self.max_attempts):
+            node = await self._pool.aacquire(exclude=node)
+            started = False
+            # A stream cancelled by the caller is not the server's fault
+            success = True
+            try:
+                async with node.async_client.stream("POST", "/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        data = self._parse_line(line)
+                        if data is None:
+                            continue
+                        if data.get("response"):
+                            started = True
+                            chunk = GenerationChunk(text=data["response"])
+                            if run_manager:
+                                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                            yield chunk
+                        if data.get("done"):
+                            break
+                return
+            except Exception as e:
+                # Any error (HTTP, Ollama error line, malformed JSON) counts
+                # against the server; only 4xx responses are the request's fault
+                success = _is_client_error(e)
+                if success or started or attempt == self.max_attempts - 1:
+                    raise
+                logger.warning(f"Ollama server {node.base_url} failed ({e}), retrying on another server")
+            finally:
+                self._pool.release(node, success)
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        parts = []
+        async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+            parts.append(chunk.text)
+        return "".join(parts)
+
+    def keep_warm(self) -> int:
+        """
+        Ask every healthy server to load the model and restart its keep-alive timer.
+
+        An empty prompt loads the model without generating, so this does
+        not take a generation slot.
+
+        Returns:
+            Number of servers that answered
+        """
+        payload: Dict[str, Any] = {"model": self.model, "prompt": "", "stream": False}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        warmed = 0
+        for node in self._pool.nodes:
+            if not node.healthy:
+                continue
+            try:
+                node.client.post("/api/generate", json=payload).raise_for_status()
+                warmed += 1
+            except httpx.HTTPError as e:
+                logger.warning(f"Keep-warm request to {node.base_url} failed: {e}")
+        return warmed
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Load and health of every server"""
+        return self._pool.stats()
+
+    def close(self):
+        self._pool.close()
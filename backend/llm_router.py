@@ -0,0 +1,465 @@
+"""
+Hedged, failover generation across several LLM providers
+
+With one provider, a stalled provider stalls every request. RoutedLLM
+puts an ordered list of providers (e.g. local Ollama first, Groq second)
+behind one LangChain LLM:
+
+- Hedging: if the provider serving a request has not produced its first
+  token within the LLM_HEDGE_PERCENTILE of its recent time to first token,
+  the same prompt is sent to the next provider. The first one to produce a
+  token serves the request; the other is cancelled.
+- Failover: a provider that fails before its first token is replaced by
+  the next one. Errors after the first token are raised, since part of
+  the answer has already been sent.
+- Circuit breaking: LLM_CIRCUIT_FAILURES consecutive failures open a
+  provider's circuit. It is skipped for LLM_CIRCUIT_COOLDOWN_SECONDS, then
+  one trial request is let through (half-open) to decide whether to close
+  it again.
+
+router_stats() reports, per provider, requests, failures, circuit state
+and time to first token, and how often hedging fired and won. The time a
+winning hedge saved is estimated from the primary's recent first tokens
+slower than the point where the hedge answered; hedged stalls are cut
+short, so those are rare and wins without such a sample are counted
+separately (benchmarks/hedge_bench.py measures the saving directly).
+"""
+
+import asyncio
+from collections import deque
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Set
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class NoProviderAvailableError(RuntimeError):
+    """Every provider's circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial request"""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may use this provider now (claims the trial when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+            if self.state != CLOSED:
+                logger.info(f"✅ LLM provider {self.name} recovered, circuit closed")
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(
+                        f"LLM provider {self.name} failed {self.consecutive_failures} times, "
+                        f"circuit open for {self.cooldown:g}s"
+                    )
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def record_cancelled(self):
+        """A request was cancelled before it told us anything"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_llm_circuit_state(self.name, CIRCUIT_STATES[state])
+
+
+class LatencyWindow:
+    """Recent time-to-first-token samples of one provider"""
+
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+        return ordered[index]
+
+    def mean_above(self, seconds: float) -> Optional[float]:
+        """Mean of the samples slower than `seconds`, or None if there are none"""
+        slower = [sample for sample in self.samples if sample > seconds]
+        return sum(slower) / len(slower) if slower else None
+
+
+class _Route:
+    """One provider with its breaker, latency window and counters"""
+
+    def __init__(self, name: str, llm: Any, breaker: CircuitBreaker, window: int):
+        self.name = name
+        self.llm = llm
+        self.breaker = breaker
+        self.ttft = LatencyWindow(window)
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0
+
+    def stats(self) -> Dict[str, Any]:
+        samples = len(self.ttft.samples)
+        return {
+            "provider": self.name,
+            "circuit": self.breaker.state,
+            "requests": self.requests,
+            "failures": self.failures,
+            "served": self.wins,
+            "ttft_p50_ms": round(self.ttft.percentile(50) * 1000.0, 1) if samples else None,
+            "ttft_p95_ms": round(self.ttft.percentile(95) * 1000.0, 1) if samples else None,
+        }
+
+
+class _Attempt:
+    """One provider's stream for a request, and its pending first chunk"""
+
+    def __init__(self, route: _Route, stream: AsyncIterator[Any], hedge: bool):
+        self.route = route
+        self.stream = stream
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.first = asyncio.ensure_future(anext(stream, None))
+
+    async def close(self):
+        """Stop the stream, including a first read still pending"""
+        if not self.first.done():
+            self.first.cancel()
+            # The generator is still running until the cancelled read returns
+            await asyncio.wait({self.first})
+        try:
+            await self.stream.aclose()
+        except Exception as e:
+            logger.debug(f"Closing {self.route.name} stream failed: {e}")
+
+
+def _chunk_text(chunk: Any) -> str:
+    """Text of a chunk from an LLM (str) or a chat model (message chunk)"""
+    if isinstance(chunk, str):
+        return chunk
+    return getattr(chunk, "content", "") or ""
+
+
+class RoutedLLM(LLM):
+    """
+    LangChain LLM that hedges and fails over across several providers.
+
+    providers and names are parallel lists, in order of preference.
+    """
+
+    providers: List[Any]
+    names: List[str]
+    hedge_percentile: float = 95.0  # 0 = never hedge
+    hedge_min_delay: float = 0.2  # Never hedge sooner than this (seconds)
+    hedge_initial_delay: float = 2.0  # Hedge delay until min_latency_samples are known
+    min_latency_samples: int = 20
+    latency_window: int = 200  # TTFT samples kept per provider
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+
+    _routes: List[_Route] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _hedges: Dict[str, float] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if len(self.providers) != len(self.names) or not self.providers:
+            raise ValueError("RoutedLLM needs one name per provider and at least one provider")
+        self._routes = [
+            _Route(name, llm, CircuitBreaker(name, self.failure_threshold, self.cooldown), self.latency_window)
+            for name, llm in zip(self.names, self.providers)
+        ]
+        self._lock = threading.Lock()
+        self._hedges = {"fired": 0, "won": 0, "lost": 0, "unestimated": 0, "saved_seconds": 0.0}
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def _next_route(self, tried: Set[str]) -> Optional[_Route]:
+        """Most preferred provider not yet tried whose circuit lets a request through"""
+        for route in self._routes:
+            if route.name not in tried and route.breaker.allow():
+                tried.add(route.name)
+                route.requests += 1
+                return route
+        return None
+
+    def _hedge_delay(self, route: _Route) -> Optional[float]:
+        """Seconds without a first token after which to hedge, or None"""
+        if self.hedge_percentile <= 0 or len(self._routes) < 2:
+            return None
+        if len(route.ttft.samples) < self.min_latency_samples:
+            return self.hedge_initial_delay
+        return max(self.hedge_min_delay, route.ttft.percentile(self.hedge_percentile))
+
+    def _record_failure(self, route: _Route, error: BaseException):
+        logger.warning(f"LLM provider {route.name} failed: {error}")
+        route.failures += 1
+        route.breaker.record_failure()
+        metrics.record_llm_provider_failure(route.name)
+
+    def _record_hedge(self, outcome: str, saved: Optional[float] = None):
+        with self._lock:
+            self._hedges[outcome] += 1
+            if outcome == "won" and saved is None:
+                self._hedges["unestimated"] += 1
+            self._hedges["saved_seconds"] += saved or 0.0
+        metrics.record_llm_hedge(outcome, saved or 0.0)
+
+    async def _first_token(
+        self,
+        prompt: str,
+        stop: Optional[List[str]],
+        kwargs: Dict[str, Any]
+    ) -> "tuple[_Attempt, Any]":
+        """
+        Race providers for the first chunk (hedging and failing over).
+
+        Returns:
+            The winning attempt and its first chunk (None for an empty answer)
+        """
+        tried: Set[str] = set()
+        attempts: List[_Attempt] = []
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def start(hedge: bool) -> Optional[_Attempt]:
+            route = self._next_route(tried)
+            if route is None:
+                return None
+            attempt = _Attempt(route, route.llm.astream(prompt, stop=stop, **kwargs), hedge)
+            attempts.append(attempt)
+            return attempt
+
+        primary = start(hedge=False)
+        if primary is None:
+            raise NoProviderAvailableError("All LLM providers are unavailable (circuits open)")
+        hedge_delay = self._hedge_delay(primary.route)
+
+        winner = None
+        try:
+            while winner is None:
+                pending = [attempt for attempt in attempts if not attempt.first.done()]
+                timeout = None
+                if not hedged and hedge_delay is not None:
+                    timeout = max(primary.started + hedge_delay - time.monotonic(), 0.0)
+
+                if pending:
+                    await asyncio.wait(
+                        {attempt.first for attempt in pending},
+                        timeout=timeout,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                finished = [attempt for attempt in pending if attempt.first.done()]
+                if not finished and pending:
+                    # Primary is slower than usual: send the prompt to the next provider
+                    hedged = True
+                    if start(hedge=True) is not None:
+                        logger.info(f"Hedging LLM request after {hedge_delay:.2f}s without a token")
+                        self._record_hedge("fired")
+                    continue
+
+                for attempt in finished:
+                    error = attempt.first.exception()
+                    if error is None:
+                        winner = attempt
+                        break
+                    last_error = error
+                    self._record_failure(attempt.route, error)
+                    attempts.remove(attempt)
+
+                if winner is None and not any(not attempt.first.done() for attempt in attempts):
+                    # Everything started so far failed: fail over
+                    replacement = start(hedge=hedged)
+                    if replacement is None:
+                        raise last_error or NoProviderAvailableError("No LLM provider answered")
+                    if not hedged:
+                        primary = replacement
+                        hedge_delay = self._hedge_delay(primary.route)
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.route.breaker.record_cancelled()
+                    await attempt.close()
+
+        # A first token is enough to call the provider healthy
+        winner.route.breaker.record_success()
+        winner.route.ttft.add(time.monotonic() - winner.started)
+        winner.route.wins += 1
+        if hedged and len(attempts) > 1:
+            if winner.hedge:
+                # The primary had no token yet; estimate when it would have
+                waited = time.monotonic() - primary.started
+                expected = primary.route.ttft.mean_above(waited)
+                self._record_hedge("won", None if expected is None else expected - waited)
+            else:
+                self._record_hedge("lost")
+        return winner, winner.first.result()
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[GenerationChunk]:
+        attempt, chunk = await self._first_token(prompt, stop, kwargs)
+        try:
+            while chunk is not None:
+                text = _chunk_text(chunk)
+                if text:
+                    generation = GenerationChunk(text=text)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text, chunk=generation)
+                    yield generation
+                chunk = await anext(attempt.stream, None)
+        except Exception as e:
+            self._record_failure(attempt.route, e)
+            raise
+        finally:
+            await attempt.stream.aclose()
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        parts = []
+        async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+            parts.append(chunk.text)
+        return "".join(parts)
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        # Blocking callers (warm-up, scripts) get failover without hedging
+        tried: Set[str] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            route = self._next_route(tried)
+            if route is None:
+                raise last_error or NoProviderAvailableError("All LLM providers are unavailable (circuits open)")
+            started = False
+            try:
+                for chunk in route.llm.stream(prompt, stop=stop, **kwargs):
+                    if not started:
+                        started = True
+                        route.breaker.record_success()
+                        route.wins += 1
+                    text = _chunk_text(chunk)
+                    if text:
+                        generation = GenerationChunk(text=text)
+                        if run_manager:
+                            run_manager.on_llm_new_token(text, chunk=generation)
+                        yield generation
+                if not started:
+                    route.breaker.record_success()
+                    route.wins += 1
+                return
+            except GeneratorExit:
+                if not started:
+                    route.breaker.record_cancelled()
+                raise
+            except Exception as e:
+                self._record_failure(route, e)
+                if started:
+                    raise
+                last_error = e
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def keep_warm(self) -> int:
+        """Keep-warm every provider that supports it; returns servers warmed"""
+        warmed = 0
+        for route in self._routes:
+            keep_warm = getattr(route.llm, "keep_warm", None)
+            if callable(keep_warm):
+                warmed += keep_warm()
+        return warmed
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Load and health of every Ollama server behind the router"""
+        nodes = []
+        for route in self._routes:
+            stats = getattr(route.llm, "stats", None)
+            if callable(stats):
+                nodes.extend(stats())
+        return nodes
+
+    def router_stats(self) -> Dict[str, Any]:
+        """Per-provider counters and hedging outcomes"""
+        with self._lock:
+            hedges = dict(self._hedges)
+        return {
+            "providers": [route.stats() for route in self._routes],
+            "hedges_fired": int(hedges["fired"]),
+            "hedges_won": int(hedges["won"]),
+            "hedges_lost": int(hedges["lost"]),
+            "estimated_saved_ms": round(hedges["saved_seconds"] * 1000.0, 1),
+            "hedges_won_without_estimate": int(hedges["unestimated"]),
+        }
+
+    def close(self):
+        for route in self._routes:
+            close = getattr(route.llm, "close", None)
+            if callable(close):
+                close()
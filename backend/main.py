@@ -5,14 +5,24 @@ This server provides a persistent Python backend for the RAG system,
 eliminating the need to spawn new processes on every request.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import json
 import logging
-from typing import Optional
+import time
+from typing import Optional, Dict, Any, AsyncIterator
 
-from models import QueryRequest, QueryResponse, HealthResponse
+import metrics
+from models import (
+    QueryRequest, BatchQueryRequest, QueryResponse, HealthResponse,
+    ProfileRequest, ProfileResponse
+)
 from rag_system import RAGSystem
+from scheduler import QueueFullError, DeadlineExceededError, deadline_after
 from config import settings
 
 # Set up logging
@@ -22,8 +32,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global RAG system instance
+# Global RAG system instance (None until startup finishes)
 rag_system: Optional[RAGSystem] = None
+startup_error: Optional[str] = None
+startup_task: Optional[asyncio.Task] = None
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+async def start_rag_system():
+    """Load the RAG system (and warm it up) without blocking the event loop"""
+    global rag_system, startup_error
+    
+    started = time.monotonic()
+    try:
+        # Initialize RAG system ONCE at startup
+        system = await asyncio.to_thread(RAGSystem)
+        
+        if settings.WARMUP_ON_STARTUP:
+            await asyncio.to_thread(system.warm_up)
+        
+        rag_system = system
+        logger.info(f"✅ RAG System ready in {time.monotonic() - started:.1f}s")
+        
+    except Exception as e:
+        startup_error = str(e)
+        logger.error(f"❌ Failed to initialize RAG system: {e}")
+        if not settings.BACKGROUND_STARTUP:
+            raise
+
+
+async def keep_llm_warm():
+    """Periodically ask the LLM server(s) to keep the model loaded"""
+    while True:
+        await asyncio.sleep(settings.OLLAMA_KEEP_WARM_INTERVAL_SECONDS)
+        if rag_system is None:
+            continue
+        try:
+            await asyncio.to_thread(rag_system.keep_warm)
+        except Exception as e:
+            logger.warning(f"Keep-warm failed: {e}")
+
+
+async def refresh_analytics():
+    """Periodically load new food and mood logs into the analytics"""
+    while True:
+        await asyncio.sleep(settings.ANALYTICS_REFRESH_INTERVAL_SECONDS)
+        if rag_system is None:
+            continue
+        try:
+            await asyncio.to_thread(rag_system.refresh_analytics)
+        except Exception as e:
+            logger.warning(f"Analytics refresh failed: {e}")
 
 
 @asynccontextmanager
@@ -31,25 +91,116 @@ async def lifespan(app: FastAPI):
     """
     Lifespan context manager for FastAPI.
     Loads the RAG system once at startup and keeps it in memory.
+    
+    With BACKGROUND_STARTUP the server starts answering /health/live right
+    away while the models load; /health/ready turns green when they are in.
     """
-    global rag_system
+    global startup_task
     
     logger.info("🚀 Starting gutSync Backend Server...")
     logger.info(f"Environment: {settings.ENVIRONMENT}")
-    logger.info(f"Using LLM: {settings.LLM_PROVIDER}")
+    logger.info(f"Using LLM: {', '.join(settings.llm_providers)}")
     
-    try:
-        # Initialize RAG system ONCE at startup
-        rag_system = RAGSystem()
-        logger.info("✅ RAG System initialized successfully")
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize RAG system: {e}")
-        raise
+    if settings.BACKGROUND_STARTUP:
+        startup_task = asyncio.create_task(start_rag_system())
+    else:
+        await start_rag_system()
+    
+    keep_warm_task = None
+    if "ollama" in settings.llm_providers and settings.OLLAMA_KEEP_WARM_INTERVAL_SECONDS > 0:
+        keep_warm_task = asyncio.create_task(keep_llm_warm())
+    
+    analytics_task = None
+    if (
+        settings.ANALYTICS_DATABASE_URL
+        and settings.ANALYTICS_TRUST_USER_ID
+        and settings.ANALYTICS_REFRESH_INTERVAL_SECONDS > 0
+    ):
+        analytics_task = asyncio.create_task(refresh_analytics())
     
     yield  # Server runs here
     
     # Cleanup on shutdown
     logger.info("🛑 Shutting down gutSync Backend Server...")
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    if keep_warm_task is not None:
+        keep_warm_task.cancel()
+    if analytics_task is not None:
+        analytics_task.cancel()
+    if rag_system is not None:
+        rag_system.shutdown()
+
+
+def require_rag_system() -> RAGSystem:
+    """Return the RAG system, or fail with 503 while it is starting"""
+    if rag_system is None:
+        detail = (
+            f"RAG system failed to start: {startup_error}" if startup_error
+            else "RAG system not initialized"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": "5"}
+        )
+    return rag_system
+
+
+def admit(system: RAGSystem, priority: str):
+    """Reject with 503 + Retry-After if the query queue is full"""
+    if system.scheduler.is_full(priority):
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, too many queued requests",
+            headers={"Retry-After": str(settings.SCHEDULER_RETRY_AFTER_SECONDS)}
+        )
+
+
+def require_admin(http_request: Request):
+    """
+    Check the admin bearer token.
+    
+    Raises:
+        HTTPException: 404 if ADMIN_TOKEN is unset, 401 if the token is wrong
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    
+    scheme, _, token = http_request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid admin token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+async def cancel_on_disconnect(http_request: Request, awaitable) -> Any:
+    """
+    Await a request's work, cancelling it if the client disconnects.
+    
+    Frees the query slot (or queue place) of abandoned requests instead of
+    generating an answer nobody reads.
+    
+    Raises:
+        HTTPException: 499 if the client went away
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling query")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
 
 
 # Create FastAPI app
@@ -82,45 +233,132 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Detailed health check"""
-    if rag_system is None:
-        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    """Detailed health check (same as readiness)"""
+    return await readiness_check()
+
+
+@app.get("/health/live", response_model=HealthResponse)
+async def liveness_check():
+    """
+    Liveness probe: the process is up and serving.
+    
+    Stays green while models are loading; fails only if startup failed,
+    so the container gets restarted.
+    """
+    if startup_error:
+        raise HTTPException(status_code=503, detail=f"Startup failed: {startup_error}")
+    
+    return {
+        "status": "alive",
+        "rag_initialized": rag_system is not None
+    }
+
+
+@app.get("/health/ready", response_model=HealthResponse)
+async def readiness_check():
+    """Readiness probe: the RAG system is loaded and warmed up"""
+    system = require_rag_system()
     
     return {
         "status": "healthy",
         "rag_initialized": True,
-        "vectorstore_documents": rag_system.get_document_count()
+        "vectorstore_documents": system.get_document_count(),
+        "answer_cache": system.get_cache_stats(),
+        "llm_servers": system.get_llm_stats(),
+        "llm_router": system.get_llm_router_stats()
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics for this worker"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    
+    # Sizes are read at scrape time instead of on every change
+    if rag_system is not None:
+        metrics.VECTORSTORE_CHUNKS.set(rag_system.get_document_count())
+        cache_stats = rag_system.get_cache_stats()
+        if cache_stats is not None:
+            metrics.CACHE_ENTRIES.set(cache_stats["entries"])
+        for node in rag_system.get_llm_stats() or []:
+            metrics.LLM_NODE_OUTSTANDING.set(node["outstanding"], node=node["url"])
+            metrics.LLM_NODE_HEALTHY.set(1 if node["healthy"] else 0, node=node["url"])
+    
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.post("/admin/profile", response_model=ProfileResponse)
+async def arm_profiles(request: ProfileRequest, http_request: Request):
+    """Profile the next `count` /query calls of this worker"""
+    require_admin(http_request)
+    system = require_rag_system()
+    armed = system.profiler.arm(request.count)
+    logger.info(f"Profiling armed for the next {armed} queries")
+    return {"armed": armed, "profiles": system.profiler.saved()}
+
+
+@app.get("/admin/profile", response_model=ProfileResponse)
+async def list_profiles(http_request: Request):
+    """Queries still armed and the newest saved profiles of this worker"""
+    require_admin(http_request)
+    system = require_rag_system()
+    return {"armed": system.profiler.armed, "profiles": system.profiler.saved()}
+
+
 @app.post("/query", response_model=QueryResponse)
-async def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest, http_request: Request):
     """
     Main RAG query endpoint.
     
     Accepts a user query and optional user context data,
     returns a personalized AI-generated insight.
+    
+    Fails with 503 (and Retry-After) when the query queue is full and
+    with 504 when the deadline passes. A client that disconnects cancels
+    its query.
     """
-    if rag_system is None:
-        raise HTTPException(
-            status_code=503,
-            detail="RAG system not initialized"
-        )
+    system = require_rag_system()
+    admit(system, request.priority)
     
     try:
         logger.info(f"Processing query: {request.query[:50]}...")
         
-        # Get insights from RAG system
-        response = rag_system.get_insights(
+        # Get insights from RAG system (runs off the event loop)
+        result = await cancel_on_disconnect(http_request, system.aquery(
             query=request.query,
-            user_data=request.user_data
-        )
+            user_data=request.user_data,
+            priority=request.priority,
+            deadline=deadline_after(request.timeout_seconds or settings.REQUEST_TIMEOUT_SECONDS),
+            latency_budget=request.latency_budget_seconds
+        ))
         
         return {
-            "response": response,
-            "status": "success"
+            "response": result.response,
+            "status": result.status,
+            "sources": result.sources,
+            "cached": result.cached,
+            "coalesced": result.coalesced,
+            "degraded": result.degraded,
+            "timings_ms": result.timings
         }
     
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    
+    except HTTPException:
+        raise
+    
     except Exception as e:
         logger.error(f"Error processing query: {e}", exc_info=True)
         raise HTTPException(
@@ -130,18 +368,111 @@ async def query_rag(request: QueryRequest):
 
 
 @app.post("/query/stream")
-async def query_rag_stream(request: QueryRequest):
+async def query_rag_stream(request: QueryRequest, http_request: Request):
     """
     Streaming version of the query endpoint.
     Returns Server-Sent Events for real-time streaming responses.
+    
+    Events, in order:
+    - sources: metadata of the retrieved research chunks
+    - token: one generated text fragment (repeated)
+    - done / error: end of the stream
+    
+    Fails with 503 (and Retry-After) when the query queue is full; a
+    deadline that passes ends the stream with an error event.
     """
-    # TODO: Implement streaming in future iteration
-    raise HTTPException(
-        status_code=501,
-        detail="Streaming not yet implemented"
+    system = require_rag_system()
+    admit(system, request.priority)
+    
+    logger.info(f"Processing streaming query: {request.query[:50]}...")
+    deadline = deadline_after(request.timeout_seconds or settings.REQUEST_TIMEOUT_SECONDS)
+    
+    async def event_stream() -> AsyncIterator[str]:
+        events = system.stream_insights(
+            query=request.query,
+            user_data=request.user_data,
+            priority=request.priority,
+            deadline=deadline,
+            latency_budget=request.latency_budget_seconds
+        )
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, stopping generation")
+                    break
+                yield format_sse(event)
+        finally:
+            # Closing the generator closes the LLM stream as well
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering (nginx)
+        }
     )
 
 
+@app.post("/query/batch")
+async def query_rag_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answer many queries in one call.
+    
+    Queries are embedded and searched together; generations run with
+    BATCH_LLM_CONCURRENCY parallelism. Returns newline-delimited JSON, one
+    line per query as soon as its answer is ready (not in request order):
+    
+        {"index": 0, "response": "...", "status": "success", "sources": [...],
+         "cached": false, "timings_ms": {...}}
+    """
+    system = require_rag_system()
+    
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.queries)} queries (max {settings.BATCH_MAX_QUERIES})"
+        )
+    admit(system, "batch")
+    
+    logger.info(f"Processing batch of {len(request.queries)} queries...")
+    deadline = deadline_after(request.timeout_seconds or settings.BATCH_TIMEOUT_SECONDS)
+    
+    async def result_stream() -> AsyncIterator[str]:
+        results = system.batch_insights(
+            [(item.query, item.user_data) for item in request.queries],
+            deadline=deadline
+        )
+        try:
+            async for index, result in results:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling batch")
+                    break
+                yield json.dumps({
+                    "index": index,
+                    "response": result.response,
+                    "status": result.status,
+                    "sources": result.sources,
+                    "cached": result.cached,
+                    "timings_ms": result.timings
+                }) + "\n"
+        finally:
+            # Cancels generations that are still running
+            await results.aclose()
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event dict as a Server-Sent Events message"""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
 if __name__ == "__main__":
     import uvicorn
     
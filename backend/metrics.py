@@ -0,0 +1,397 @@
+"""
+Prometheus metrics for the RAG pipeline
+
+A small, dependency-free implementation of counters, gauges and
+histograms that renders the Prometheus text exposition format. Recording
+a value is a dict lookup and a few additions under a lock, so it is cheap
+enough for the query hot path.
+
+Metrics are per process: with several uvicorn workers, each worker serves
+its own numbers on /metrics.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+import threading
+from typing import Dict, List, Tuple, Iterator, Optional, Sequence
+
+from config import settings
+
+LabelValues = Tuple[str, ...]
+
+# Seconds; covers cache hits (sub-ms) up to slow local generations
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+CHARS_PER_TOKEN = 4  # Rough average for English text with Llama-style tokenizers
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text (about 4 characters per token)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class _Metric:
+    """Shared label handling for all metric types"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, values))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = self._format_labels(key, ("le", _number(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "gutsync_stage_duration_seconds",
+    "Time spent in each query pipeline stage",
+    ["endpoint", "stage"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "gutsync_request_duration_seconds",
+    "End-to-end query latency",
+    ["endpoint", "status"]
+))
+TIME_TO_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "gutsync_time_to_first_token_seconds",
+    "Time from request start to the first streamed token",
+    ["endpoint"]
+))
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "gutsync_prompt_tokens",
+    "Estimated tokens in each LLM prompt",
+    ["endpoint"],
+    buckets=TOKEN_BUCKETS
+))
+COMPLETION_TOKENS = REGISTRY.register(Histogram(
+    "gutsync_completion_tokens",
+    "Estimated tokens in each generated answer",
+    ["endpoint"],
+    buckets=TOKEN_BUCKETS
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "gutsync_requests_in_flight",
+    "Query requests currently being handled (including queued)",
+    ["endpoint"]
+))
+QUERY_SLOTS_IN_USE = REGISTRY.register(Gauge(
+    "gutsync_query_slots_in_use",
+    "Queries holding one of the MAX_CONCURRENT_QUERIES slots"
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "gutsync_answer_cache_lookups_total",
+    "Answer cache lookups by result",
+    ["result"]
+))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "gutsync_answer_cache_entries",
+    "Answers currently held in the answer cache"
+))
+VECTORSTORE_CHUNKS = REGISTRY.register(Gauge(
+    "gutsync_vectorstore_chunks",
+    "Chunks in the vectorstore"
+))
+LLM_NODE_OUTSTANDING = REGISTRY.register(Gauge(
+    "gutsync_llm_node_outstanding",
+    "Generations in flight on each Ollama server",
+    ["node"]
+))
+LLM_NODE_HEALTHY = REGISTRY.register(Gauge(
+    "gutsync_llm_node_healthy",
+    "1 if the Ollama server is in the pool, 0 if ejected",
+    ["node"]
+))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "gutsync_llm_hedges_total",
+    "Hedged LLM requests: fired, won (the hedge answered first) or lost",
+    ["outcome"]
+))
+LLM_HEDGE_SAVED = REGISTRY.register(Counter(
+    "gutsync_llm_hedge_saved_seconds_total",
+    "Estimated time to first token saved by hedges that won"
+))
+LLM_PROVIDER_FAILURES = REGISTRY.register(Counter(
+    "gutsync_llm_provider_failures_total",
+    "Failed generations per LLM provider",
+    ["provider"]
+))
+LLM_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "gutsync_llm_circuit_state",
+    "Circuit breaker state per LLM provider (0 closed, 1 half-open, 2 open)",
+    ["provider"]
+))
+SCHEDULER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "gutsync_scheduler_queue_depth",
+    "Requests waiting for a query slot",
+    ["priority"]
+))
+SCHEDULER_REJECTIONS = REGISTRY.register(Counter(
+    "gutsync_scheduler_rejections_total",
+    "Requests turned away by the scheduler (queue_full, shed, deadline)",
+    ["reason"]
+))
+DEGRADED = REGISTRY.register(Counter(
+    "gutsync_degraded_answers_total",
+    "Extractive answers returned because the LLM missed the latency budget",
+    ["endpoint"]
+))
+COALESCED = REGISTRY.register(Counter(
+    "gutsync_coalesced_requests_total",
+    "Requests answered by joining an identical query in flight",
+    ["endpoint"]
+))
+ERRORS = REGISTRY.register(Counter(
+    "gutsync_errors_total",
+    "Queries that failed",
+    ["endpoint"]
+))
+
+
+def record_timings(endpoint: str, timings: Dict[str, float], status: str = "success"):
+    """
+    Record the stage timings (milliseconds) of one finished request.
+
+    "total" and "first_token" are time-since-start marks and get their
+    own histograms; everything else (including queue_wait) is a stage.
+
+    Args:
+        endpoint: "query", "stream", ...
+        timings: StageTimer timings
+        status: Outcome label for the end-to-end latency
+    """
+    if not settings.METRICS_ENABLED:
+        return
+
+    for stage, value in timings.items():
+        if stage == "total":
+            REQUEST_SECONDS.observe(value / 1000.0, endpoint=endpoint, status=status)
+        elif stage == "first_token":
+            TIME_TO_FIRST_TOKEN.observe(value / 1000.0, endpoint=endpoint)
+        else:
+            STAGE_SECONDS.observe(value / 1000.0, endpoint=endpoint, stage=stage)
+
+
+def record_tokens(endpoint: str, prompt: str, completion: str):
+    """Record estimated prompt and completion sizes of one generation"""
+    if not settings.METRICS_ENABLED:
+        return
+
+    PROMPT_TOKENS.observe(estimate_tokens(prompt), endpoint=endpoint)
+    COMPLETION_TOKENS.observe(estimate_tokens(completion), endpoint=endpoint)
+
+
+def record_cache_lookup(hit: bool):
+    if settings.METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+
+
+def set_queue_depth(priority: str, depth: int):
+    if settings.METRICS_ENABLED:
+        SCHEDULER_QUEUE_DEPTH.set(depth, priority=priority)
+
+
+def record_scheduler_rejection(reason: str):
+    if settings.METRICS_ENABLED:
+        SCHEDULER_REJECTIONS.inc(reason=reason)
+
+
+def record_llm_hedge(outcome: str, saved_seconds: float = 0.0):
+    if settings.METRICS_ENABLED:
+        LLM_HEDGES.inc(outcome=outcome)
+        if saved_seconds:
+            LLM_HEDGE_SAVED.inc(saved_seconds)
+
+
+def record_llm_provider_failure(provider: str):
+    if settings.METRICS_ENABLED:
+        LLM_PROVIDER_FAILURES.inc(provider=provider)
+
+
+def set_llm_circuit_state(provider: str, state: int):
+    if settings.METRICS_ENABLED:
+        LLM_CIRCUIT_STATE.set(state, provider=provider)
+
+
+def record_degraded(endpoint: str):
+    if settings.METRICS_ENABLED:
+        DEGRADED.inc(endpoint=endpoint)
+
+
+def record_coalesced(endpoint: str):
+    if settings.METRICS_ENABLED:
+        COALESCED.inc(endpoint=endpoint)
+
+
+def record_error(endpoint: str):
+    if settings.METRICS_ENABLED:
+        ERRORS.inc(endpoint=endpoint)
+
+
+@contextmanager
+def track_in_flight(gauge: Gauge, **labels: str) -> Iterator[None]:
+    """Count a block as in flight on a gauge for as long as it runs"""
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+
+    gauge.inc(**labels)
+    try:
+        yield
+    finally:
+        gauge.dec(**labels)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format"""
+    return REGISTRY.render()
@@ -3,7 +3,7 @@ Pydantic models for request/response validation
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Literal
 
 
 class QueryRequest(BaseModel):
@@ -18,12 +18,31 @@ class QueryRequest(BaseModel):
         None,
         description="Optional user context data (moods, foods, etc.)"
     )
+    priority: Literal["interactive", "batch", "background"] = Field(
+        "interactive",
+        description="Scheduling class; interactive queries are served first"
+    )
+    timeout_seconds: Optional[float] = Field(
+        None,
+        description="Deadline for the answer (default REQUEST_TIMEOUT_SECONDS)",
+        gt=0
+    )
+    latency_budget_seconds: Optional[float] = Field(
+        None,
+        description=(
+            "Return an extractive answer if the LLM has not answered (or, when "
+            "streaming, sent a first token) by then; 0 = no fallback "
+            "(default LLM_LATENCY_BUDGET_SECONDS)"
+        ),
+        ge=0
+    )
     
     class Config:
         json_schema_extra = {
             "example": {
                 "query": "How does sugar affect my mood?",
                 "user_data": {
+                    "user_id": "5f0c7a8e-3d4b-4c1e-9a2f-6b8d1e2c3a4f",
                     "recent_moods": [
                         {"mood": 6, "date": "2024-01-02"}
                     ],
@@ -35,6 +54,33 @@ class QueryRequest(BaseModel):
         }
 
 
+class BatchQueryRequest(BaseModel):
+    """Request model for batch RAG queries"""
+    queries: List[QueryRequest] = Field(
+        ...,
+        description="Queries to answer; results stream back as each finishes",
+        min_length=1
+    )
+    timeout_seconds: Optional[float] = Field(
+        None,
+        description="Deadline for the whole batch (default BATCH_TIMEOUT_SECONDS)",
+        gt=0
+    )
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "queries": [
+                    {"query": "How does sugar affect my mood?"},
+                    {
+                        "query": "Which foods support sleep?",
+                        "user_data": {"foods": [{"name": "Kefir"}]}
+                    }
+                ]
+            }
+        }
+
+
 class QueryResponse(BaseModel):
     """Response model for RAG queries"""
     response: str = Field(
@@ -45,9 +91,25 @@ class QueryResponse(BaseModel):
         default="success",
         description="Response status"
     )
-    sources: Optional[List[str]] = Field(
+    sources: Optional[List[Dict[str, Any]]] = Field(
         None,
-        description="Source documents used (optional)"
+        description="Source documents used (file name and page)"
+    )
+    cached: Optional[bool] = Field(
+        None,
+        description="Whether the answer came from the answer cache"
+    )
+    coalesced: Optional[bool] = Field(
+        None,
+        description="Whether the answer was shared with an identical query in flight"
+    )
+    degraded: Optional[bool] = Field(
+        None,
+        description="Whether this is an extractive answer because the LLM was too slow"
+    )
+    timings_ms: Optional[Dict[str, float]] = Field(
+        None,
+        description="Per-stage latency in milliseconds (embed, retrieve, generate, total...)"
     )
 
 
@@ -73,6 +135,40 @@ class HealthResponse(BaseModel):
         None,
         description="Number of documents in vectorstore"
     )
+    answer_cache: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Semantic answer cache counters (hits, misses, size)"
+    )
+    llm_servers: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="Load and health of each Ollama server"
+    )
+    llm_router: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Per-provider circuit state and hedging counters (LLM_PROVIDERS)"
+    )
+
+
+class ProfileRequest(BaseModel):
+    """Request model for arming query profiles"""
+    count: int = Field(
+        1,
+        description="Number of upcoming /query calls of this worker to profile",
+        ge=1,
+        le=1000
+    )
+
+
+class ProfileResponse(BaseModel):
+    """Armed and saved query profiles of this worker"""
+    armed: int = Field(
+        ...,
+        description="/query calls still to be profiled"
+    )
+    profiles: List[str] = Field(
+        default_factory=list,
+        description="IDs of the newest saved profiles (<id>.folded and <id>.json in PROFILE_DIR)"
+    )
 
 
 class ErrorResponse(BaseModel):
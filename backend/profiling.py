@@ -0,0 +1,192 @@
+"""
+On-demand profiles of /query calls
+
+Profiling is off until an admin arms it for the next N queries
+(POST /admin/profile). Each armed query then records:
+
+- wall-clock stack samples of every thread (the event loop, the RAG
+  thread pool, LangChain and HTTP client threads), written as collapsed
+  stacks ("thread;outer;...;inner count") that flamegraph.pl, speedscope
+  and inferno read directly
+- a span tree of the pipeline stages (embed, retrieve, prompt, generate,
+  postprocess) with durations and the change in allocated memory blocks
+  (sys.getallocatedblocks) across each span
+
+Both are saved to PROFILE_DIR as <id>.folded and <id>.json. When nothing
+is armed the only cost is one integer check per query and one None check
+per stage, so the hooks stay in production builds.
+
+Stacks and allocation counts are process-wide: queries running at the
+same time as a profiled one show up in its samples and deltas, so profile
+under light traffic for clean numbers.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLER_THREAD_PREFIX = "profile-sampler"
+
+
+class Span:
+    """One timed stage of a profiled query"""
+
+    def __init__(self, name: str, origin: float):
+        self.name = name
+        self.start_ms = round((time.perf_counter() - origin) * 1000.0, 3)
+        self.started = time.perf_counter()
+        self.blocks = sys.getallocatedblocks()
+        self.duration_ms: Optional[float] = None
+        self.allocated_blocks: Optional[int] = None
+        self.children: List["Span"] = []
+
+    def close(self):
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000.0, 3)
+        self.allocated_blocks = sys.getallocatedblocks() - self.blocks
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": self.start_ms,
+            "duration_ms": self.duration_ms,
+            "allocated_blocks": self.allocated_blocks,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Profile:
+    """Samples and spans of one query; written to disk when it finishes"""
+
+    def __init__(self, profile_id: str, query: str, directory: str, interval: float):
+        self.id = profile_id
+        self.query = query
+        self.directory = directory
+        self.interval = interval
+        self.origin = time.perf_counter()
+        self.root = Span("query", self.origin)
+        self.open_spans: List[Span] = [self.root]
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample,
+            name=f"{SAMPLER_THREAD_PREFIX}-{profile_id}",
+            daemon=True
+        )
+        self._sampler.start()
+
+    def open_span(self, name: str) -> Span:
+        """Start a stage nested in the innermost open one"""
+        span = Span(name, self.origin)
+        self.open_spans[-1].children.append(span)
+        self.open_spans.append(span)
+        return span
+
+    def close_span(self, span: Span):
+        span.close()
+        if span in self.open_spans:
+            del self.open_spans[self.open_spans.index(span):]
+
+    def _sample(self):
+        """Count the stack of every thread each interval"""
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if name.startswith(SAMPLER_THREAD_PREFIX):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def finish(self, status: str, timings: Dict[str, float]) -> str:
+        """
+        Stop sampling and write <id>.folded and <id>.json.
+
+        Returns:
+            Path of the JSON file
+        """
+        self._stop.set()
+        self._sampler.join()
+        for span in reversed(self.open_spans):
+            span.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{self.id}.folded"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        path = os.path.join(self.directory, f"{self.id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "id": self.id,
+                "query": self.query,
+                "status": status,
+                "timings_ms": timings,
+                "samples": self.samples,
+                "interval_ms": round(self.interval * 1000.0, 3),
+                "spans": self.root.to_dict(),
+            }, f, indent=2)
+
+        logger.info(f"✅ Saved query profile {path}")
+        return path
+
+
+class Profiler:
+    """Arms profiles for the next queries of this worker"""
+
+    def __init__(self, directory: str, interval: float, max_armed: int):
+        """
+        Args:
+            directory: Where profiles are written
+            interval: Seconds between stack samples
+            max_armed: Most queries that can be armed at once
+        """
+        self.directory = directory
+        self.interval = interval
+        self.max_armed = max_armed
+        self.armed = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def arm(self, count: int) -> int:
+        """Profile the next `count` queries (on top of any still armed)"""
+        with self._lock:
+            self.armed = min(self.armed + count, self.max_armed)
+            return self.armed
+
+    def claim(self, query: str) -> Optional[Profile]:
+        """A started profile if this query is armed, else None"""
+        if not self.armed:
+            return None
+        with self._lock:
+            if not self.armed:
+                return None
+            self.armed -= 1
+            self._count += 1
+            profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._count}"
+        return Profile(profile_id, query, self.directory, self.interval)
+
+    def saved(self, limit: int = 50) -> List[str]:
+        """IDs of the newest saved profiles"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        paths = [os.path.join(self.directory, name) for name in names if name.endswith(".json")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        return [os.path.basename(path)[:-len(".json")] for path in paths[:limit]]
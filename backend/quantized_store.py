@@ -0,0 +1,244 @@
+"""
+Compact (int8 / float16) vectors with exact rescoring
+
+The snapshot keeps every embedding as float32, so the memory a search
+touches and the bytes it scans grow at full width with the corpus. A
+quantized store keeps a compact copy of the vectors in memory:
+
+- int8: each vector is scaled by its own max(|x|) / 127 and rounded, so
+  one byte per dimension plus one float32 scale per vector (4x smaller)
+- float16: half precision (2x smaller), no scale needed
+
+A search scans the compact vectors to pick rescore_k candidates per
+query, then ranks those exactly against the full-precision float32
+vectors of the snapshot. The snapshot is memory-mapped, so only the
+candidate rows are read from disk.
+
+Layout of one store directory:
+
+    header.json     format, snapshot version, count, dim, dtype
+    codes.i8|f16    count x dim compact matrix
+    scales.f32      per-vector scale (empty for float16)
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrievers import VectorSearchRetriever
+from snapshot import VectorSnapshot
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_FORMAT = 1
+QUANTIZED_DTYPES = {"int8": (np.int8, "codes.i8"), "float16": (np.float16, "codes.f16")}
+ENCODE_BATCH_SIZE = 16384  # Rows quantized per block while building
+SCAN_BATCH_SIZE = 1024  # Rows widened to float32 per matrix product (fits in cache)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Symmetric per-vector int8 quantization.
+
+    Returns:
+        (codes, scales) with vectors ~= codes * scales[:, None]
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def build_quantized_store(
+    vectors: np.ndarray,
+    path: str,
+    dtype: str = "int8",
+    version: str = ""
+) -> str:
+    """
+    Write a compact copy of a vector matrix to path.
+
+    Args:
+        vectors: count x dim float32 matrix (may be a memmap)
+        path: Store directory (replaced atomically)
+        dtype: "int8" or "float16"
+        version: Snapshot version the vectors come from
+
+    Returns:
+        path
+    """
+    if dtype not in QUANTIZED_DTYPES:
+        raise ValueError(f"Unsupported quantized dtype: {dtype}")
+    count, dim = vectors.shape
+    _, codes_name = QUANTIZED_DTYPES[dtype]
+
+    tmp_dir = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    with open(os.path.join(tmp_dir, codes_name), "wb") as codes_file, \
+            open(os.path.join(tmp_dir, "scales.f32"), "wb") as scales_file:
+        for start in range(0, count, ENCODE_BATCH_SIZE):
+            block = np.asarray(vectors[start:start + ENCODE_BATCH_SIZE], dtype=np.float32)
+            if dtype == "int8":
+                codes, scales = quantize_int8(block)
+                codes_file.write(codes.tobytes())
+                scales_file.write(scales.tobytes())
+            else:
+                codes_file.write(block.astype(np.float16).tobytes())
+
+    with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": QUANTIZED_FORMAT,
+            "version": version,
+            "count": count,
+            "dim": dim,
+            "dtype": dtype,
+        }, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_dir, path)
+    return path
+
+
+def ensure_quantized_store(snapshot: VectorSnapshot, path: str, dtype: str = "int8") -> str:
+    """Return the store directory, rebuilding it if the snapshot or dtype changed"""
+    try:
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except FileNotFoundError:
+        header = {}
+
+    if (
+        header.get("format") == QUANTIZED_FORMAT
+        and header.get("version") == snapshot.version
+        and header.get("dtype") == dtype
+    ):
+        return path
+
+    logger.info(f"Building {dtype} vector store ({snapshot.count} vectors)...")
+    build_quantized_store(snapshot.vectors, path, dtype=dtype, version=snapshot.version)
+    logger.info(f"✅ {dtype} vector store built")
+    return path
+
+
+class QuantizedStore:
+    """
+    Compact vectors loaded into memory, searched with exact rescoring
+    against the snapshot's float32 vectors; safe to share between threads.
+    """
+
+    def __init__(self, path: str, snapshot: VectorSnapshot):
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        if header.get("format") != QUANTIZED_FORMAT:
+            raise ValueError(f"Unsupported quantized store format in {path}")
+        if header["version"] != snapshot.version:
+            raise ValueError(f"Quantized store {path} does not match snapshot {snapshot.version}")
+
+        self.path = path
+        self.snapshot = snapshot
+        self.count: int = header["count"]
+        self.dim: int = header["dim"]
+        self.dtype: str = header["dtype"]
+
+        numpy_dtype, codes_name = QUANTIZED_DTYPES[self.dtype]
+        # Read into memory: the scan runs over this copy, not the disk
+        self.codes = np.fromfile(os.path.join(path, codes_name), dtype=numpy_dtype)
+        self.codes = self.codes.reshape(self.count, self.dim)
+        self.scales: Optional[np.ndarray] = None
+        if self.dtype == "int8":
+            self.scales = np.fromfile(os.path.join(path, "scales.f32"), dtype=np.float32)
+        # Exact squared norms are small (one float per vector) and keep the
+        # first pass's ranking closer to the exact one
+        self.norms = np.array(snapshot.norms, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the compact vectors, scales and norms"""
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return self.codes.nbytes + scales + self.norms.nbytes
+
+    def approximate_distances(self, queries: np.ndarray) -> np.ndarray:
+        """count x queries squared L2 distances (minus |q|^2) from the compact vectors"""
+        dots = np.empty((self.count, len(queries)), dtype=np.float32)
+        # Widen one cache-sized block at a time and reuse its buffer
+        widened = np.empty((min(SCAN_BATCH_SIZE, self.count), self.dim), dtype=np.float32)
+        for start in range(0, self.count, SCAN_BATCH_SIZE):
+            block = self.codes[start:start + SCAN_BATCH_SIZE]
+            buffer = widened[:len(block)]
+            np.copyto(buffer, block, casting="unsafe")
+            np.matmul(buffer, queries.T, out=dots[start:start + len(block)])
+        if self.scales is not None:
+            dots *= self.scales[:, None]
+        dots *= -2.0
+        dots += self.norms[:, None]
+        return dots
+
+    def search_many(self, embeddings: List[List[float]], k: int, rescore_k: int) -> List[List[int]]:
+        """
+        Nearest neighbours by squared L2 distance.
+
+        Args:
+            embeddings: Query embeddings
+            k: Results per query
+            rescore_k: Candidates from the compact pass rescored exactly
+
+        Returns:
+            Snapshot row numbers per query, nearest first
+        """
+        if self.count == 0:
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), self.dim)
+        k = min(k, self.count)
+        rescore_k = min(max(rescore_k, k), self.count)
+
+        approximate = self.approximate_distances(queries)
+        candidates = np.argpartition(approximate, rescore_k - 1, axis=0)[:rescore_k].T
+
+        results = []
+        for query, rows in zip(queries, candidates):
+            rows = np.sort(rows)  # Sequential reads from the memory-mapped snapshot
+            full = np.asarray(self.snapshot.vectors[rows], dtype=np.float32)
+            exact = self.snapshot.norms[rows] - 2.0 * (full @ query)
+            top = np.argpartition(exact, k - 1)[:k]
+            results.append(rows[top[np.argsort(exact[top])]].tolist())
+        return results
+
+
+class QuantizedRetriever(VectorSearchRetriever):
+    """Compact-vector search with exact rescoring; documents come from the snapshot"""
+
+    snapshot: VectorSnapshot
+    store: QuantizedStore
+    rescore_factor: int = 4
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k=k)[0]
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        if not embeddings:
+            return []
+        k = k or self.k
+        return [
+            [self.snapshot.document(row) for row in rows]
+            for rows in self.store.search_many(embeddings, k, k * self.rescore_factor)
+        ]
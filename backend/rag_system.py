@@ -3,28 +3,64 @@ Enhanced RAG System with Ollama LLM Integration
 
 This module provides a complete RAG (Retrieval-Augmented Generation) system
 that uses local embeddings and Ollama for LLM inference.
+
+Heavy provider modules (sentence-transformers, Chroma, LLM clients) are
+imported when the component is built, and only for the provider that is
+selected, so importing this module is cheap.
 """
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.llms import Ollama
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+import asyncio
+import functools
 import logging
 import os
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Set, Tuple
 
+import metrics
+from analytics import FoodMoodAnalytics, connect_database
+from cache import SemanticCache
+from context_packing import pack_context, document_order_key
+from embedding_batcher import BatchedEmbeddings
+from embedding_backends import create_embeddings, embedding_identity
+from extractive import extractive_answer
+from ingestion import DocumentIngestor, IngestReport, resolve_sources
+from metrics import estimate_tokens
+from profiling import Profiler
+from retrievers import VectorSearchRetriever, ChromaRetriever
+from scheduler import QueryScheduler, QueueFullError, DeadlineExceededError
+from singleflight import SingleFlight, StreamFlights, flight_key
+from timing import StageTimer
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE = "I apologize, but I encountered an error processing your question. Please try again."
+
+# Per-call kwargs that limit a generation to one token, by provider
+ONE_TOKEN_KWARGS = {"ollama": {"num_predict": 1}}
+DEFAULT_ONE_TOKEN_KWARGS = {"max_tokens": 1}
+
+
+@dataclass
+class InsightResult:
+    """An answer plus what the pipeline did to produce it"""
+    response: str
+    status: str = "success"
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    documents: List[Any] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)  # Stage durations (ms)
+    cached: bool = False
+    coalesced: bool = False  # Shared the computation of an identical query
+    degraded: bool = False  # Extractive answer; the LLM missed the latency budget
+
 
 class RAGSystem:
     """
     Complete RAG system with:
-    - Document loading and chunking
+    - Incremental document loading and chunking
     - Vector embeddings with HuggingFace
     - ChromaDB vector store
     - Ollama LLM for generation
@@ -34,10 +70,39 @@ class RAGSystem:
         """Initialize the RAG system with all components"""
         logger.info("Initializing RAG System...")
         
+        # Bounded pool for blocking work (embedding, Chroma search)
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.RAG_THREAD_POOL_SIZE,
+            thread_name_prefix="rag"
+        )
+        
+        # Caps queries in flight in this worker; extra requests wait here,
+        # by priority and deadline, in a bounded queue
+        self.scheduler = QueryScheduler(
+            max_concurrent=settings.MAX_CONCURRENT_QUERIES,
+            max_queue=settings.SCHEDULER_MAX_QUEUE,
+            retry_after=settings.SCHEDULER_RETRY_AFTER_SECONDS
+        )
+        
+        # Identical concurrent queries share one computation
+        self.query_flights = SingleFlight()
+        self.stream_flights = StreamFlights()
+        
+        # Profiles of the next /query calls, once an admin arms them
+        self.profiler = Profiler(
+            directory=settings.profile_dir,
+            interval=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000.0,
+            max_armed=settings.PROFILE_MAX_ARMED
+        )
+        
+        # Generations finishing after an extractive answer was returned
+        self.background_generations: Set[asyncio.Task] = set()
+        
         # Initialize embeddings
         self._init_embeddings()
         
         # Initialize text splitter
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=settings.CHUNK_SIZE,
             chunk_overlap=settings.CHUNK_OVERLAP
@@ -49,91 +114,150 @@ class RAGSystem:
         # Initialize LLM
         self._init_llm()
         
-        # Create RAG chain
+        # Create prompt and retriever
         self._init_qa_chain()
         
+        # Semantic answer cache
+        self._init_cache()
+        
+        # Per-user food-mood analytics
+        self._init_analytics()
+        
         logger.info("✅ RAG System fully initialized")
     
     def _init_embeddings(self):
         """Initialize the embedding model"""
-        logger.info(f"Loading embeddings: {settings.EMBEDDING_MODEL}")
+        logger.info(f"Loading embeddings: {embedding_identity(settings)}")
         
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL,
-            model_kwargs={'device': settings.EMBEDDING_DEVICE}
-        )
+        self.embeddings = self._create_embedding_model()
+        
+        # Batch concurrent query embeddings into one forward pass
+        if settings.EMBEDDING_BATCH_ENABLED:
+            self.embeddings = BatchedEmbeddings(
+                self.embeddings,
+                window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
+            )
         
         logger.info("✅ Embeddings loaded")
     
-    def _init_vectorstore(self):
-        """Load existing vectorstore or create new one"""
-        try:
-            if os.path.exists(settings.CHROMA_DIR):
-                # Load existing vectorstore
-                self.vectorstore = Chroma(
-                    persist_directory=settings.CHROMA_DIR,
-                    embedding_function=self.embeddings
-                )
-                
-                doc_count = self.vectorstore._collection.count()
-                logger.info(f"✅ Loaded existing vectorstore with {doc_count} documents")
-                
-                # If empty, reload documents
-                if doc_count == 0:
-                    logger.warning("Vectorstore is empty, loading documents...")
-                    self._load_documents()
-            else:
-                # Create new vectorstore
-                logger.info("Creating new vectorstore...")
-                self._load_documents()
-                
-        except Exception as e:
-            logger.error(f"Error initializing vectorstore: {e}")
-            raise
+    def _create_embedding_model(self):
+        """Build the embedding model itself (EMBEDDING_BACKEND)"""
+        return create_embeddings(settings)
     
-    def _load_documents(self):
-        """Load and process documents into vectorstore"""
+    def _init_vectorstore(self):
+        """Open the vectorstore and sync it with the configured documents"""
+        from langchain_chroma import Chroma
+        
         try:
-            logger.info(f"Loading PDF from: {settings.PDF_PATH}")
-            
-            if not os.path.exists(settings.PDF_PATH):
-                raise FileNotFoundError(f"PDF not found at {settings.PDF_PATH}")
-            
-            # Load PDF
-            loader = PyPDFLoader(settings.PDF_PATH)
-            pages = loader.load()
-            logger.info(f"Loaded {len(pages)} pages from PDF")
+            self.vectorstore = Chroma(
+                persist_directory=settings.CHROMA_DIR,
+                embedding_function=self.embeddings
+            )
             
-            # Split into chunks
-            texts = self.text_splitter.split_documents(pages)
-            logger.info(f"Split into {len(texts)} chunks")
+            # Ingestion batches itself; skip the query micro-batcher
+            ingest_embeddings = getattr(self.embeddings, 'base', self.embeddings)
             
-            # Create vectorstore
-            self.vectorstore = Chroma.from_documents(
-                texts,
-                self.embeddings,
-                persist_directory=settings.CHROMA_DIR
+            self.ingestor = DocumentIngestor(
+                vectorstore=self.vectorstore,
+                embeddings=ingest_embeddings,
+                text_splitter=self.text_splitter,
+                persist_dir=settings.CHROMA_DIR,
+                config={
+                    "embedding_model": embedding_identity(settings),
+                    "chunk_size": settings.CHUNK_SIZE,
+                    "chunk_overlap": settings.CHUNK_OVERLAP,
+                },
+                workers=settings.INGEST_WORKERS,
+                batch_size=settings.INGEST_BATCH_SIZE,
+                pages_per_task=settings.INGEST_PAGES_PER_TASK
             )
             
-            logger.info("✅ Documents loaded and vectorstore created")
+            self.ingest_documents()
             
+            logger.info(f"✅ Vectorstore ready with {self.get_document_count()} documents")
+                
         except Exception as e:
-            logger.error(f"Error loading documents: {e}")
+            logger.error(f"Error initializing vectorstore: {e}")
             raise
     
+    def ingest_documents(self) -> IngestReport:
+        """
+        Embed new or changed documents and drop removed ones.
+        
+        Unchanged documents are skipped, so this is cheap to call on every
+        startup.
+        
+        Returns:
+            Summary of what changed
+        """
+        sources = resolve_sources(settings.DOCUMENT_PATHS or [settings.PDF_PATH])
+        
+        if not sources:
+            raise FileNotFoundError(
+                f"No documents found in {settings.DOCUMENT_PATHS or settings.PDF_PATH}"
+            )
+        
+        report = self.ingestor.sync(sources)
+        self._refresh_corpus_version()
+        self._refresh_document_count()
+        
+        # Snapshot, IVF and BM25 indexes must be rebuilt after a change
+        if report.changed and hasattr(self, 'retriever'):
+            self.retriever = self._build_retriever()
+        
+        return report
+    
     def _init_llm(self):
         """Initialize the LLM based on configuration"""
-        logger.info(f"Initializing LLM: {settings.LLM_PROVIDER}")
+        providers = settings.llm_providers
+        llms = [self._create_llm(provider) for provider in providers]
+        
+        if len(llms) == 1:
+            self.llm = llms[0]
+            return
         
-        if settings.LLM_PROVIDER == "ollama":
+        from llm_router import RoutedLLM
+        
+        # Hedge slow first tokens and fail over across the providers
+        self.llm = RoutedLLM(
+            providers=llms,
+            names=providers,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+            hedge_initial_delay=settings.LLM_HEDGE_INITIAL_DELAY_SECONDS,
+            failure_threshold=settings.LLM_CIRCUIT_FAILURES,
+            cooldown=settings.LLM_CIRCUIT_COOLDOWN_SECONDS
+        )
+        logger.info(f"✅ LLM router initialized: {' -> '.join(providers)}")
+    
+    def _create_llm(self, provider: str):
+        """Build the client for one LLM provider"""
+        logger.info(f"Initializing LLM: {provider}")
+        
+        if provider == "ollama":
+            from llm_pool import PooledOllama
+            
+            base_urls = settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL]
+            
             try:
-                self.llm = Ollama(
+                llm = PooledOllama(
                     model=settings.OLLAMA_MODEL,
-                    base_url=settings.OLLAMA_BASE_URL,
+                    base_urls=base_urls,
                     temperature=0.7,
-                    num_ctx=4096,  # Context window size
+                    num_ctx=settings.LLM_NUM_CTX,  # Context window size
+                    num_keep=settings.OLLAMA_NUM_KEEP or None,
+                    keep_alive=settings.OLLAMA_KEEP_ALIVE or None,
+                    max_in_flight_per_node=settings.OLLAMA_MAX_IN_FLIGHT_PER_NODE,
+                    eject_after_failures=settings.OLLAMA_EJECT_AFTER_FAILURES,
+                    probe_interval=settings.OLLAMA_PROBE_INTERVAL_SECONDS,
+                    request_timeout=settings.OLLAMA_REQUEST_TIMEOUT
+                )
+                logger.info(
+                    f"✅ Ollama LLM initialized with model: {settings.OLLAMA_MODEL} "
+                    f"({len(base_urls)} server{'s' if len(base_urls) > 1 else ''})"
                 )
-                logger.info(f"✅ Ollama LLM initialized with model: {settings.OLLAMA_MODEL}")
+                return llm
                 
             except Exception as e:
                 logger.error(f"Failed to initialize Ollama: {e}")
@@ -141,24 +265,25 @@ class RAGSystem:
                 logger.error(f"And model is pulled: ollama pull {settings.OLLAMA_MODEL}")
                 raise
         
-        elif settings.LLM_PROVIDER == "groq":
+        elif provider == "groq":
             from langchain_groq import ChatGroq
             
             if not settings.GROQ_API_KEY:
                 raise ValueError("GROQ_API_KEY not set in environment")
             
-            self.llm = ChatGroq(
+            llm = ChatGroq(
                 model="llama-3.2-3b-preview",
                 temperature=0.7,
                 api_key=settings.GROQ_API_KEY
             )
             logger.info("✅ Groq LLM initialized")
+            return llm
         
         else:
-            raise ValueError(f"Unsupported LLM provider: {settings.LLM_PROVIDER}")
+            raise ValueError(f"Unsupported LLM provider: {provider}")
     
     def _init_qa_chain(self):
-        """Create the QA chain with custom prompt"""
+        """Create the prompt and retriever used by the QA pipeline"""
         
         # Custom prompt template for gut-brain health
         prompt_template = """You are a knowledgeable gut-brain health assistant. Use the following research context to answer the user's question. Provide helpful, evidence-based insights that are easy to understand.
@@ -170,28 +295,207 @@ Question: {question}
 
 Answer (be concise, helpful, and cite research insights):"""
 
-        PROMPT = PromptTemplate(
-            template=prompt_template,
-            input_variables=["context", "question"]
-        )
+        # Same instructions, ordered from most to least stable so the LLM
+        # server can reuse the KV cache of the shared prefix across requests
+        prefix_cache_template = """You are a knowledgeable gut-brain health assistant. Use the research context below to answer the user's question. Provide helpful, evidence-based insights that are easy to understand. Be concise, helpful, and cite research insights.
+
+Context from research:
+{context}
+{user_context}
+Question: {question}
+
+Answer:"""
+
+        from langchain.prompts import PromptTemplate
         
-        # Create retrieval QA chain
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.vectorstore.as_retriever(
-                search_kwargs={"k": settings.SIMILARITY_TOP_K}
-            ),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": PROMPT}
-        )
+        if settings.PROMPT_LAYOUT == "classic":
+            self.prompt = PromptTemplate(
+                template=prompt_template,
+                input_variables=["context", "question"]
+            )
+        elif settings.PROMPT_LAYOUT == "prefix_cache":
+            self.prompt = PromptTemplate(
+                template=prefix_cache_template,
+                input_variables=["context", "user_context", "question"]
+            )
+        else:
+            raise ValueError(f"Unsupported prompt layout: {settings.PROMPT_LAYOUT}")
+        
+        self.retriever = self._build_retriever()
         
-        logger.info("✅ QA chain initialized")
+        logger.info(f"✅ QA chain initialized ({settings.PROMPT_LAYOUT} prompt layout)")
+    
+    def _build_retriever(self) -> VectorSearchRetriever:
+        """Create the retriever selected by RETRIEVER_MODE and VECTOR_BACKEND"""
+        dense = self._build_dense_retriever()
+        
+        if settings.RETRIEVER_MODE == "vector":
+            return dense
+        
+        if settings.RETRIEVER_MODE == "hybrid":
+            from bm25 import HybridRetriever, ensure_bm25_index
+            
+            with self.ingestor.lock():
+                index = ensure_bm25_index(
+                    self.vectorstore._collection,
+                    settings.bm25_index_path,
+                    self.corpus_version
+                )
+            logger.info("✅ Using hybrid BM25 + vector retrieval")
+            return HybridRetriever(
+                dense=dense,
+                index=index,
+                vectorstore=self.vectorstore,
+                embeddings=self.embeddings,
+                k=settings.SIMILARITY_TOP_K,
+                fetch_k=settings.HYBRID_FETCH_K,
+                rrf_k=settings.HYBRID_RRF_K
+            )
+        
+        raise ValueError(f"Unsupported retriever mode: {settings.RETRIEVER_MODE}")
+    
+    def _build_dense_retriever(self) -> VectorSearchRetriever:
+        """Create the vector retriever selected by VECTOR_BACKEND"""
+        if settings.VECTOR_BACKEND == "chroma":
+            return ChromaRetriever(
+                vectorstore=self.vectorstore,
+                embeddings=self.embeddings,
+                k=settings.SIMILARITY_TOP_K
+            )
+        
+        if settings.VECTOR_BACKEND == "snapshot":
+            from snapshot import SnapshotRetriever, VectorSnapshot, ensure_snapshot
+            
+            # Export under the ingestion lock so workers don't race
+            with self.ingestor.lock():
+                path = ensure_snapshot(
+                    self.vectorstore._collection,
+                    settings.snapshot_dir,
+                    self.corpus_version
+                )
+            logger.info(f"✅ Using memory-mapped vector snapshot: {path}")
+            return SnapshotRetriever(
+                snapshot=VectorSnapshot(path),
+                embeddings=self.embeddings,
+                k=settings.SIMILARITY_TOP_K
+            )
+        
+        if settings.VECTOR_BACKEND == "ann":
+            from ann_index import AnnRetriever, IVFIndex, ensure_ivf_index
+            from snapshot import VectorSnapshot, ensure_snapshot
+            
+            # The IVF index is built from the snapshot, both under the lock
+            with self.ingestor.lock():
+                snapshot = VectorSnapshot(ensure_snapshot(
+                    self.vectorstore._collection,
+                    settings.snapshot_dir,
+                    self.corpus_version
+                ))
+                path = ensure_ivf_index(
+                    snapshot,
+                    settings.ann_index_dir,
+                    nlist=settings.ANN_NLIST,
+                    iterations=settings.ANN_KMEANS_ITERATIONS
+                )
+            index = IVFIndex(path)
+            logger.info(
+                f"✅ Using IVF index: {index.nlist} lists, nprobe={settings.ANN_NPROBE}"
+            )
+            return AnnRetriever(
+                snapshot=snapshot,
+                index=index,
+                nprobe=settings.ANN_NPROBE,
+                embeddings=self.embeddings,
+                k=settings.SIMILARITY_TOP_K
+            )
+        
+        if settings.VECTOR_BACKEND == "quantized":
+            from quantized_store import QuantizedRetriever, QuantizedStore, ensure_quantized_store
+            from snapshot import VectorSnapshot, ensure_snapshot
+            
+            # The compact store is built from the snapshot, both under the lock
+            with self.ingestor.lock():
+                snapshot = VectorSnapshot(ensure_snapshot(
+                    self.vectorstore._collection,
+                    settings.snapshot_dir,
+                    self.corpus_version
+                ))
+                path = ensure_quantized_store(
+                    snapshot,
+                    settings.quantized_store_dir,
+                    dtype=settings.QUANTIZED_DTYPE
+                )
+            store = QuantizedStore(path, snapshot)
+            logger.info(
+                f"✅ Using {store.dtype} vector store ({store.nbytes / 2**20:.1f} MB), "
+                f"rescoring {settings.QUANTIZED_RESCORE_FACTOR}x candidates"
+            )
+            return QuantizedRetriever(
+                snapshot=snapshot,
+                store=store,
+                rescore_factor=settings.QUANTIZED_RESCORE_FACTOR,
+                embeddings=self.embeddings,
+                k=settings.SIMILARITY_TOP_K
+            )
+        
+        raise ValueError(f"Unsupported vector backend: {settings.VECTOR_BACKEND}")
+    
+    def _init_cache(self):
+        """Initialize the semantic answer cache (if enabled)"""
+        self.answer_cache: Optional[SemanticCache] = None
+        
+        if settings.CACHE_ENABLED:
+            self.answer_cache = SemanticCache(
+                similarity_threshold=settings.CACHE_SIMILARITY_THRESHOLD,
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                max_bytes=settings.CACHE_MAX_BYTES,
+                ttl_seconds=settings.CACHE_TTL_SECONDS
+            )
+            logger.info(
+                f"✅ Answer cache enabled (threshold={settings.CACHE_SIMILARITY_THRESHOLD})"
+            )
+    
+    def _init_analytics(self):
+        """Load food-mood analytics from the database (if configured)"""
+        self.analytics: Optional[FoodMoodAnalytics] = None
+        
+        if not settings.ANALYTICS_DATABASE_URL:
+            return
+        if not settings.ANALYTICS_TRUST_USER_ID:
+            # Any caller could name another user's id and read their summary
+            logger.warning("Analytics disabled: set ANALYTICS_TRUST_USER_ID once user_id is authenticated")
+            return
+        
+        self.analytics = FoodMoodAnalytics(
+            functools.partial(connect_database, settings.ANALYTICS_DATABASE_URL),
+            window_days=settings.ANALYTICS_WINDOW_DAYS,
+            lags=tuple(settings.ANALYTICS_LAG_DAYS),
+            min_days=settings.ANALYTICS_MIN_DAYS,
+            min_correlation=settings.ANALYTICS_MIN_CORRELATION
+        )
+        try:
+            self.analytics.refresh()
+            logger.info(f"✅ Analytics loaded for {self.analytics.user_count()} user(s)")
+        except Exception as e:
+            # The database may come up later; the periodic refresh retries
+            logger.warning(f"Analytics load failed: {e}")
+    
+    def refresh_analytics(self):
+        """Pick up new food and mood logs"""
+        if self.analytics is not None:
+            self.analytics.refresh()
+    
+    def _refresh_corpus_version(self):
+        """Record the vectorstore version; the answer cache is dropped when it changes"""
+        self.corpus_version = self.ingestor.version()
     
     def get_insights(self, query: str, user_data: Optional[Dict[str, Any]] = None) -> str:
         """
         Get AI-generated insights for a user query.
         
+        Blocking version, for scripts and threads. Request handlers should
+        use aget_insights instead.
+        
         Args:
             query: User's question
             user_data: Optional dictionary with user's mood/food data
@@ -203,20 +507,903 @@ Answer (be concise, helpful, and cite research insights):"""
         
         try:
             # Enhance query with user context if provided
-            enhanced_query = self._build_enhanced_query(query, user_data)
+            enhanced_query = self._search_query(query, user_data)
+            context_key = self._context_key(user_data)
+            corpus_version = self.corpus_version
             
-            # Get response from QA chain
-            result = self.qa_chain.invoke({"query": enhanced_query})
+            query_vector, search_vector = self._embed_query_pair(query, enhanced_query)
             
-            # Extract the answer
-            response = result['result']
+            cached = self._cache_lookup(query_vector, context_key)
+            if cached is not None:
+                logger.info("✅ Answer cache hit")
+                return cached.response
+            
+            docs = self._search(search_vector, query)
+            prompt = self._build_prompt(docs, query, user_data)
+            response = self._chunk_text(self.llm.invoke(prompt))
+            
+            self._cache_store(query_vector, context_key, response, docs, corpus_version)
             
             logger.info("✅ Query processed successfully")
             return response
             
         except Exception as e:
             logger.error(f"Error processing query: {e}", exc_info=True)
-            return f"I apologize, but I encountered an error processing your question. Please try again."
+            return ERROR_RESPONSE
+    
+    async def aget_insights(self, query: str, user_data: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Get AI-generated insights without blocking the event loop.
+        
+        Args:
+            query: User's question
+            user_data: Optional dictionary with user's mood/food data
+            
+        Returns:
+            AI-generated response string
+        """
+        result = await self.aquery(query, user_data)
+        return result.response
+    
+    async def aquery(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]] = None,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        latency_budget: Optional[float] = None
+    ) -> InsightResult:
+        """
+        Answer a query without blocking the event loop.
+        
+        Embedding and Chroma search run in the bounded RAG thread pool;
+        generation uses the provider's native async client (ainvoke).
+        With COALESCE_ENABLED, a query identical to one already in flight
+        waits for that one's answer instead of running again.
+        
+        If the LLM has not answered within the latency budget, an
+        extractive answer from the retrieved chunks is returned instead
+        (degraded=True).
+        
+        Args:
+            query: User's question
+            user_data: Optional dictionary with user's mood/food data
+            priority: Scheduler priority class
+            deadline: time.monotonic() by which the answer is needed
+            latency_budget: Seconds (default LLM_LATENCY_BUDGET_SECONDS)
+            
+        Returns:
+            InsightResult with the answer, sources and per-stage timings
+            
+        Raises:
+            QueueFullError: Too many queries are waiting
+            DeadlineExceededError: The deadline passed first
+        """
+        fallback_at = self._fallback_at(latency_budget)
+        timeout = None if deadline is None else deadline - time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                return await self._coalesced_query(
+                    query, user_data, priority, deadline, fallback_at, latency_budget
+                )
+        except TimeoutError:
+            # Waiting or generation ran past the deadline and was cancelled
+            metrics.record_error("query")
+            raise DeadlineExceededError()
+    
+    async def _coalesced_query(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        priority: str,
+        deadline: Optional[float],
+        fallback_at: Optional[float],
+        latency_budget: Optional[float]
+    ) -> InsightResult:
+        """Run the query, or join an identical one in flight"""
+        if not settings.COALESCE_ENABLED:
+            return await self._aquery(query, user_data, priority, deadline, fallback_at)
+        
+        timer = StageTimer("query")
+        with timer.stage("coalesced_wait"):
+            result, joined = await self.query_flights.run(
+                self._flight_key(query, user_data, priority, latency_budget),
+                lambda: self._aquery(query, user_data, priority, deadline, fallback_at)
+            )
+        
+        if not joined:
+            return result
+        
+        # This request rode on another one's computation
+        metrics.record_coalesced("query")
+        logger.info("✅ Joined an identical query in flight")
+        return replace(
+            result,
+            timings=timer.finish(status=result.status),
+            coalesced=True
+        )
+    
+    async def _aquery(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        fallback_at: Optional[float] = None
+    ) -> InsightResult:
+        """Run the whole pipeline for one query, profiled if armed"""
+        profile = self.profiler.claim(query)
+        if profile is None:
+            return await self._run_query(
+                query, user_data, priority, deadline, fallback_at, StageTimer("query")
+            )
+        
+        timer = StageTimer("query", profile=profile)
+        status = "cancelled"
+        try:
+            result = await self._run_query(
+                query, user_data, priority, deadline, fallback_at, timer
+            )
+            status = result.status
+            return result
+        finally:
+            # Joining the sampler and writing the files blocks; keep it off the loop
+            await asyncio.to_thread(profile.finish, status, timer.timings)
+    
+    async def _run_query(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        priority: str,
+        deadline: Optional[float],
+        fallback_at: Optional[float],
+        timer: StageTimer
+    ) -> InsightResult:
+        """Embed, retrieve, prompt and generate, timing each stage"""
+        logger.info(f"Processing query: {query[:50]}...")
+        
+        async with self._query_slot("query", timer, priority, deadline):
+            try:
+                with timer.stage("prompt"):
+                    enhanced_query = self._search_query(query, user_data)
+                    context_key = self._context_key(user_data)
+                    corpus_version = self.corpus_version
+                
+                with timer.stage("embed"):
+                    query_vector, search_vector = await self._aembed_query_pair(
+                        query, enhanced_query
+                    )
+                
+                with timer.stage("cache_lookup"):
+                    cached = self._cache_lookup(query_vector, context_key)
+                
+                if cached is not None:
+                    logger.info("✅ Answer cache hit")
+                    return InsightResult(
+                        response=cached.response,
+                        sources=cached.sources,
+                        timings=timer.finish(),
+                        cached=True
+                    )
+                
+                with timer.stage("retrieve"):
+                    docs = await self._run_blocking(self._search, search_vector, query)
+                
+                with timer.stage("prompt"):
+                    prompt = self._build_prompt(docs, query, user_data)
+                
+                with timer.stage("generate"):
+                    generation = asyncio.ensure_future(self.llm.ainvoke(prompt))
+                    if fallback_at is not None:
+                        await self._wait_until(generation, fallback_at)
+                
+                if fallback_at is not None and not generation.done():
+                    def finish(output: Any):
+                        response = self._chunk_text(output)
+                        metrics.record_tokens("query", prompt, response)
+                        self._cache_store(query_vector, context_key, response, docs, corpus_version)
+                    
+                    self._complete_in_background(generation, finish)
+                    return self._degraded_result("query", query, docs, timer)
+                
+                with timer.stage("generate"):
+                    output = await generation
+                
+                with timer.stage("postprocess"):
+                    response = self._chunk_text(output)
+                    metrics.record_tokens("query", prompt, response)
+                    self._cache_store(query_vector, context_key, response, docs, corpus_version)
+                    sources = self._format_sources(docs)
+                
+                logger.info("✅ Query processed successfully")
+                return InsightResult(
+                    response=response,
+                    sources=sources,
+                    documents=docs,
+                    timings=timer.finish()
+                )
+                
+            except Exception as e:
+                logger.error(f"Error processing query: {e}", exc_info=True)
+                metrics.record_error("query")
+                return InsightResult(
+                    response=ERROR_RESPONSE,
+                    status="error",
+                    timings=timer.finish(status="error")
+                )
+    
+    async def stream_insights(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]] = None,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        latency_budget: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream AI-generated insights token by token.
+        
+        Retrieval runs first so the sources can be sent before generation
+        starts. Closing the generator stops the underlying LLM stream.
+        A cached answer is sent as a single token.
+
+        With COALESCE_ENABLED, identical streams in flight share one
+        generation; a subscriber that joins late first receives the events
+        already sent.
+        
+        If the queue is full or the deadline passes (while waiting or
+        generating), the stream ends with an error event. If no token
+        arrives within the latency budget, an extractive answer is sent as
+        a single token and the done event has "degraded": true.
+        
+        Args:
+            query: User's question
+            user_data: Optional dictionary with user's mood/food data
+            priority: Scheduler priority class
+            deadline: time.monotonic() by which the answer is needed
+            latency_budget: Seconds (default LLM_LATENCY_BUDGET_SECONDS)
+        
+        Yields:
+            Event dicts with "event" ("sources", "token", "done" or "error")
+            and "data" keys
+        """
+        fallback_at = self._fallback_at(latency_budget)
+        if not settings.COALESCE_ENABLED:
+            async for event in self._stream_insights(
+                query, user_data, priority, deadline, fallback_at
+            ):
+                yield event
+            return
+        
+        events, joined = self.stream_flights.subscribe(
+            self._flight_key(query, user_data, priority, latency_budget),
+            lambda: self._stream_insights(query, user_data, priority, deadline, fallback_at),
+            deadline=deadline
+        )
+        timer = StageTimer("stream")
+        try:
+            if not joined:
+                async for event in events:
+                    yield event
+                return
+            
+            metrics.record_coalesced("stream")
+            logger.info("✅ Joined an identical stream in flight")
+            token_seen = False
+            async for event in events:
+                if event["event"] == "token" and not token_seen:
+                    timer.mark("first_token")
+                    token_seen = True
+                elif event["event"] == "done":
+                    event = {
+                        "event": "done",
+                        "data": {**event["data"], "coalesced": True, "timings_ms": timer.finish()}
+                    }
+                elif event["event"] == "error":
+                    timer.finish(status="error")
+                yield event
+        except TimeoutError:
+            # This subscriber's own deadline passed; the shared stream goes on
+            error = DeadlineExceededError("Request deadline exceeded during generation")
+            logger.warning(f"Stopped stream: {error}")
+            metrics.record_error("stream")
+            timer.finish(status="error")
+            yield {"event": "error", "data": str(error)}
+        finally:
+            await events.aclose()
+    
+    async def _stream_insights(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        fallback_at: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the whole pipeline for one query, yielding stream events"""
+        logger.info(f"Streaming query: {query[:50]}...")
+        timer = StageTimer("stream")
+        
+        try:
+            async with self._query_slot("stream", timer, priority, deadline):
+                async for event in self._stream_pipeline(
+                    query, user_data, timer, deadline, fallback_at
+                ):
+                    yield event
+        except (QueueFullError, DeadlineExceededError) as e:
+            logger.warning(f"Stream not started: {e}")
+            metrics.record_error("stream")
+            timer.finish(status="error")
+            yield {"event": "error", "data": str(e)}
+    
+    async def _stream_pipeline(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        timer: StageTimer,
+        deadline: Optional[float],
+        fallback_at: Optional[float]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream events for one query while holding a query slot"""
+        try:
+            with timer.stage("prompt"):
+                enhanced_query = self._search_query(query, user_data)
+                context_key = self._context_key(user_data)
+                corpus_version = self.corpus_version
+            
+            with timer.stage("embed"):
+                query_vector, search_vector = await self._aembed_query_pair(
+                    query, enhanced_query
+                )
+            
+            with timer.stage("cache_lookup"):
+                cached = self._cache_lookup(query_vector, context_key)
+            
+            if cached is not None:
+                logger.info("✅ Answer cache hit")
+                yield {"event": "sources", "data": cached.sources}
+                timer.mark("first_token")
+                yield {"event": "token", "data": cached.response}
+                yield {
+                    "event": "done",
+                    "data": {"tokens": 1, "cached": True, "timings_ms": timer.finish()}
+                }
+                return
+            
+            # Retrieve first so sources reach the client before any token
+            with timer.stage("retrieve"):
+                docs = await self._run_blocking(self._search, search_vector, query)
+            yield {"event": "sources", "data": self._format_sources(docs)}
+            
+            with timer.stage("prompt"):
+                prompt = self._build_prompt(docs, query, user_data)
+            
+            stream = self.llm.astream(prompt)
+            first_chunk = asyncio.ensure_future(anext(stream, None))
+            handed_off = False
+            try:
+                if fallback_at is not None:
+                    await self._wait_until(first_chunk, fallback_at)
+                
+                if fallback_at is not None and not first_chunk.done():
+                    def finish(response: str):
+                        metrics.record_tokens("stream", prompt, response)
+                        self._cache_store(query_vector, context_key, response, docs, corpus_version)
+                    
+                    if self._can_complete_in_background():
+                        handed_off = True
+                        self._complete_in_background(
+                            asyncio.ensure_future(self._drain_stream(first_chunk, stream)),
+                            finish
+                        )
+                    timer.mark("first_token")
+                    result = self._degraded_result("stream", query, docs, timer)
+                    yield {"event": "token", "data": result.response}
+                    yield {
+                        "event": "done",
+                        "data": {
+                            "tokens": 1,
+                            "cached": False,
+                            "degraded": True,
+                            "timings_ms": result.timings
+                        }
+                    }
+                    return
+                
+                tokens = []
+                chunk = await first_chunk
+                while chunk is not None:
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise DeadlineExceededError("Request deadline exceeded during generation")
+                    token = self._chunk_text(chunk)
+                    if token:
+                        if not tokens:
+                            timer.mark("first_token")
+                        tokens.append(token)
+                        yield {"event": "token", "data": token}
+                    chunk = await anext(stream, None)
+            finally:
+                if not handed_off:
+                    await self._close_stream(first_chunk, stream)
+            
+            response = "".join(tokens)
+            metrics.record_tokens("stream", prompt, response)
+            
+            # Only complete generations are cached
+            self._cache_store(query_vector, context_key, response, docs, corpus_version)
+            
+            logger.info(f"✅ Streamed {len(tokens)} tokens")
+            yield {
+                "event": "done",
+                "data": {"tokens": len(tokens), "cached": False, "timings_ms": timer.finish()}
+            }
+            
+        except DeadlineExceededError as e:
+            logger.warning(f"Stopped stream: {e}")
+            metrics.record_error("stream")
+            timer.finish(status="error")
+            yield {"event": "error", "data": str(e)}
+            
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}", exc_info=True)
+            metrics.record_error("stream")
+            timer.finish(status="error")
+            yield {"event": "error", "data": ERROR_RESPONSE}
+    
+    async def batch_insights(
+        self,
+        items: List[Tuple[str, Optional[Dict[str, Any]]]],
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[int, InsightResult]]:
+        """
+        Answer many queries with shared embedding and retrieval.
+        
+        All queries are embedded in one batched pass and searched with one
+        retriever call; only generation runs per query, at most
+        BATCH_LLM_CONCURRENCY at a time (each also holds a query slot, at
+        "batch" priority). Closing the generator cancels the generations
+        still running; queries not answered by the deadline fail.
+        
+        Args:
+            items: (query, user_data) pairs
+            deadline: time.monotonic() by which the whole batch is needed
+            
+        Yields:
+            (index into items, InsightResult) as each answer finishes;
+            cache hits come first
+        """
+        logger.info(f"Processing batch of {len(items)} queries...")
+        timers = [StageTimer("batch") for _ in items]
+        shared = StageTimer()
+        answered = set()
+        
+        try:
+            with shared.stage("prompt"):
+                queries = [query for query, _ in items]
+                enhanced_queries = [
+                    self._search_query(query, user_data) for query, user_data in items
+                ]
+                context_keys = [self._context_key(user_data) for _, user_data in items]
+                corpus_version = self.corpus_version
+            
+            with shared.stage("embed"):
+                texts = list(dict.fromkeys(queries + enhanced_queries))
+                vectors = dict(zip(
+                    texts,
+                    await self._run_blocking(self.embeddings.embed_documents, texts)
+                ))
+            
+            hits = {}
+            misses = []
+            with shared.stage("cache_lookup"):
+                for index, query in enumerate(queries):
+                    cached = self._cache_lookup(vectors[query], context_keys[index])
+                    if cached is None:
+                        misses.append(index)
+                    else:
+                        hits[index] = cached
+            
+            for index, cached in hits.items():
+                self._record_shared(timers[index], shared)
+                answered.add(index)
+                yield index, InsightResult(
+                    response=cached.response,
+                    sources=cached.sources,
+                    timings=timers[index].finish(),
+                    cached=True
+                )
+            
+            with shared.stage("retrieve"):
+                results = await self._run_blocking(
+                    self.retriever.search_by_vectors,
+                    [vectors[enhanced_queries[index]] for index in misses],
+                    queries=[queries[index] for index in misses]
+                )
+            
+        except Exception as e:
+            logger.error(f"Error processing batch: {e}", exc_info=True)
+            for index in range(len(items)):
+                if index in answered:
+                    continue
+                metrics.record_error("batch")
+                yield index, InsightResult(
+                    response=ERROR_RESPONSE,
+                    status="error",
+                    timings=timers[index].finish(status="error")
+                )
+            return
+        
+        llm_slots = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+        
+        async def generate(index: int, docs: List[Any]) -> Tuple[int, InsightResult]:
+            timer = timers[index]
+            self._record_shared(timer, shared)
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                async with asyncio.timeout(timeout), llm_slots, \
+                        self._query_slot("batch", timer, "batch", deadline):
+                    with timer.stage("prompt"):
+                        prompt = self._build_prompt(docs, *items[index])
+                    
+                    with timer.stage("generate"):
+                        response = self._chunk_text(await self.llm.ainvoke(prompt))
+                    metrics.record_tokens("batch", prompt, response)
+                    
+                    self._cache_store(
+                        vectors[queries[index]], context_keys[index], response, docs, corpus_version
+                    )
+                    return index, InsightResult(
+                        response=response,
+                        sources=self._format_sources(docs),
+                        documents=docs,
+                        timings=timer.finish()
+                    )
+            
+            except (TimeoutError, QueueFullError, DeadlineExceededError) as e:
+                logger.warning(f"Batch query {index} not answered: {e or 'deadline exceeded'}")
+                metrics.record_error("batch")
+                return index, InsightResult(
+                    response=ERROR_RESPONSE,
+                    status="error",
+                    timings=timer.finish(status="error")
+                )
+            
+            except Exception as e:
+                logger.error(f"Error processing batch query {index}: {e}", exc_info=True)
+                metrics.record_error("batch")
+                return index, InsightResult(
+                    response=ERROR_RESPONSE,
+                    status="error",
+                    timings=timer.finish(status="error")
+                )
+        
+        tasks = [
+            asyncio.create_task(generate(index, docs))
+            for index, docs in zip(misses, results)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        logger.info(f"✅ Batch of {len(items)} queries processed")
+    
+    @staticmethod
+    def _record_shared(timer: StageTimer, shared: StageTimer):
+        """Charge the batch-wide stages to one query's timer"""
+        for stage, milliseconds in shared.timings.items():
+            if stage != "total":
+                timer.record(stage, milliseconds / 1000.0)
+    
+    @asynccontextmanager
+    async def _query_slot(
+        self,
+        endpoint: str,
+        timer: StageTimer,
+        priority: str = "interactive",
+        deadline: Optional[float] = None
+    ):
+        """
+        Wait for one of the MAX_CONCURRENT_QUERIES slots, tracking it in metrics.
+        
+        Raises:
+            QueueFullError: Too many queries are waiting
+            DeadlineExceededError: The deadline passed while waiting
+        """
+        with metrics.track_in_flight(metrics.IN_FLIGHT, endpoint=endpoint):
+            async with self.scheduler.slot(priority, deadline):
+                timer.mark("queue_wait")
+                with metrics.track_in_flight(metrics.QUERY_SLOTS_IN_USE):
+                    yield
+    
+    @staticmethod
+    def _latency_budget(latency_budget: Optional[float]) -> float:
+        """Seconds the LLM gets before the extractive fallback; 0 = no fallback"""
+        if latency_budget is None:
+            latency_budget = settings.LLM_LATENCY_BUDGET_SECONDS
+        return max(latency_budget, 0.0)
+    
+    @classmethod
+    def _fallback_at(cls, latency_budget: Optional[float]) -> Optional[float]:
+        """time.monotonic() after which to fall back to an extractive answer"""
+        budget = cls._latency_budget(latency_budget)
+        if budget <= 0:
+            return None
+        return time.monotonic() + budget
+    
+    @staticmethod
+    async def _wait_until(task: "asyncio.Future[Any]", fallback_at: float):
+        """Wait for task until fallback_at; cancels it if the caller is cancelled"""
+        try:
+            await asyncio.wait({task}, timeout=max(fallback_at - time.monotonic(), 0.0))
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+    
+    def _degraded_result(
+        self,
+        endpoint: str,
+        query: str,
+        docs: List[Any],
+        timer: StageTimer
+    ) -> InsightResult:
+        """Extractive answer from the retrieved chunks"""
+        logger.warning("LLM missed the latency budget, returning an extractive answer")
+        metrics.record_degraded(endpoint)
+        with timer.stage("extract"):
+            response = extractive_answer(query, docs, settings.FALLBACK_SENTENCES)
+        return InsightResult(
+            response=response,
+            sources=self._format_sources(docs),
+            documents=docs,
+            timings=timer.finish(status="degraded"),
+            degraded=True
+        )
+    
+    def _can_complete_in_background(self) -> bool:
+        return (
+            settings.FALLBACK_COMPLETE_IN_BACKGROUND
+            and len(self.background_generations) < settings.FALLBACK_MAX_BACKGROUND
+        )
+    
+    def _complete_in_background(self, task: "asyncio.Task[Any]", on_result: Callable[[Any], None]):
+        """
+        Let a generation whose answer was replaced by an extractive one
+        finish (to fill the answer cache), or cancel it if that is off or
+        FALLBACK_MAX_BACKGROUND generations are already running.
+        """
+        if task not in self.background_generations and not self._can_complete_in_background():
+            task.cancel()
+            return
+        
+        def done(task: "asyncio.Task[Any]"):
+            self.background_generations.discard(task)
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                logger.warning(f"Background generation failed: {task.exception()}")
+                return
+            on_result(task.result())
+        
+        self.background_generations.add(task)
+        task.add_done_callback(done)
+    
+    async def _drain_stream(
+        self,
+        first_chunk: "asyncio.Future[Any]",
+        stream: AsyncIterator[Any]
+    ) -> str:
+        """Read the rest of an LLM stream; returns the full text"""
+        tokens = []
+        try:
+            chunk = await first_chunk
+            while chunk is not None:
+                tokens.append(self._chunk_text(chunk))
+                chunk = await anext(stream, None)
+        finally:
+            await stream.aclose()
+        return "".join(tokens)
+    
+    @staticmethod
+    async def _close_stream(first_chunk: "asyncio.Future[Any]", stream: AsyncIterator[Any]):
+        """Stop an LLM stream, including a first read still pending"""
+        if not first_chunk.done():
+            first_chunk.cancel()
+            # The generator is still running until the cancelled read returns
+            await asyncio.wait({first_chunk})
+        await stream.aclose()
+    
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking call in the RAG thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(func, *args, **kwargs)
+        )
+    
+    def _embed_query_pair(self, query: str, enhanced_query: str):
+        """
+        Embed the raw question (answer cache key) and the enhanced query (search).
+        
+        Without user context both are the same text and embedded once.
+        
+        Returns:
+            (query_vector, search_vector) tuple
+        """
+        if enhanced_query == query:
+            vector = self.embeddings.embed_query(query)
+            return vector, vector
+        
+        query_vector, search_vector = self.embeddings.embed_documents([query, enhanced_query])
+        return query_vector, search_vector
+    
+    async def _aembed_query_pair(self, query: str, enhanced_query: str):
+        """Async version of _embed_query_pair"""
+        if not isinstance(self.embeddings, BatchedEmbeddings):
+            return await self._run_blocking(self._embed_query_pair, query, enhanced_query)
+        
+        # Wait on the batcher directly instead of holding a pool thread
+        if enhanced_query == query:
+            vector = await self.embeddings.aembed_query(query)
+            return vector, vector
+        
+        query_vector, search_vector = await self.embeddings.aembed_documents([query, enhanced_query])
+        return query_vector, search_vector
+    
+    def _search(self, embedding: List[float], query: str) -> List[Any]:
+        """Search with an already computed query embedding (and the raw query for keywords)"""
+        return self.retriever.search_by_vector(embedding, query=query)
+    
+    def _flight_key(
+        self,
+        query: str,
+        user_data: Optional[Dict[str, Any]],
+        priority: str,
+        latency_budget: Optional[float]
+    ) -> str:
+        """
+        Coalescing key: the question together with the user's context.
+        
+        Requests only share a computation with the same priority class
+        (so an interactive one never waits behind a background slot) and
+        the same latency budget (so one without a budget never gets an
+        extractive answer).
+        """
+        budget = self._latency_budget(latency_budget)
+        return f"{priority}:{budget:g}:{flight_key(self._build_enhanced_query(query, user_data))}"
+    
+    def _context_key(self, user_data: Optional[Dict[str, Any]]) -> str:
+        """Answer cache fingerprint of the formatted user context"""
+        return SemanticCache.fingerprint(self._format_user_context(user_data))
+    
+    def _cache_lookup(self, query_vector: List[float], context_key: str):
+        """Look up a cached answer for the current corpus version"""
+        if self.answer_cache is None:
+            return None
+        
+        self.answer_cache.sync_corpus_version(self.corpus_version)
+        entry = self.answer_cache.lookup(query_vector, context_key)
+        metrics.record_cache_lookup(entry is not None)
+        return entry
+    
+    def _cache_store(
+        self,
+        query_vector: List[float],
+        context_key: str,
+        response: str,
+        docs: List[Any],
+        corpus_version: str
+    ):
+        """Cache a generated answer, unless the corpus changed since the query started"""
+        if self.answer_cache is None or not response.strip():
+            return
+        
+        self.answer_cache.store(
+            query_vector,
+            context_key,
+            response,
+            self._format_sources(docs),
+            corpus_version=corpus_version
+        )
+    
+    def _build_prompt(
+        self,
+        docs: List[Any],
+        query: str,
+        user_data: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Fill the prompt template with retrieved context, user data and the question.
+        
+        The classic layout folds the user data into the question. The
+        prefix_cache layout keeps the order instructions -> research context
+        -> user data -> question, so requests share the longest possible
+        prefix.
+        """
+        fields = self._prompt_fields(query, user_data)
+        return self.prompt.format(
+            context=self._format_context(docs, fields),
+            **fields
+        )
+    
+    def _prompt_fields(self, query: str, user_data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Template variables other than the research context"""
+        if settings.PROMPT_LAYOUT == "classic":
+            return {"question": self._build_enhanced_query(query, user_data)}
+        
+        user_context = self._format_user_context(user_data)
+        return {
+            "user_context": f"\nUser's personal context:\n{user_context}\n" if user_context else "",
+            "question": query,
+        }
+    
+    def _format_context(self, docs: List[Any], fields: Optional[Dict[str, str]] = None) -> str:
+        """
+        Assemble the research context for the prompt.
+        
+        With CONTEXT_PACKING_ENABLED, overlapping chunks are merged and the
+        context is packed into what is left of the LLM context window after
+        the template, the question and the answer reserve. Otherwise the
+        documents are joined the same way the "stuff" chain does.
+        """
+        # Document order makes the context text depend only on which chunks
+        # were retrieved, not their ranks, so more prompts share a prefix
+        stable_order = settings.PROMPT_LAYOUT == "prefix_cache"
+        
+        if not settings.CONTEXT_PACKING_ENABLED:
+            if stable_order:
+                docs = sorted(
+                    docs,
+                    key=lambda doc: document_order_key(
+                        ((doc.metadata or {}).get('source'), (doc.metadata or {}).get('page')),
+                        doc.page_content
+                    )
+                )
+            return "\n\n".join(doc.page_content for doc in docs)
+        
+        return pack_context(
+            docs,
+            max_tokens=self._context_budget(fields or {}),
+            max_overlap=settings.CHUNK_OVERLAP,
+            stable_order=stable_order
+        )
+    
+    def _context_budget(self, fields: Dict[str, str]) -> int:
+        """Tokens available for retrieved context in one prompt"""
+        fixed_fields = {name: fields.get(name, "") for name in self.prompt.input_variables}
+        fixed_fields["context"] = ""
+        fixed = estimate_tokens(self.prompt.format(**fixed_fields))
+        budget = settings.LLM_NUM_CTX - settings.LLM_ANSWER_RESERVE_TOKENS - fixed
+        if settings.CONTEXT_MAX_TOKENS > 0:
+            budget = min(budget, settings.CONTEXT_MAX_TOKENS)
+        return max(budget, 0)
+    
+    def _format_sources(self, docs: List[Any]) -> List[Dict[str, Any]]:
+        """Extract source metadata from retrieved documents"""
+        sources = []
+        for doc in docs:
+            metadata = doc.metadata or {}
+            sources.append({
+                "source": os.path.basename(str(metadata.get('source', 'unknown'))),
+                "page": metadata.get('page'),
+                "chunk_id": getattr(doc, 'id', None)
+            })
+        return sources
+    
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Get the text of a streamed chunk (str for LLMs, message chunk for chat models)"""
+        if isinstance(chunk, str):
+            return chunk
+        return getattr(chunk, 'content', '') or ''
+    
+    def _search_query(self, query: str, user_data: Optional[Dict[str, Any]]) -> str:
+        """Text embedded for retrieval: the enhanced query, or the bare question"""
+        if settings.RETRIEVE_WITH_USER_CONTEXT:
+            return self._build_enhanced_query(query, user_data)
+        return query
     
     def _build_enhanced_query(self, query: str, user_data: Optional[Dict[str, Any]]) -> str:
         """
@@ -229,8 +1416,30 @@ Answer (be concise, helpful, and cite research insights):"""
         Returns:
             Enhanced query string
         """
+        user_context = self._format_user_context(user_data)
+        
+        # Build enhanced query
+        if user_context:
+            enhanced_query = f"""User's personal context:
+{user_context}
+
+User's question: {query}"""
+            return enhanced_query
+        
+        return query
+    
+    def _format_user_context(self, user_data: Optional[Dict[str, Any]]) -> str:
+        """
+        Format the user's mood/food data as prompt context.
+        
+        Args:
+            user_data: Optional user context data
+            
+        Returns:
+            Context lines, or an empty string if there is nothing to add
+        """
         if not user_data:
-            return query
+            return ""
         
         context_parts = []
         
@@ -246,16 +1455,13 @@ Answer (be concise, helpful, and cite research insights):"""
             if isinstance(foods, list) and len(foods) > 0:
                 context_parts.append(f"Recent foods: {self._format_food_data(foods)}")
         
-        # Build enhanced query
-        if context_parts:
-            user_context = "\n".join(context_parts)
-            enhanced_query = f"""User's personal context:
-{user_context}
-
-User's question: {query}"""
-            return enhanced_query
+        # Add precomputed trends and food-mood correlations
+        if self.analytics is not None and user_data.get('user_id'):
+            summary = self.analytics.summary(user_data['user_id'])
+            if summary is not None and summary.text:
+                context_parts.append(summary.text)
         
-        return query
+        return "\n".join(context_parts)
     
     def _format_mood_data(self, moods: list) -> str:
         """Format mood data for context"""
@@ -281,11 +1487,77 @@ User's question: {query}"""
         except Exception:
             return "N/A"
     
-    def get_document_count(self) -> int:
-        """Get the number of documents in the vectorstore"""
+    def warm_up(self):
+        """
+        Run a dummy query through the slow-to-start components.
+        
+        Loads the embedding model weights, the vector index and the LLM
+        (a one-token generation), so the first real query is not cold.
+        """
+        logger.info("Warming up RAG System...")
+        
+        vector = self.embeddings.embed_query("warm up")
+        self._search(vector, "warm up")
+        
+        # Each provider directly, with its own token limit: the router would
+        # send one provider's kwargs to the others, and skip hedge targets
+        for provider, llm in self._llm_routes():
+            try:
+                llm.invoke("Hi", **ONE_TOKEN_KWARGS.get(provider, DEFAULT_ONE_TOKEN_KWARGS))
+            except Exception as e:
+                # The LLM may come up later; queries will retry it
+                logger.warning(f"LLM warm-up failed ({provider}): {e}")
+        
+        logger.info("✅ Warm-up complete")
+    
+    def _llm_routes(self) -> List[Tuple[str, Any]]:
+        """(provider, client) for every LLM provider in use"""
+        if hasattr(self.llm, "providers"):
+            return list(zip(self.llm.names, self.llm.providers))
+        return [(settings.llm_providers[0], self.llm)]
+    
+    def _refresh_document_count(self):
+        """Cache the vectorstore size so health probes don't query Chroma"""
         try:
-            return self.vectorstore._collection.count()
+            self._document_count = self.vectorstore._collection.count()
         except Exception:
-            return 0
-
-
+            self._document_count = 0
+    
+    def get_document_count(self) -> int:
+        """Get the number of documents in the vectorstore (cached)"""
+        return self._document_count
+    
+    def get_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Get answer cache counters, or None if the cache is disabled"""
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.stats()
+    
+    def keep_warm(self):
+        """Keep the LLM loaded on the server(s) between bursts of traffic"""
+        keep_warm = getattr(self.llm, 'keep_warm', None)
+        if callable(keep_warm):
+            keep_warm()
+    
+    def get_llm_stats(self) -> Optional[List[Dict[str, Any]]]:
+        """Load and health of each Ollama server, or None for other providers"""
+        stats = getattr(self.llm, 'stats', None)
+        return stats() if callable(stats) else None
+    
+    def get_llm_router_stats(self) -> Optional[Dict[str, Any]]:
+        """Hedging, failover and circuit state, or None with a single provider"""
+        router_stats = getattr(self.llm, 'router_stats', None)
+        return router_stats() if callable(router_stats) else None
+    
+    def shutdown(self):
+        """Release worker threads and LLM connections"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for task in list(self.background_generations):
+            task.cancel()
+        if isinstance(self.embeddings, BatchedEmbeddings):
+            self.embeddings.close()
+        close = getattr(self.llm, 'close', None)
+        if callable(close):
+            close()
+        if self.analytics is not None:
+            self.analytics.close()
@@ -0,0 +1,119 @@
+"""
+Retrievers used by the QA pipeline
+
+All retrievers follow the LangChain BaseRetriever interface (invoke /
+ainvoke with a query string) and can also search with a query embedding
+that was already computed, so the pipeline embeds each query only once.
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Optional, Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+
+class VectorSearchRetriever(BaseRetriever, ABC):
+    """Base class for retrievers that can search with a precomputed embedding"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embeddings: Embeddings
+    k: int = 3
+
+    @abstractmethod
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Return the k most relevant chunks for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            k: Number of results (defaults to self.k)
+            query: Original query text, for retrievers that also use keywords
+
+        Returns:
+            Documents, most relevant first, with Document.id set to the chunk ID
+        """
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        """
+        Search for several query embeddings at once.
+
+        The default runs search_by_vector per query; backends that can
+        search a batch in one call override this.
+
+        Args:
+            embeddings: Query embeddings
+            k: Number of results per query (defaults to self.k)
+            queries: Original query texts, aligned with embeddings
+
+        Returns:
+            One result list per query, in input order
+        """
+        queries = queries or [None] * len(embeddings)
+        return [
+            self.search_by_vector(embedding, k=k, query=query)
+            for embedding, query in zip(embeddings, queries)
+        ]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.search_by_vector(self.embeddings.embed_query(query), query=query)
+
+
+class ChromaRetriever(VectorSearchRetriever):
+    """Dense similarity search on the Chroma collection"""
+
+    vectorstore: Any
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k=k)[0]
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        if not embeddings:
+            return []
+
+        # Chroma searches all query embeddings in one call
+        result = self.vectorstore._collection.query(
+            query_embeddings=embeddings,
+            n_results=k or self.k,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [
+                Document(page_content=text or "", metadata=metadata or {}, id=chunk_id)
+                for chunk_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            for ids, texts, metadatas in zip(
+                result["ids"],
+                result["documents"],
+                result["metadatas"]
+            )
+        ]
@@ -0,0 +1,209 @@
+"""
+Deadline-aware admission and scheduling of queries
+
+Every query needs one of MAX_CONCURRENT_QUERIES slots before it embeds,
+retrieves and generates. The scheduler hands out those slots:
+
+- by priority class first (interactive chat before batch before
+  background work), then earliest deadline first within a class
+- from a bounded queue: when SCHEDULER_MAX_QUEUE requests are waiting, a
+  new request is rejected (QueueFullError, a 503 with Retry-After), unless
+  it outranks the lowest-priority waiter, which is shed instead
+- only while the request's deadline has not passed: a waiter whose
+  deadline expires leaves the queue with DeadlineExceededError
+- only to requests that are still wanted: a waiter cancelled because its
+  client disconnected is removed from the queue
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, AsyncIterator
+
+import metrics
+
+PRIORITIES: Dict[str, int] = {
+    "interactive": 0,
+    "batch": 1,
+    "background": 2,
+}
+
+
+class QueueFullError(Exception):
+    """The queue is full; the client should retry later"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Server busy, too many queued requests")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """The request's deadline passed before it could finish"""
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message)
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Absolute deadline (time.monotonic) for a timeout; None or <= 0 = none"""
+    if seconds is None or seconds <= 0:
+        return None
+    return time.monotonic() + seconds
+
+
+class _Waiter:
+    """One request waiting for a slot"""
+
+    def __init__(self, priority: str, deadline: Optional[float], sequence: int):
+        self.priority = priority
+        self.deadline = deadline
+        self.future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        # Priority class, then earliest deadline, then arrival order
+        self.key = (
+            PRIORITIES[priority],
+            deadline if deadline is not None else float("inf"),
+            sequence
+        )
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+class QueryScheduler:
+    """Priority/deadline queue in front of a fixed number of query slots"""
+
+    def __init__(self, max_concurrent: int, max_queue: int, retry_after: float = 5.0):
+        """
+        Args:
+            max_concurrent: Queries running at once
+            max_queue: Requests allowed to wait; more are rejected
+            retry_after: Retry-After (seconds) suggested on rejection
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.running = 0
+        self._queue: List[_Waiter] = []  # heap
+        self._sequence = itertools.count()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: str = "interactive",
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[None]:
+        """
+        Hold a query slot for the duration of the block.
+
+        Args:
+            priority: "interactive", "batch" or "background"
+            deadline: time.monotonic() by which the request must be done
+
+        Raises:
+            QueueFullError: Too many requests are waiting
+            DeadlineExceededError: The deadline passed while waiting
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        await self._acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        """Requests waiting (optionally of one priority class)"""
+        return sum(
+            1 for waiter in self._queue
+            if not waiter.future.done() and (priority is None or waiter.priority == priority)
+        )
+
+    def is_full(self, priority: str = "interactive") -> bool:
+        """Whether a new request of this priority would be rejected now"""
+        if self.running < self.max_concurrent and not self.queued():
+            return False
+        if self.queued() < self.max_queue:
+            return False
+        lowest = self._lowest()
+        return lowest is None or PRIORITIES[priority] >= PRIORITIES[lowest.priority]
+
+    async def _acquire(self, priority: str, deadline: Optional[float]):
+        if deadline is not None and deadline <= time.monotonic():
+            self._reject("deadline")
+            raise DeadlineExceededError()
+
+        # Fast path: free slot and nobody ahead
+        if self.running < self.max_concurrent and not self.queued():
+            self.running += 1
+            return
+
+        if self.queued() >= self.max_queue:
+            lowest = self._lowest()
+            if lowest is None or PRIORITIES[priority] >= PRIORITIES[lowest.priority]:
+                self._reject("queue_full")
+                raise QueueFullError(self.retry_after)
+            # Shed the lowest-priority waiter to make room
+            self._reject("shed")
+            lowest.future.set_exception(QueueFullError(self.retry_after))
+
+        waiter = _Waiter(priority, deadline, next(self._sequence))
+        heapq.heappush(self._queue, waiter)
+        self._update_gauges()
+
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        try:
+            # Shield: a timeout must not cancel a slot that was just granted
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                return  # Granted at the last moment; keep it
+            self._reject("deadline")
+            raise DeadlineExceededError()
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if not self._abandon(waiter):
+                self._release()
+            raise
+        finally:
+            self._update_gauges()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Withdraw a waiter. Returns False if it had already been granted a
+        slot (which the caller then owns).
+        """
+        if waiter.future.done() and not waiter.future.cancelled():
+            if waiter.future.exception() is None:
+                return False
+            return True
+        waiter.future.cancel()
+        return True
+
+    def _release(self):
+        """Give the slot to the next live waiter, or free it"""
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(None)
+            self._update_gauges()
+            return
+        self.running -= 1
+        self._update_gauges()
+
+    def _lowest(self) -> Optional[_Waiter]:
+        live = [waiter for waiter in self._queue if not waiter.future.done()]
+        return max(live) if live else None
+
+    def _reject(self, reason: str):
+        metrics.record_scheduler_rejection(reason)
+
+    def _update_gauges(self):
+        # Drop withdrawn waiters from the heap once they reach the top
+        while self._queue and self._queue[0].future.done():
+            heapq.heappop(self._queue)
+        for priority in PRIORITIES:
+            metrics.set_queue_depth(priority, self.queued(priority))
@@ -0,0 +1,178 @@
+"""
+Coalescing of identical in-flight queries
+
+A push notification makes hundreds of clients ask the same question within
+seconds. The answer cache only helps once the first answer is finished;
+until then every request would run its own retrieval and generation.
+Queries are keyed on the normalized enhanced query (question plus the
+formatted user context), and concurrent duplicates attach to the one
+computation already running:
+
+- SingleFlight: awaitable results; every caller gets the same result
+- StreamFlights: event streams; subscribers that join mid-stream first get
+  a replay of the events sent so far, then follow live
+
+The shared work is cancelled only when every caller has gone away.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def flight_key(text: str) -> str:
+    """Case- and whitespace-insensitive key for a query"""
+    return " ".join(text.casefold().split())
+
+
+class _Call:
+    """One running computation and the number of callers waiting on it"""
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one coroutine per key; concurrent callers share its result"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run func, or wait for the call already running under the same key.
+
+        Args:
+            key: Coalescing key (see flight_key)
+            func: Starts the computation when no call is running
+
+        Returns:
+            (result, joined): joined is True if another caller started it
+        """
+        call = self._calls.get(key)
+        joined = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # Shielded: one caller going away must not cancel the others
+            return await asyncio.shield(call.task), joined
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class BroadcastStream:
+    """Fans one async iterator out to any number of subscribers, with replay"""
+
+    def __init__(self, source: AsyncIterator[Any], on_finish: Callable[[], None]):
+        self.events: List[Any] = []
+        self.finished = False
+        self.subscribers = 0
+        self._source = source
+        self._on_finish = on_finish
+        self._changed = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for event in self._source:
+                self.events.append(event)
+                async with self._changed:
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Shared stream failed: {e}", exc_info=True)
+        finally:
+            self.finished = True
+            self._on_finish()
+            # Runs the source's cleanup (stops the LLM stream, frees its slot)
+            await self._source.aclose()
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self, deadline: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        Yield every event of the stream, starting from the first one.
+
+        Closing the last subscription stops the source.
+
+        Args:
+            deadline: time.monotonic() after which this subscriber stops
+                waiting for events (the stream goes on for the others)
+
+        Raises:
+            TimeoutError: The deadline passed while waiting for an event
+        """
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.finished:
+                    return
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+                async with asyncio.timeout(timeout), self._changed:
+                    if index == len(self.events) and not self.finished:
+                        await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self._task.done():
+                self._task.cancel()
+
+
+class StreamFlights:
+    """Shares one event stream per key among concurrent subscribers"""
+
+    def __init__(self):
+        self._streams: Dict[str, BroadcastStream] = {}
+
+    def subscribe(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Any]],
+        deadline: Optional[float] = None
+    ) -> Tuple[AsyncIterator[Any], bool]:
+        """
+        Subscribe to the stream running under key, starting it if needed.
+
+        Args:
+            key: Coalescing key (see flight_key)
+            factory: Creates the source stream when none is running
+            deadline: This subscriber's time.monotonic() deadline, which
+                may be earlier than the one the stream was started with
+
+        Returns:
+            (events, joined): joined is True if the stream was already running
+        """
+        stream = self._streams.get(key)
+        joined = stream is not None
+        if stream is None:
+            stream = BroadcastStream(factory(), on_finish=lambda: self._forget(key, stream))
+            self._streams[key] = stream
+        return stream.subscribe(deadline), joined
+
+    def in_flight(self) -> int:
+        return len(self._streams)
+
+    def _forget(self, key: str, stream: BroadcastStream):
+        if self._streams.get(key) is stream:
+            del self._streams[key]
@@ -0,0 +1,281 @@
+"""
+Read-only, memory-mapped vector snapshot
+
+Every uvicorn worker builds its own RAGSystem, and with Chroma each one
+holds its own copy of the index. A snapshot is a flat export of the Chroma
+collection (vectors, chunk texts, metadata) that workers open with mmap,
+so the OS shares the same physical pages between all of them.
+
+Layout of one snapshot directory:
+
+    header.json         format, corpus version, count, dimension
+    ids.bin             chunk IDs, fixed width (numpy "S" dtype)
+    vectors.f32         count x dim float32 matrix, row-major
+    norms.f32           squared L2 norm of every row
+    texts.bin           UTF-8 chunk texts, concatenated
+    texts.idx           int64 offsets into texts.bin (count + 1)
+    metadata.bin        JSON metadata per chunk, concatenated
+    metadata.idx        int64 offsets into metadata.bin (count + 1)
+
+Snapshots live in versioned subdirectories of the snapshot root; the
+CURRENT file names the active one and is replaced atomically.
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrievers import VectorSearchRetriever
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+EXPORT_PAGE_SIZE = 1000
+
+
+def current_snapshot_dir(root: str) -> Optional[str]:
+    """Directory of the active snapshot, or None if there is none"""
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    path = os.path.join(root, name)
+    return path if os.path.isfile(os.path.join(path, "header.json")) else None
+
+
+def snapshot_version(path: str) -> Optional[str]:
+    """Corpus version a snapshot was exported from"""
+    with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+        return json.load(f).get("version")
+
+
+def export_snapshot(collection, root: str, version: str) -> str:
+    """
+    Export a Chroma collection as a snapshot and make it current.
+
+    Rows are streamed page by page, so the export does not hold the whole
+    collection in memory.
+
+    Args:
+        collection: Chroma collection (vectorstore._collection)
+        root: Snapshot root directory
+        version: Corpus version the collection is at
+
+    Returns:
+        Path of the new snapshot directory
+    """
+    os.makedirs(root, exist_ok=True)
+    final_dir = os.path.join(root, version)
+    tmp_dir = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count = 0
+    dim = 0
+    ids: List[bytes] = []
+    text_offsets = [0]
+    meta_offsets = [0]
+
+    with open(os.path.join(tmp_dir, "vectors.f32"), "wb") as vectors_file, \
+            open(os.path.join(tmp_dir, "norms.f32"), "wb") as norms_file, \
+            open(os.path.join(tmp_dir, "texts.bin"), "wb") as texts_file, \
+            open(os.path.join(tmp_dir, "metadata.bin"), "wb") as meta_file:
+
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=EXPORT_PAGE_SIZE,
+                offset=offset
+            )
+            if not page["ids"]:
+                break
+
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            dim = vectors.shape[1]
+            vectors_file.write(vectors.tobytes())
+            norms_file.write(np.einsum("ij,ij->i", vectors, vectors).astype(np.float32).tobytes())
+
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                ids.append(chunk_id.encode("utf-8"))
+
+                data = (text or "").encode("utf-8")
+                texts_file.write(data)
+                text_offsets.append(text_offsets[-1] + len(data))
+
+                data = json.dumps(metadata or {}).encode("utf-8")
+                meta_file.write(data)
+                meta_offsets.append(meta_offsets[-1] + len(data))
+
+            count += len(page["ids"])
+            offset += len(page["ids"])
+
+    np.asarray(ids, dtype=f"S{max((len(i) for i in ids), default=1)}").tofile(
+        os.path.join(tmp_dir, "ids.bin")
+    )
+    np.asarray(text_offsets, dtype=np.int64).tofile(os.path.join(tmp_dir, "texts.idx"))
+    np.asarray(meta_offsets, dtype=np.int64).tofile(os.path.join(tmp_dir, "metadata.idx"))
+
+    with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "version": version,
+            "count": count,
+            "dim": dim,
+            "id_width": max((len(i) for i in ids), default=1),
+        }, f)
+
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another worker exported the same version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _write_current(root, version)
+    _remove_old_snapshots(root, keep=version)
+
+    logger.info(f"✅ Exported vector snapshot: {count} chunks x {dim} dims")
+    return final_dir
+
+
+def ensure_snapshot(collection, root: str, version: str) -> str:
+    """Return the current snapshot directory, exporting one if it is stale"""
+    path = current_snapshot_dir(root)
+    if path is not None and snapshot_version(path) == version:
+        return path
+
+    logger.info("Vector snapshot missing or stale, exporting from Chroma...")
+    return export_snapshot(collection, root, version)
+
+
+class VectorSnapshot:
+    """A snapshot opened with mmap; safe to share between threads"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format in {path}")
+
+        self.path = path
+        self.version: str = header["version"]
+        self.count: int = header["count"]
+        self.dim: int = header["dim"]
+
+        if self.count == 0:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.norms = np.zeros(0, dtype=np.float32)
+        else:
+            self.vectors = np.memmap(
+                os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                shape=(self.count, self.dim)
+            )
+            self.norms = np.memmap(
+                os.path.join(path, "norms.f32"), dtype=np.float32, mode="r",
+                shape=(self.count,)
+            )
+
+        self.ids = self._map(path, "ids.bin", f"S{header['id_width']}")
+        self.texts = self._map(path, "texts.bin", np.uint8)
+        self.text_offsets = self._map(path, "texts.idx", np.int64)
+        self.metadata = self._map(path, "metadata.bin", np.uint8)
+        self.metadata_offsets = self._map(path, "metadata.idx", np.int64)
+
+    @staticmethod
+    def _map(path: str, name: str, dtype) -> np.ndarray:
+        file_path = os.path.join(path, name)
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r")
+
+    def search(self, embedding: List[float], k: int) -> List[int]:
+        """
+        Exact nearest neighbours by squared L2 distance (Chroma's default).
+
+        Returns:
+            Row numbers, nearest first
+        """
+        return self.search_many([embedding], k)[0]
+
+    def search_many(self, embeddings: List[List[float]], k: int) -> List[List[int]]:
+        """
+        Nearest neighbours for several queries with one matrix product.
+
+        Returns:
+            Row numbers per query, nearest first
+        """
+        if self.count == 0:
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), self.dim)
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2; |q|^2 does not change the order
+        distances = self.norms[None, :] - 2.0 * (queries @ self.vectors.T)
+
+        k = min(k, self.count)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+        return np.take_along_axis(top, order, axis=1).tolist()
+
+    def document(self, row: int) -> Document:
+        """Materialize one chunk as a LangChain Document"""
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        text = self.texts[start:end].tobytes().decode("utf-8")
+
+        start, end = self.metadata_offsets[row], self.metadata_offsets[row + 1]
+        metadata: Dict[str, Any] = json.loads(self.metadata[start:end].tobytes())
+
+        return Document(
+            page_content=text,
+            metadata=metadata,
+            id=self.ids[row].decode("utf-8")
+        )
+
+
+class SnapshotRetriever(VectorSearchRetriever):
+    """Exact NumPy search over a memory-mapped snapshot"""
+
+    snapshot: VectorSnapshot
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k=k)[0]
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        if not embeddings:
+            return []
+        return [
+            [self.snapshot.document(row) for row in rows]
+            for rows in self.snapshot.search_many(embeddings, k or self.k)
+        ]
+
+
+def _write_current(root: str, version: str):
+    tmp_path = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, "CURRENT"))
+
+
+def _remove_old_snapshots(root: str, keep: str):
+    """Best effort; workers still mapping an old snapshot keep their pages"""
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name != keep and not name.startswith(".") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
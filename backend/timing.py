@@ -0,0 +1,57 @@
+"""
+Per-request stage timing for the RAG pipeline
+
+A StageTimer is created for every query and records how long each stage
+(embedding, cache lookup, retrieval, prompt assembly, generation) took.
+Timers created with an endpoint name feed the Prometheus histograms in
+metrics.py when they finish. A timer given a profile (profiling.py) also
+opens a span for every stage.
+"""
+
+from contextlib import contextmanager
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import metrics
+
+
+class StageTimer:
+    """Collects stage durations (milliseconds) for one request"""
+
+    def __init__(self, endpoint: Optional[str] = None, profile: Optional[Any] = None):
+        """
+        Args:
+            endpoint: Metrics label; None to keep the timings out of /metrics
+            profile: profiling.Profile recording this request, if armed
+        """
+        self.endpoint = endpoint
+        self.profile = profile
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block; repeated stages accumulate"""
+        span = self.profile.open_span(name) if self.profile is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+            if span is not None:
+                self.profile.close_span(span)
+
+    def record(self, name: str, seconds: float):
+        """Add a duration measured elsewhere"""
+        self.timings[name] = round(self.timings.get(name, 0.0) + seconds * 1000.0, 3)
+
+    def mark(self, name: str):
+        """Record the time since the request started (e.g. first token)"""
+        self.timings[name] = round((time.perf_counter() - self.started) * 1000.0, 3)
+
+    def finish(self, status: str = "success") -> Dict[str, float]:
+        """Record the total, export the timings to metrics and return them"""
+        self.mark("total")
+        if self.endpoint is not None:
+            metrics.record_timings(self.endpoint, self.timings, status)
+        return self.timings
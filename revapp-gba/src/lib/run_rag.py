@@ -1,19 +1,50 @@
 # src/lib/run_rag.py
-import sys
+"""
+Run RAG queries from the command line.
+
+One query (legacy mode, used by the app):
+
+    python run_rag.py "How does sugar affect my mood?"
+
+Batch mode reads JSONL queries from a file or stdin, one object per line:
+
+    {"id": "q1", "query": "How does sugar affect my mood?", "user_data": {...}}
+
+("id" and "user_data" are optional) and writes one JSONL result per query,
+as each finishes, with its answer, per-stage timings and retrieved chunk IDs:
+
+    python run_rag.py --batch questions.jsonl --parallel 4 > results.jsonl
+    cat questions.jsonl | python run_rag.py --batch - --no-cache
+    python run_rag.py --batch questions.jsonl --backend-url http://localhost:8000
+
+Locally the backend pipeline (embedding model, vector store, LLM) is loaded
+once for the whole batch; with --backend-url the queries are sent to a
+running backend's /query endpoint instead.
+"""
+import argparse
+import asyncio
+import json
 import logging
-from rag_model import RAGSystem
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, stream=sys.stderr)
 logger = logging.getLogger(__name__)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Please provide a query")
-        sys.exit(1)
+BACKEND_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "backend"
+)
+
+
+def run_single(query):
+    """Answer one query with the in-app RAG model"""
+    from rag_model import RAGSystem
 
-    query = sys.argv[1]
     logger.info(f"Received query: {query}")
-    
     try:
         rag = RAGSystem()
         response = rag.get_insights(query)
@@ -23,5 +54,185 @@ def main():
         print(f"Error: {str(e)}")
         sys.exit(1)
 
+
+def read_queries(stream):
+    """Parse JSONL query records; invalid lines become error records"""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict) or not isinstance(record.get("query"), str):
+                raise ValueError('expected an object with a "query" string')
+        except ValueError as e:
+            record = {"error": f"line {line_number}: {e}"}
+        record.setdefault("id", line_number)
+        yield record
+
+
+def result_line(record, started, response=None, status="error", sources=None, timings=None,
+                cached=None, error=None):
+    """One JSONL output record"""
+    sources = sources or []
+    return {
+        "id": record["id"],
+        "query": record.get("query"),
+        "status": status,
+        "response": response,
+        "error": error,
+        "chunk_ids": [source.get("chunk_id") for source in sources],
+        "sources": sources,
+        "cached": cached,
+        "timings_ms": timings or {},
+        "wall_ms": round((time.perf_counter() - started) * 1000.0, 2),
+    }
+
+
+class LocalRunner:
+    """Answers queries with one in-process backend RAGSystem"""
+
+    def __init__(self, use_cache):
+        sys.path.insert(0, BACKEND_DIR)
+        from config import settings
+        from rag_system import RAGSystem
+
+        if not use_cache:
+            settings.CACHE_ENABLED = False
+        # Every query of the batch waits for a slot instead of being rejected
+        settings.SCHEDULER_MAX_QUEUE = sys.maxsize
+        self.rag = RAGSystem()
+
+    async def answer(self, record):
+        started = time.perf_counter()
+        result = await self.rag.aquery(record["query"], record.get("user_data"), priority="batch")
+        return result_line(
+            record, started,
+            response=result.response,
+            status=result.status,
+            sources=result.sources,
+            timings=result.timings,
+            cached=result.cached
+        )
+
+    def close(self):
+        self.rag.shutdown()
+
+
+class RemoteRunner:
+    """Sends queries to a running backend's /query endpoint"""
+
+    def __init__(self, backend_url, timeout):
+        self.url = backend_url.rstrip("/") + "/query"
+        self.timeout = timeout
+
+    def _post(self, record):
+        payload = {"query": record["query"], "priority": "batch"}
+        if record.get("user_data") is not None:
+            payload["user_data"] = record["user_data"]
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    async def answer(self, record):
+        started = time.perf_counter()
+        try:
+            body = await asyncio.to_thread(self._post, record)
+        except urllib.error.HTTPError as e:
+            return result_line(record, started, error=f"HTTP {e.code}: {e.read().decode('utf-8', 'replace')}")
+        except (urllib.error.URLError, OSError) as e:
+            return result_line(record, started, error=str(e))
+        return result_line(
+            record, started,
+            response=body.get("response"),
+            status=body.get("status", "success"),
+            sources=body.get("sources"),
+            timings=body.get("timings_ms"),
+            cached=body.get("cached")
+        )
+
+    def close(self):
+        pass
+
+
+async def run_batch(records, runner, parallel, output):
+    """Answer records with at most `parallel` in flight, writing results as they finish"""
+    slots = asyncio.Semaphore(parallel)
+    counts = {"success": 0, "degraded": 0, "error": 0}
+
+    async def answer(record):
+        if "error" in record:
+            return result_line(record, time.perf_counter(), error=record["error"])
+        async with slots:
+            try:
+                return await runner.answer(record)
+            except Exception as e:
+                logger.error(f"Query {record['id']} failed: {e}", exc_info=True)
+                return result_line(record, time.perf_counter(), error=str(e))
+
+    tasks = [asyncio.create_task(answer(record)) for record in records]
+    for next_done in asyncio.as_completed(tasks):
+        line = await next_done
+        # Degraded (extractive) answers still answered the query
+        if line["error"] or line["status"] == "error":
+            counts["error"] += 1
+        else:
+            counts["degraded" if line["status"] == "degraded" else "success"] += 1
+        output.write(json.dumps(line) + "\n")
+        output.flush()
+
+    logger.info(
+        f"Answered {counts['success']} queries, {counts['degraded']} degraded, {counts['error']} failed"
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run RAG queries")
+    parser.add_argument("query", nargs="?", help="A single query (legacy mode)")
+    parser.add_argument("--batch", metavar="FILE", help="JSONL queries ('-' = stdin)")
+    parser.add_argument("--output", metavar="FILE", help="JSONL results (default: stdout)")
+    parser.add_argument("--parallel", type=int, default=4, help="Queries in flight at once")
+    parser.add_argument("--backend-url", help="Use a running backend instead of loading models")
+    parser.add_argument("--timeout", type=float, default=300.0, help="HTTP timeout per query (--backend-url)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the answer cache (local mode)")
+    args = parser.parse_args()
+
+    if args.batch is None:
+        if not args.query:
+            print("Please provide a query")
+            sys.exit(1)
+        run_single(args.query)
+        return
+
+    if args.batch == "-":
+        records = list(read_queries(sys.stdin))
+    else:
+        with open(args.batch, "r", encoding="utf-8") as f:
+            records = list(read_queries(f))
+    logger.info(f"Loaded {len(records)} queries")
+
+    started = time.perf_counter()
+    if args.backend_url:
+        runner = RemoteRunner(args.backend_url, args.timeout)
+    else:
+        runner = LocalRunner(use_cache=not args.no_cache)
+    logger.info(f"Pipeline ready in {time.perf_counter() - started:.1f}s")
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = asyncio.run(run_batch(records, runner, max(1, args.parallel), output))
+    finally:
+        runner.close()
+        if output is not sys.stdout:
+            output.close()
+
+    sys.exit(1 if counts["error"] else 0)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -79,11 +79,19 @@ INSERT INTO symptoms (name, category, description) VALUES
   ('Restlessness', 'physical', 'Unable to rest or relax')
 ON CONFLICT (name) DO NOTHING;
 
+-- Owner of each log, for per-user analytics (nullable: existing rows have none)
+ALTER TABLE enhanced_mood_assessments ADD COLUMN IF NOT EXISTS user_id UUID;
+ALTER TABLE food_logs ADD COLUMN IF NOT EXISTS user_id UUID;
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_mood_assessments_created_at ON enhanced_mood_assessments(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_food_logs_consumed_at ON food_logs(consumed_at DESC);
 CREATE INDEX IF NOT EXISTS idx_mood_symptoms_mood_id ON mood_symptoms(mood_assessment_id);
 CREATE INDEX IF NOT EXISTS idx_food_logs_food_item_id ON food_logs(food_item_id);
+-- Per-user history and the backend's incremental analytics loads (by created_at)
+CREATE INDEX IF NOT EXISTS idx_mood_assessments_user_created_at ON enhanced_mood_assessments(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_food_logs_user_consumed_at ON food_logs(user_id, consumed_at DESC);
+CREATE INDEX IF NOT EXISTS idx_food_logs_created_at ON food_logs(created_at);
 
 -- Enable Row Level Security (RLS) - Important for multi-user!
 ALTER TABLE moods ENABLE ROW LEVEL SECURITY;
@@ -105,6 +113,11 @@ CREATE POLICY "Public can manage food items" ON food_items FOR ALL USING (true);
 CREATE POLICY "Public can manage food logs" ON food_logs FOR ALL USING (true);
 
 -- Optional: Create a view for easy correlation queries
+-- Same-day join as a timestamp range per user (not created_at::date = ...)
+-- so both branches can use idx_mood_assessments_user_created_at; logs from
+-- before user_id existed (NULL) pair with each other. user_id comes last
+-- because CREATE OR REPLACE VIEW can only append columns. The backend
+-- computes lagged correlations itself (ANALYTICS_DATABASE_URL)
 CREATE OR REPLACE VIEW mood_food_correlation AS
 SELECT 
   fl.consumed_at::date as date,
@@ -113,11 +126,23 @@ SELECT
   ema.overall_mood,
   ema.digestive_comfort,
   ema.mental_clarity,
-  ema.anxiety_level
+  ema.anxiety_level,
+  fl.user_id
 FROM food_logs fl
 JOIN food_items fi ON fl.food_item_id = fi.id
-LEFT JOIN enhanced_mood_assessments ema 
-  ON ema.created_at::date = fl.consumed_at::date
+LEFT JOIN LATERAL (
+  SELECT overall_mood, digestive_comfort, mental_clarity, anxiety_level
+  FROM enhanced_mood_assessments
+  WHERE user_id = fl.user_id
+    AND created_at >= date_trunc('day', fl.consumed_at)
+    AND created_at < date_trunc('day', fl.consumed_at) + INTERVAL '1 day'
+  UNION ALL
+  SELECT overall_mood, digestive_comfort, mental_clarity, anxiety_level
+  FROM enhanced_mood_assessments
+  WHERE fl.user_id IS NULL AND user_id IS NULL
+    AND created_at >= date_trunc('day', fl.consumed_at)
+    AND created_at < date_trunc('day', fl.consumed_at) + INTERVAL '1 day'
+) ema ON true
 ORDER BY fl.consumed_at DESC;
 
 COMMENT ON TABLE moods IS 'Legacy simple mood tracking';